@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограниченная память диалогов для LangGraph агентов
+
+- BoundedMemorySaver: MemorySaver с LRU вытеснением тредов и хранением
+  только последних чекпоинтов каждого треда
+- window_messages / history_update: окно истории для промпта (последние
+  N сообщений, ранние вопросы пользователя сворачиваются в короткую
+  сводку) и обрезка истории в состоянии графа
+- create_checkpointer: выбор бэкенда (память или локальный SQLite)
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, RemoveMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+# Параметры по умолчанию (переопределяются через переменные окружения)
+DEFAULT_MAX_THREADS = int(os.getenv("AGENT_MEMORY_MAX_THREADS", "1000"))
+DEFAULT_MAX_CHECKPOINTS = int(os.getenv("AGENT_MEMORY_MAX_CHECKPOINTS", "10"))
+DEFAULT_MAX_MESSAGES = int(os.getenv("AGENT_MEMORY_MAX_MESSAGES", "20"))
+
+# Сколько ранних вопросов пользователя попадает в сводку
+SUMMARY_QUESTIONS = 5
+SUMMARY_MESSAGE_ID = "history-summary"
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver с ограничением памяти
+
+    Args:
+        max_threads: сколько тредов (диалогов) хранить; давно не
+            использовавшиеся треды удаляются целиком (LRU)
+        max_checkpoints: сколько последних чекпоинтов хранить на тред
+    """
+
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS,
+                 max_checkpoints: int = DEFAULT_MAX_CHECKPOINTS, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.max_checkpoints = max_checkpoints
+        self.evicted_threads = 0
+        self._threads: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                oldest, _ = self._threads.popitem(last=False)
+                super().delete_thread(oldest)
+                self.evicted_threads += 1
+
+            # Чистим с запасом в 2 раза, чтобы не разбирать чекпоинты на каждом шаге
+            if len(self.storage[thread_id][checkpoint_ns]) > 2 * self.max_checkpoints:
+                self._trim_thread(thread_id, checkpoint_ns)
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def _trim_thread(self, thread_id: str, checkpoint_ns: str):
+        """Оставить последние max_checkpoints чекпоинтов и используемые ими значения"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        # id чекпоинтов монотонно возрастают (uuid6)
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.max_checkpoints]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        used = set()
+        for saved in checkpoints.values():
+            checkpoint = self.serde.loads_typed(saved[0])
+            used.update(checkpoint["channel_versions"].items())
+
+        for key in [k for k in self.blobs if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in used:
+                del self.blobs[key]
+
+    def stats(self) -> dict:
+        """Размер памяти: треды, чекпоинты, значения каналов"""
+        with self._lock:
+            return {
+                'threads': len(self._threads),
+                'max_threads': self.max_threads,
+                'checkpoints': sum(len(ns) for t in self.storage.values() for ns in t.values()),
+                'blobs': len(self.blobs),
+                'evicted_threads': self.evicted_threads
+            }
+
+
+def _summary_message(previous: List[str], dropped: Sequence[BaseMessage]) -> SystemMessage:
+    """Короткая сводка выпавшей из окна части диалога (без вызова LLM)"""
+    questions = previous + [
+        f"- {m.content[:200]}" for m in dropped
+        if isinstance(m, HumanMessage) and isinstance(m.content, str)
+    ]
+    content = "Ранее в диалоге пользователь спрашивал:\n" + "\n".join(questions[-SUMMARY_QUESTIONS:])
+    return SystemMessage(content=content, id=SUMMARY_MESSAGE_ID)
+
+
+def window_messages(messages: Sequence[BaseMessage],
+                    max_messages: int = DEFAULT_MAX_MESSAGES) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Окно истории для промпта
+
+    Окно всегда начинается с сообщения пользователя, поэтому пары
+    вызов инструмента / ToolMessage не разрываются. Вопросы из выпавшей
+    части сворачиваются в сводку (SystemMessage в начале окна).
+
+    Returns:
+        (сообщения для LLM, выпавшие из окна сообщения)
+    """
+    messages = list(messages)
+    summary = None
+    if messages and messages[0].id == SUMMARY_MESSAGE_ID:
+        summary, messages = messages[0], messages[1:]
+
+    if len(messages) <= max_messages:
+        return ([summary] if summary else []) + messages, []
+
+    start = len(messages) - max_messages
+    while start < len(messages) and not isinstance(messages[start], HumanMessage):
+        start += 1
+    if start >= len(messages):
+        # В окне нет вопроса пользователя - берём последний вопрос целиком
+        start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+
+    dropped = messages[:start]
+    previous = [line for line in summary.content.splitlines() if line.startswith("- ")] if summary else []
+    return [_summary_message(previous, dropped)] + messages[start:], dropped
+
+
+def history_update(window: List[BaseMessage], dropped: List[BaseMessage], response: BaseMessage) -> List:
+    """
+    Обновление состояния графа после вызова LLM
+
+    Если часть истории выпала из окна, состояние перезаписывается окном
+    (RemoveMessage всех сообщений + окно + ответ), иначе просто
+    добавляется ответ. Так история в чекпоинтах не растёт бесконечно.
+    """
+    if not dropped:
+        return [response]
+    return [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + window + [response]
+
+
+def create_checkpointer(backend: str = None, path: str = None):
+    """
+    Создать checkpointer для графа
+
+    Args:
+        backend: 'memory' (BoundedMemorySaver) или 'sqlite'
+            (по умолчанию AGENT_MEMORY_BACKEND, иначе 'memory')
+        path: файл SQLite (по умолчанию AGENT_MEMORY_PATH или agent_memory.db)
+
+    SQLite бэкенд требует пакет langgraph-checkpoint-sqlite; если он
+    не установлен, используется BoundedMemorySaver.
+    """
+    backend = backend or os.getenv("AGENT_MEMORY_BACKEND", "memory")
+
+    if backend == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError:
+            print("⚠️  langgraph-checkpoint-sqlite не установлен, память агента хранится в процессе")
+        else:
+            path = path or os.getenv("AGENT_MEMORY_PATH", "agent_memory.db")
+            conn = sqlite3.connect(path, check_same_thread=False)
+            return SqliteSaver(conn)
+
+    return BoundedMemorySaver()
@@ -14,8 +14,10 @@ load_dotenv()
 from langchain_core.tools import tool
 from langchain_anthropic import ChatAnthropic
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
+
+from agent_memory import create_checkpointer, window_messages, history_update
 
 from analytics_tools import (
     get_top_tracks_tool,
@@ -30,38 +32,45 @@ from analytics_tools import (
     compare_artists_tool,
     get_viral_tracks_tool,
     get_summary_stats_tool,
-    analyze_monetization_tool
+    analyze_monetization_tool,
+    query_cube_tool
 )
 
 
 # Определяем инструменты как LangChain tools
 @tool
-def get_top_tracks(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_tracks(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ треков по доходу или стримам.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество треков (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue' (доход), 'streams' (стримы), 'avg_rate' (ставка)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ треками
     """
-    return get_top_tracks_tool(limit, sort_by)
+    return get_top_tracks_tool(limit, sort_by, start_month, end_month)
 
 @tool
-def get_top_artists(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_artists(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ артистов по доходу, стримам или количеству треков.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество артистов (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue', 'streams', 'tracks_count', 'avg_rate'
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ артистами
     """
-    return get_top_artists_tool(limit, sort_by)
+    return get_top_artists_tool(limit, sort_by, start_month, end_month)
 
 @tool
 def search_track(query: str) -> str:
@@ -117,32 +126,36 @@ def get_artist_tracks(artist_name: str) -> str:
     return get_artist_tracks_tool(artist_name)
 
 @tool
-def get_platform_stats(platform_name: str = "") -> str:
+def get_platform_stats(platform_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по платформе (Spotify, Apple Music, YouTube и т.д.).
     Если platform_name не указан, вернет статистику по всем платформам.
     
     Args:
         platform_name: название платформы (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по платформе(ам)
     """
-    return get_platform_stats_tool(platform_name)
+    return get_platform_stats_tool(platform_name, start_month, end_month)
 
 @tool
-def get_country_stats(country_name: str = "") -> str:
+def get_country_stats(country_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по стране.
     Если country_name не указан, вернет топ-20 стран.
     
     Args:
         country_name: название страны (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по стране(ам)
     """
-    return get_country_stats_tool(country_name)
+    return get_country_stats_tool(country_name, start_month, end_month)
 
 @tool
 def get_artist_timeline(artist_name: str) -> str:
@@ -197,18 +210,48 @@ def get_summary_stats() -> str:
     return get_summary_stats_tool()
 
 @tool
-def analyze_monetization(artist_name: str = "") -> str:
+def analyze_monetization(artist_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Анализ монетизации: средняя ставка за стрим, доход на трек и т.д.
     Если artist_name не указан, вернет общую статистику монетизации.
     
     Args:
         artist_name: имя артиста (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с анализом монетизации
     """
-    return analyze_monetization_tool(artist_name)
+    return analyze_monetization_tool(artist_name, start_month, end_month)
+
+@tool
+def query_cube(artist: str = "", track: str = "", label: str = "", platform: str = "",
+               country: str = "", subscription: str = "", month: str = "",
+               group_by: str = "", metrics: str = "", limit: int = 20) -> str:
+    """
+    Произвольный срез данных: трек × платформа × страна × тип подписки × месяц.
+    Используй для вопросов с несколькими условиями, например
+    "Yenlik на Spotify в Казахстане по месяцам".
+    
+    Args:
+        artist: фильтр по артисту (часть имени)
+        track: фильтр по треку
+        label: фильтр по лейблу
+        platform: фильтр по платформе (например 'Spotify')
+        country: фильтр по стране (например 'Kazakhstan')
+        subscription: фильтр по типу подписки
+        month: фильтр по месяцу (например '2025/07')
+        group_by: измерения группировки через запятую - track, artist, label,
+            platform, country, subscription, month (пусто - общий итог)
+        metrics: метрики через запятую - streams, revenue, avg_rate (по умолчанию все)
+        limit: максимум строк (по умолчанию 20)
+    
+    Returns:
+        JSON со строками агрегации
+    """
+    return query_cube_tool(artist, track, label, platform, country, subscription,
+                           month, group_by, metrics, limit)
 
 
 # Список всех инструментов
@@ -225,13 +268,18 @@ tools = [
     compare_artists,
     get_viral_tracks,
     get_summary_stats,
-    analyze_monetization
+    analyze_monetization,
+    query_cube
 ]
 
 
 # Состояние агента
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], "The messages in the conversation"]
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+
+
+# Общая память диалогов (ограничена по числу тредов и длине истории)
+checkpointer = create_checkpointer()
 
 
 # Создаем LLM с инструментами
@@ -251,10 +299,10 @@ def create_agent(api_key: str, model: str = "claude-3-5-sonnet-20241022"):
 
 # Узел для вызова агента
 def call_agent(state: AgentState, llm_with_tools):
-    """Вызывает LLM агента"""
-    messages = state["messages"]
-    response = llm_with_tools.invoke(messages)
-    return {"messages": [response]}
+    """Вызывает LLM агента (с окном последних сообщений истории)"""
+    window, dropped = window_messages(state["messages"])
+    response = llm_with_tools.invoke(window)
+    return {"messages": history_update(window, dropped, response)}
 
 
 # Определяем, продолжать ли работу или завершить
@@ -303,9 +351,8 @@ def create_graph(api_key: str):
     # Добавляем ребро от инструментов обратно к агенту
     workflow.add_edge("tools", "agent")
     
-    # Компилируем граф с памятью
-    memory = MemorySaver()
-    app = workflow.compile(checkpointer=memory)
+    # Компилируем граф с общей памятью
+    app = workflow.compile(checkpointer=checkpointer)
     
     return app
 
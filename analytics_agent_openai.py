@@ -30,38 +30,45 @@ from analytics_tools import (
     compare_artists_tool,
     get_viral_tracks_tool,
     get_summary_stats_tool,
-    analyze_monetization_tool
+    analyze_monetization_tool,
+    query_cube_tool
 )
 
 
 # Определяем инструменты как LangChain tools
 @tool
-def get_top_tracks(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_tracks(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ треков по доходу или стримам.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество треков (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue' (доход), 'streams' (стримы), 'avg_rate' (ставка)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ треками
     """
-    return get_top_tracks_tool(limit, sort_by)
+    return get_top_tracks_tool(limit, sort_by, start_month, end_month)
 
 @tool
-def get_top_artists(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_artists(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ артистов по доходу, стримам или количеству треков.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество артистов (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue', 'streams', 'tracks_count', 'avg_rate'
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ артистами
     """
-    return get_top_artists_tool(limit, sort_by)
+    return get_top_artists_tool(limit, sort_by, start_month, end_month)
 
 @tool
 def search_track(query: str) -> str:
@@ -117,32 +124,36 @@ def get_artist_tracks(artist_name: str) -> str:
     return get_artist_tracks_tool(artist_name)
 
 @tool
-def get_platform_stats(platform_name: str = "") -> str:
+def get_platform_stats(platform_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по платформе (Spotify, Apple Music, YouTube и т.д.).
     Если platform_name не указан, вернет статистику по всем платформам.
     
     Args:
         platform_name: название платформы (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по платформе(ам)
     """
-    return get_platform_stats_tool(platform_name)
+    return get_platform_stats_tool(platform_name, start_month, end_month)
 
 @tool
-def get_country_stats(country_name: str = "") -> str:
+def get_country_stats(country_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по стране.
     Если country_name не указан, вернет топ-20 стран.
     
     Args:
         country_name: название страны (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по стране(ам)
     """
-    return get_country_stats_tool(country_name)
+    return get_country_stats_tool(country_name, start_month, end_month)
 
 @tool
 def get_artist_timeline(artist_name: str) -> str:
@@ -197,18 +208,48 @@ def get_summary_stats() -> str:
     return get_summary_stats_tool()
 
 @tool
-def analyze_monetization(artist_name: str = "") -> str:
+def analyze_monetization(artist_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Анализ монетизации: средняя ставка за стрим, доход на трек и т.д.
     Если artist_name не указан, вернет общую статистику монетизации.
     
     Args:
         artist_name: имя артиста (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с анализом монетизации
     """
-    return analyze_monetization_tool(artist_name)
+    return analyze_monetization_tool(artist_name, start_month, end_month)
+
+@tool
+def query_cube(artist: str = "", track: str = "", label: str = "", platform: str = "",
+               country: str = "", subscription: str = "", month: str = "",
+               group_by: str = "", metrics: str = "", limit: int = 20) -> str:
+    """
+    Произвольный срез данных: трек × платформа × страна × тип подписки × месяц.
+    Используй для вопросов с несколькими условиями, например
+    "Yenlik на Spotify в Казахстане по месяцам".
+    
+    Args:
+        artist: фильтр по артисту (часть имени)
+        track: фильтр по треку
+        label: фильтр по лейблу
+        platform: фильтр по платформе (например 'Spotify')
+        country: фильтр по стране (например 'Kazakhstan')
+        subscription: фильтр по типу подписки
+        month: фильтр по месяцу (например '2025/07')
+        group_by: измерения группировки через запятую - track, artist, label,
+            platform, country, subscription, month (пусто - общий итог)
+        metrics: метрики через запятую - streams, revenue, avg_rate (по умолчанию все)
+        limit: максимум строк (по умолчанию 20)
+    
+    Returns:
+        JSON со строками агрегации
+    """
+    return query_cube_tool(artist, track, label, platform, country, subscription,
+                           month, group_by, metrics, limit)
 
 
 # Список всех инструментов
@@ -225,7 +266,8 @@ tools = [
     compare_artists,
     get_viral_tracks,
     get_summary_stats,
-    analyze_monetization
+    analyze_monetization,
+    query_cube
 ]
 
 
@@ -6,6 +6,11 @@ AI Агент для аналитики музыкальных данных на
 
 import os
 import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
@@ -14,6 +19,7 @@ from langchain_core.tools import tool
 # Загружаем переменные из .env
 load_dotenv()
 
+from llm_client import get_histogram
 from analytics_tools import (
     get_top_tracks_tool,
     get_top_artists_tool,
@@ -27,38 +33,45 @@ from analytics_tools import (
     compare_artists_tool,
     get_viral_tracks_tool,
     get_summary_stats_tool,
-    analyze_monetization_tool
+    analyze_monetization_tool,
+    query_cube_tool
 )
 
 
 # Определяем инструменты как LangChain tools
 @tool
-def get_top_tracks(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_tracks(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ треков по доходу или стримам.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество треков (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue' (доход), 'streams' (стримы), 'avg_rate' (ставка)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ треками
     """
-    return get_top_tracks_tool(limit, sort_by)
+    return get_top_tracks_tool(limit, sort_by, start_month, end_month)
 
 @tool
-def get_top_artists(limit: int = 10, sort_by: str = "revenue") -> str:
+def get_top_artists(limit: int = 10, sort_by: str = "revenue", start_month: str = "", end_month: str = "") -> str:
     """
     Получить топ артистов по доходу, стримам или количеству треков.
+    Если задан период (start_month/end_month), топ считается за этот период.
     
     Args:
         limit: количество артистов (по умолчанию 10)
         sort_by: поле для сортировки - 'revenue', 'streams', 'tracks_count', 'avg_rate'
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с топ артистами
     """
-    return get_top_artists_tool(limit, sort_by)
+    return get_top_artists_tool(limit, sort_by, start_month, end_month)
 
 @tool
 def search_track(query: str) -> str:
@@ -114,32 +127,36 @@ def get_artist_tracks(artist_name: str) -> str:
     return get_artist_tracks_tool(artist_name)
 
 @tool
-def get_platform_stats(platform_name: str = "") -> str:
+def get_platform_stats(platform_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по платформе (Spotify, Apple Music, YouTube и т.д.).
     Если platform_name не указан, вернет статистику по всем платформам.
     
     Args:
         platform_name: название платформы (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по платформе(ам)
     """
-    return get_platform_stats_tool(platform_name)
+    return get_platform_stats_tool(platform_name, start_month, end_month)
 
 @tool
-def get_country_stats(country_name: str = "") -> str:
+def get_country_stats(country_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Получить статистику по стране.
     Если country_name не указан, вернет топ-20 стран.
     
     Args:
         country_name: название страны (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON со статистикой по стране(ам)
     """
-    return get_country_stats_tool(country_name)
+    return get_country_stats_tool(country_name, start_month, end_month)
 
 @tool
 def get_artist_timeline(artist_name: str) -> str:
@@ -194,18 +211,48 @@ def get_summary_stats() -> str:
     return get_summary_stats_tool()
 
 @tool
-def analyze_monetization(artist_name: str = "") -> str:
+def analyze_monetization(artist_name: str = "", start_month: str = "", end_month: str = "") -> str:
     """
     Анализ монетизации: средняя ставка за стрим, доход на трек и т.д.
     Если artist_name не указан, вернет общую статистику монетизации.
     
     Args:
         artist_name: имя артиста (опционально)
+        start_month: начало периода, например '2025-07' (опционально)
+        end_month: конец периода включительно, например '2025-09' (опционально)
     
     Returns:
         JSON с анализом монетизации
     """
-    return analyze_monetization_tool(artist_name)
+    return analyze_monetization_tool(artist_name, start_month, end_month)
+
+@tool
+def query_cube(artist: str = "", track: str = "", label: str = "", platform: str = "",
+               country: str = "", subscription: str = "", month: str = "",
+               group_by: str = "", metrics: str = "", limit: int = 20) -> str:
+    """
+    Произвольный срез данных: трек × платформа × страна × тип подписки × месяц.
+    Используй для вопросов с несколькими условиями, например
+    "Yenlik на Spotify в Казахстане по месяцам".
+    
+    Args:
+        artist: фильтр по артисту (часть имени)
+        track: фильтр по треку
+        label: фильтр по лейблу
+        platform: фильтр по платформе (например 'Spotify')
+        country: фильтр по стране (например 'Kazakhstan')
+        subscription: фильтр по типу подписки
+        month: фильтр по месяцу (например '2025/07')
+        group_by: измерения группировки через запятую - track, artist, label,
+            platform, country, subscription, month (пусто - общий итог)
+        metrics: метрики через запятую - streams, revenue, avg_rate (по умолчанию все)
+        limit: максимум строк (по умолчанию 20)
+    
+    Returns:
+        JSON со строками агрегации
+    """
+    return query_cube_tool(artist, track, label, platform, country, subscription,
+                           month, group_by, metrics, limit)
 
 
 # Список всех инструментов
@@ -222,13 +269,164 @@ tools = [
     compare_artists,
     get_viral_tracks,
     get_summary_stats,
-    analyze_monetization
+    analyze_monetization,
+    query_cube
 ]
 
 # Словарь для быстрого доступа к инструментам
 tools_dict = {tool.name: tool for tool in tools}
 
 
+# Реестр LLM клиентов: один ChatOpenAI с привязанными инструментами на модель.
+# Клиенты создаются один раз и переиспользуют HTTP соединения (keep-alive),
+# поэтому на каждый запрос не тратится время на создание клиента и TLS handshake.
+_llm_registry = {}
+_registry_lock = threading.Lock()
+_http_client = None
+_http_async_client = None
+
+
+def _openai_timeout() -> httpx.Timeout:
+    """Таймауты запросов к OpenAI: чтение OPENAI_TIMEOUT, подключение OPENAI_CONNECT_TIMEOUT"""
+    return httpx.Timeout(
+        float(os.getenv("OPENAI_TIMEOUT", "60")),
+        connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+    )
+
+
+def _mark_request(request: httpx.Request):
+    request.extensions['llm_start'] = time.perf_counter()
+
+
+def _record_latency(response: httpx.Response):
+    """Время до заголовков ответа → гистограмма провайдера openai (/api/v1/llm-stats)"""
+    start = response.request.extensions.get('llm_start')
+    if start is not None:
+        get_histogram('openai').record((time.perf_counter() - start) * 1000)
+
+
+async def _amark_request(request: httpx.Request):
+    _mark_request(request)
+
+
+async def _arecord_latency(response: httpx.Response):
+    _record_latency(response)
+
+
+def _get_http_client() -> httpx.Client:
+    """Общий HTTP клиент с пулом постоянных соединений"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+            ),
+            timeout=_openai_timeout(),
+            event_hooks={'request': [_mark_request], 'response': [_record_latency]}
+        )
+    return _http_client
+
+
+def _get_http_async_client() -> httpx.AsyncClient:
+    """Общий асинхронный HTTP клиент (для стриминга)"""
+    global _http_async_client
+    if _http_async_client is None:
+        _http_async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+            ),
+            timeout=_openai_timeout(),
+            event_hooks={'request': [_amark_request], 'response': [_arecord_latency]}
+        )
+    return _http_async_client
+
+
+def get_llm_with_tools(model: str, api_key: str):
+    """
+    Получить LLM клиента с привязанными инструментами из реестра
+
+    Args:
+        model: модель (gpt-4o, gpt-4o-mini, gpt-4-turbo)
+        api_key: API ключ OpenAI
+
+    Returns:
+        ChatOpenAI с bind_tools(tools), общий для всех запросов к этой модели
+    """
+    key = (model, api_key)
+    llm_with_tools = _llm_registry.get(key)
+    if llm_with_tools is not None:
+        return llm_with_tools
+
+    with _registry_lock:
+        llm_with_tools = _llm_registry.get(key)
+        if llm_with_tools is None:
+            llm = ChatOpenAI(
+                model=model,
+                api_key=api_key,
+                temperature=0,
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                # Без явного timeout SDK ждёт ответа до 10 минут;
+                # повторы SDK - экспоненциальная задержка с джиттером
+                timeout=_openai_timeout(),
+                max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+                http_client=_get_http_client(),
+                http_async_client=_get_http_async_client()
+            )
+            llm_with_tools = llm.bind_tools(tools)
+            _llm_registry[key] = llm_with_tools
+    return llm_with_tools
+
+
+def warm_up_llm_clients(models, api_key: str):
+    """Создать клиентов для всех моделей заранее (при старте сервиса)"""
+    for model in models:
+        get_llm_with_tools(model, api_key)
+
+
+# Пул потоков для параллельного выполнения независимых вызовов инструментов
+_tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_TOOL_WORKERS", "8")),
+    thread_name_prefix="agent-tool"
+)
+
+
+def execute_tool_call(tool_call: dict) -> ToolMessage:
+    """Выполнить один вызов инструмента и вернуть ToolMessage"""
+    tool_name = tool_call['name']
+    tool_args = tool_call['args']
+    tool_id = tool_call['id']
+    
+    if tool_name not in tools_dict:
+        return ToolMessage(content=f"Инструмент {tool_name} не найден", tool_call_id=tool_id)
+    
+    try:
+        result = tools_dict[tool_name].invoke(tool_args)
+        return ToolMessage(content=result, tool_call_id=tool_id)
+    except Exception as e:
+        return ToolMessage(content=f"Ошибка: {e}", tool_call_id=tool_id)
+
+
+def execute_tool_calls(tool_calls: list) -> list:
+    """
+    Выполнить вызовы инструментов одного шага
+    
+    Несколько вызовов выполняются параллельно в пуле потоков,
+    результаты возвращаются в порядке tool_calls.
+    """
+    if len(tool_calls) == 1:
+        return [execute_tool_call(tool_calls[0])]
+    return list(_tool_executor.map(execute_tool_call, tool_calls))
+
+
+# Ответ, когда агент не уложился в max_iterations: не ответ на вопрос,
+# поэтому API его не кэширует (сравнивайте с NO_ANSWER)
+NO_ANSWER = "Извините, не удалось получить ответ за отведенное количество шагов."
+
+
 def run_agent(query: str, api_key: str, model: str = "gpt-4o", max_iterations: int = 5):
     """
     Запускает агента с запросом (простой ReAct loop)
@@ -240,15 +438,10 @@ def run_agent(query: str, api_key: str, model: str = "gpt-4o", max_iterations: i
         max_iterations: максимальное количество итераций
     
     Returns:
-        Ответ агента
+        Ответ агента или NO_ANSWER, если шаги закончились
     """
-    # Создаем LLM с инструментами
-    llm = ChatOpenAI(
-        model=model,
-        api_key=api_key,
-        temperature=0
-    )
-    llm_with_tools = llm.bind_tools(tools)
+    # LLM с инструментами из реестра (создается один раз на модель)
+    llm_with_tools = get_llm_with_tools(model, api_key)
     
     # История сообщений
     messages = [HumanMessage(content=query)]
@@ -263,24 +456,91 @@ def run_agent(query: str, api_key: str, model: str = "gpt-4o", max_iterations: i
         if not hasattr(response, 'tool_calls') or not response.tool_calls:
             return response.content
         
-        # Выполняем вызовы инструментов
-        for tool_call in response.tool_calls:
-            tool_name = tool_call['name']
-            tool_args = tool_call['args']
-            tool_id = tool_call['id']
-            
-            # Вызываем инструмент
-            if tool_name in tools_dict:
-                try:
-                    result = tools_dict[tool_name].invoke(tool_args)
-                    messages.append(ToolMessage(content=result, tool_call_id=tool_id))
-                except Exception as e:
-                    messages.append(ToolMessage(content=f"Ошибка: {e}", tool_call_id=tool_id))
-            else:
-                messages.append(ToolMessage(content=f"Инструмент {tool_name} не найден", tool_call_id=tool_id))
+        # Выполняем вызовы инструментов (независимые вызовы - параллельно)
+        messages.extend(execute_tool_calls(response.tool_calls))
     
     # Если достигли максимума итераций
-    return "Извините, не удалось получить ответ за отведенное количество шагов."
+    return NO_ANSWER
+
+
+async def arun_agent(query: str, api_key: str, model: str = "gpt-4o", max_iterations: int = 5):
+    """
+    Асинхронная версия run_agent (не блокирует event loop)
+    
+    LLM вызывается через ainvoke, синхронные инструменты выполняются
+    в потоках параллельно.
+    
+    Returns:
+        Ответ агента или NO_ANSWER, если шаги закончились
+    """
+    llm_with_tools = get_llm_with_tools(model, api_key)
+    messages = [HumanMessage(content=query)]
+    
+    for iteration in range(max_iterations):
+        response = await llm_with_tools.ainvoke(messages)
+        messages.append(response)
+        
+        if not hasattr(response, 'tool_calls') or not response.tool_calls:
+            return response.content
+        
+        results = await asyncio.gather(*[
+            asyncio.to_thread(execute_tool_call, tool_call)
+            for tool_call in response.tool_calls
+        ])
+        messages.extend(results)
+    
+    return NO_ANSWER
+
+
+async def astream_agent(query: str, api_key: str, model: str = "gpt-4o", max_iterations: int = 5):
+    """
+    Асинхронная потоковая версия run_agent
+    
+    Args:
+        query: запрос пользователя
+        api_key: API ключ OpenAI
+        model: модель (gpt-4o, gpt-4o-mini, gpt-4-turbo)
+        max_iterations: максимальное количество итераций
+    
+    Yields:
+        События по мере выполнения:
+        {'type': 'tool_call', 'id', 'name', 'args'} - агент вызывает инструмент
+        {'type': 'tool_result', 'id', 'name', 'size'} - инструмент отработал
+        {'type': 'token', 'content'} - очередной фрагмент ответа LLM
+        {'type': 'answer', 'content'} - итоговый ответ
+    """
+    llm_with_tools = get_llm_with_tools(model, api_key)
+    messages = [HumanMessage(content=query)]
+    
+    for iteration in range(max_iterations):
+        # Стримим ответ LLM, собирая чанки в одно сообщение
+        response = None
+        async for chunk in llm_with_tools.astream(messages):
+            response = chunk if response is None else response + chunk
+            if chunk.content and not chunk.tool_call_chunks:
+                yield {'type': 'token', 'content': chunk.content}
+        
+        if response is None:
+            break
+        messages.append(response)
+        
+        if not response.tool_calls:
+            yield {'type': 'answer', 'content': response.content}
+            return
+        
+        for tool_call in response.tool_calls:
+            yield {'type': 'tool_call', 'id': tool_call['id'], 'name': tool_call['name'], 'args': tool_call['args']}
+        
+        # Инструменты синхронные - выполняем в потоках, параллельно
+        results = await asyncio.gather(*[
+            asyncio.to_thread(execute_tool_call, tool_call)
+            for tool_call in response.tool_calls
+        ])
+        for tool_call, result in zip(response.tool_calls, results):
+            messages.append(result)
+            yield {'type': 'tool_result', 'id': tool_call['id'], 'name': tool_call['name'], 'size': len(result.content)}
+    
+    yield {'type': 'answer', 'content': NO_ANSWER}
 
 
 # Интерактивный режим
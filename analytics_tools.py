@@ -5,10 +5,36 @@
 """
 
 import json
+import os
+import threading
+from collections.abc import Mapping
 from pathlib import Path
 from typing import List, Dict, Any, Optional
+import numpy as np
 import pandas as pd
 
+from fast_json import dumps_str
+from olap_cube import OLAPCube, PeriodIndex, CUBE_FILE, top_indices
+from records import ArtistRecord, TrackDetail, TrackRecord, build_records
+
+# Параметры компактной сериализации результатов инструментов
+TOOL_RESULT_CONFIG = {
+    'max_items': 10,        # элементов списка в ответе (остальные - "more")
+    'max_map_items': 8,     # ключей в словарях-разбивках (платформы, страны)
+    'float_digits': 4,      # значащих цифр для дробных чисел
+    'token_budget': 1200    # примерный лимит токенов на один ответ инструмента
+}
+
+# Поля-разбивки (track_details), которые сокращаются до max_map_items ключей;
+# остальные словари (статистика, сравнение) отдаются целиком
+BREAKDOWN_FIELDS = ('platforms', 'countries', 'subscription_types')
+# Разбивка по месяцам сокращается хронологически - остаются последние месяцы
+TIMELINE_FIELDS = ('monthly',)
+
+# Поля записей, которые отдаются агенту (остальные отбрасываются)
+TRACK_FIELDS = ['track', 'artist', 'label', 'revenue', 'streams', 'avg_rate']
+ARTIST_FIELDS = ['artist', 'label', 'revenue', 'streams', 'tracks_count', 'avg_rate']
+
 class AnalyticsTools:
     """Набор инструментов для анализа музыкальных данных"""
     
@@ -25,11 +51,12 @@ class AnalyticsTools:
         with open(self.data_dir / "metadata.json", 'r', encoding='utf-8') as f:
             self.metadata = json.load(f)
         
+        # Треки, артисты и детали - компактные записи (records.py)
         with open(self.data_dir / "tracks_aggregated.json", 'r', encoding='utf-8') as f:
-            self.tracks = json.load(f)
+            self.tracks = build_records(TrackRecord, json.load(f))
         
         with open(self.data_dir / "artists_aggregated.json", 'r', encoding='utf-8') as f:
-            self.artists = json.load(f)
+            self.artists = build_records(ArtistRecord, json.load(f))
         
         with open(self.data_dir / "platforms_aggregated.json", 'r', encoding='utf-8') as f:
             self.platforms = json.load(f)
@@ -41,35 +68,173 @@ class AnalyticsTools:
             self.monthly = json.load(f)
         
         with open(self.data_dir / "track_details.json", 'r', encoding='utf-8') as f:
-            self.track_details = json.load(f)
+            self.track_details = build_records(TrackDetail, json.load(f))
+        
+        # OLAP куб и накопленные суммы по месяцам (для фильтра по периоду)
+        self._cube = None
+        self.periods = None
+        if (self.data_dir / CUBE_FILE).exists():
+            self._cube = OLAPCube.load(self.data_dir)
+            self.periods = PeriodIndex(self._cube)
     
-    def get_top_tracks(self, limit: int = 10, sort_by: str = "revenue") -> List[Dict]:
+    @classmethod
+    def from_shared_memory(cls, name: str) -> "AnalyticsTools":
+        """
+        Подключиться к данным, опубликованным в общую память (shared_dataset.py)
+        
+        Записи и куб читаются прямо из сегмента, без копии в каждом воркере.
+        
+        Args:
+            name: имя сегмента общей памяти
+        """
+        from shared_dataset import RECORD_TABLES, SharedDataset
+        
+        dataset = SharedDataset(name)
+        tools = cls.__new__(cls)
+        tools.data_dir = None
+        tools._shared = dataset
+        tools.metadata = dataset.metadata
+        for table in RECORD_TABLES:
+            setattr(tools, table, dataset.tables[table])
+        
+        tools._cube = None
+        tools.periods = None
+        if dataset.cube_arrays is not None:
+            tools._cube = OLAPCube(dataset.cube_arrays, dataset.cube_dims)
+            tools.periods = PeriodIndex(tools._cube)
+        return tools
+    
+    @staticmethod
+    def _contains(records, field: str, query: str) -> List[Dict]:
+        """
+        Записи, у которых query входит в field без учёта регистра
+        
+        Списки из общей памяти (SharedRecords) ищут по байтам колонки,
+        не собирая каждую запись.
+        """
+        if hasattr(records, 'contains'):
+            return records.contains(field, query)
+        query_lower = query.lower()
+        return [record for record in records if query_lower in record[field].lower()]
+    
+    @staticmethod
+    def _top(records, field: str, limit: int) -> List[Dict]:
+        """limit записей с наибольшим field (равные - в исходном порядке)"""
+        if hasattr(records, 'top'):
+            return records.top(field, limit)
+        return sorted(records, key=lambda x: x.get(field, 0), reverse=True)[:limit]
+    
+    def _month_range(self, start_month: Optional[str], end_month: Optional[str]):
+        """Индексы месяцев периода (ValueError, если период задать нельзя)"""
+        if self.periods is None:
+            raise ValueError('Фильтр по периоду недоступен: OLAP куб не построен (запустите precalc_data.py)')
+        return self.periods.month_range(start_month, end_month)
+    
+    def _period_info(self, i: int, j: int) -> Dict:
+        return {'start': self.periods.months[i], 'end': self.periods.months[j - 1]}
+    
+    def _period_tracks(self, i: int, j: int, indices=None) -> List[Dict]:
+        """Записи треков за период в формате tracks_aggregated.json"""
+        dims = self._cube.dims
+        columns = self._cube.columns
+        totals = self.periods.totals('track', i, j)
+        if indices is None:
+            indices = np.flatnonzero(totals['streams'] > 0)
+        return [
+            {
+                'isrc': dims['isrc'][k],
+                'track': dims['track'][k],
+                'artist': dims['artist'][columns['track_artist'][k]],
+                'label': dims['label'][columns['track_label'][k]],
+                'revenue': float(totals['revenue'][k]),
+                'streams': int(totals['streams'][k]),
+                'avg_rate': float(totals['avg_rate'][k])
+            }
+            for k in indices if totals['streams'][k] > 0
+        ]
+    
+    def _period_dimension(self, dim: str, i: int, j: int) -> List[Dict]:
+        """Записи платформ/стран за период в формате *_aggregated.json"""
+        totals = self.periods.totals(dim, i, j)
+        tracks_count = self.periods.distinct_counts(dim, 'track', i, j)
+        artists_count = self.periods.distinct_counts(dim, 'artist', i, j)
+        return [
+            {
+                dim: self._cube.dims[dim][k],
+                'revenue': float(totals['revenue'][k]),
+                'streams': int(totals['streams'][k]),
+                'tracks_count': int(tracks_count[k]),
+                'artists_count': int(artists_count[k]),
+                'avg_rate': float(totals['avg_rate'][k])
+            }
+            for k in top_indices(totals['revenue'], len(totals['revenue']))
+            if totals['streams'][k] > 0
+        ]
+    
+    def get_top_tracks(self, limit: int = 10, sort_by: str = "revenue",
+                       start_month: Optional[str] = None, end_month: Optional[str] = None) -> List[Dict]:
         """
         Получить топ треков
         
         Args:
             limit: количество треков
             sort_by: поле для сортировки (revenue, streams, avg_rate)
+            start_month: начало периода ('2025-07'), включительно
+            end_month: конец периода ('2025-09'), включительно
         
         Returns:
             Список треков с информацией
         """
-        sorted_tracks = sorted(self.tracks, key=lambda x: x.get(sort_by, 0), reverse=True)
-        return sorted_tracks[:limit]
+        if start_month or end_month:
+            try:
+                i, j = self._month_range(start_month, end_month)
+            except ValueError as e:
+                return {'error': str(e)}
+            totals = self.periods.totals('track', i, j)
+            values = totals.get(sort_by, totals['revenue'])
+            return self._period_tracks(i, j, top_indices(values, limit))
+        
+        return self._top(self.tracks, sort_by, limit)
     
-    def get_top_artists(self, limit: int = 10, sort_by: str = "revenue") -> List[Dict]:
+    def get_top_artists(self, limit: int = 10, sort_by: str = "revenue",
+                        start_month: Optional[str] = None, end_month: Optional[str] = None) -> List[Dict]:
         """
         Получить топ артистов
         
         Args:
             limit: количество артистов
             sort_by: поле для сортировки (revenue, streams, tracks_count, avg_rate)
+            start_month: начало периода ('2025-07'), включительно
+            end_month: конец периода ('2025-09'), включительно
         
         Returns:
             Список артистов с информацией
         """
-        sorted_artists = sorted(self.artists, key=lambda x: x.get(sort_by, 0), reverse=True)
-        return sorted_artists[:limit]
+        if start_month or end_month:
+            try:
+                i, j = self._month_range(start_month, end_month)
+            except ValueError as e:
+                return {'error': str(e)}
+            totals = self.periods.totals('artist', i, j)
+            # Треки артиста, которые слушали в периоде
+            active_tracks = self.periods.totals('track', i, j)['streams'] > 0
+            totals['tracks_count'] = np.bincount(
+                self._cube.columns['track_artist'], weights=active_tracks, minlength=len(totals['streams'])
+            )
+            values = totals.get(sort_by, totals['revenue'])
+            return [
+                {
+                    'artist': self._cube.dims['artist'][k],
+                    'revenue': float(totals['revenue'][k]),
+                    'streams': int(totals['streams'][k]),
+                    'tracks_count': int(totals['tracks_count'][k]),
+                    'avg_rate': float(totals['avg_rate'][k]),
+                    'avg_revenue_per_track': float(totals['revenue'][k] / totals['tracks_count'][k])
+                }
+                for k in top_indices(values, limit) if totals['tracks_count'][k] > 0
+            ]
+        
+        return self._top(self.artists, sort_by, limit)
     
     def search_track(self, query: str) -> List[Dict]:
         """
@@ -81,12 +246,7 @@ class AnalyticsTools:
         Returns:
             Список найденных треков
         """
-        query_lower = query.lower()
-        results = [
-            track for track in self.tracks
-            if query_lower in track['track'].lower()
-        ]
-        return results
+        return self._contains(self.tracks, 'track', query)
     
     def search_artist(self, query: str) -> List[Dict]:
         """
@@ -98,12 +258,7 @@ class AnalyticsTools:
         Returns:
             Список найденных артистов
         """
-        query_lower = query.lower()
-        results = [
-            artist for artist in self.artists
-            if query_lower in artist['artist'].lower()
-        ]
-        return results
+        return self._contains(self.artists, 'artist', query)
     
     def get_track_details(self, track_name: str, artist_name: Optional[str] = None) -> Optional[Dict]:
         """
@@ -116,12 +271,9 @@ class AnalyticsTools:
         Returns:
             Детальная информация о треке
         """
-        track_lower = track_name.lower()
-        
-        for detail in self.track_details:
-            if track_lower in detail['track'].lower():
-                if artist_name is None or artist_name.lower() in detail['artist'].lower():
-                    return detail
+        for detail in self._contains(self.track_details, 'track', track_name):
+            if artist_name is None or artist_name.lower() in detail['artist'].lower():
+                return detail
         
         return None
     
@@ -135,56 +287,84 @@ class AnalyticsTools:
         Returns:
             Список треков артиста
         """
-        artist_lower = artist_name.lower()
-        results = [
-            track for track in self.tracks
-            if artist_lower in track['artist'].lower()
-        ]
+        results = self._contains(self.tracks, 'artist', artist_name)
         return sorted(results, key=lambda x: x['revenue'], reverse=True)
     
-    def get_platform_stats(self, platform_name: Optional[str] = None) -> Dict:
+    def get_platform_stats(self, platform_name: Optional[str] = None,
+                           start_month: Optional[str] = None, end_month: Optional[str] = None) -> Dict:
         """
         Получить статистику по платформе(ам)
         
         Args:
             platform_name: название платформы (если None, вернет все)
+            start_month: начало периода ('2025-07'), включительно
+            end_month: конец периода ('2025-09'), включительно
         
         Returns:
             Статистика по платформе(ам)
         """
+        platforms = self.platforms
+        period = None
+        if start_month or end_month:
+            try:
+                i, j = self._month_range(start_month, end_month)
+            except ValueError as e:
+                return {'error': str(e)}
+            platforms = self._period_dimension('platform', i, j)
+            period = self._period_info(i, j)
+        
         if platform_name is None:
-            return {
-                'total_platforms': len(self.platforms),
-                'platforms': sorted(self.platforms, key=lambda x: x['revenue'], reverse=True)
+            result = {
+                'total_platforms': len(platforms),
+                'platforms': sorted(platforms, key=lambda x: x['revenue'], reverse=True)
             }
+            if period:
+                result['period'] = period
+            return result
         
         platform_lower = platform_name.lower()
-        for platform in self.platforms:
+        for platform in platforms:
             if platform_lower in platform['platform'].lower():
-                return platform
+                return {**platform, 'period': period} if period else platform
         
         return {}
     
-    def get_country_stats(self, country_name: Optional[str] = None) -> Dict:
+    def get_country_stats(self, country_name: Optional[str] = None,
+                          start_month: Optional[str] = None, end_month: Optional[str] = None) -> Dict:
         """
         Получить статистику по стране(ам)
         
         Args:
             country_name: название страны (если None, вернет топ)
+            start_month: начало периода ('2025-07'), включительно
+            end_month: конец периода ('2025-09'), включительно
         
         Returns:
             Статистика по стране(ам)
         """
+        countries = self.countries
+        period = None
+        if start_month or end_month:
+            try:
+                i, j = self._month_range(start_month, end_month)
+            except ValueError as e:
+                return {'error': str(e)}
+            countries = self._period_dimension('country', i, j)
+            period = self._period_info(i, j)
+        
         if country_name is None:
-            return {
-                'total_countries': len(self.countries),
-                'top_countries': sorted(self.countries, key=lambda x: x['revenue'], reverse=True)[:20]
+            result = {
+                'total_countries': len(countries),
+                'top_countries': sorted(countries, key=lambda x: x['revenue'], reverse=True)[:20]
             }
+            if period:
+                result['period'] = period
+            return result
         
         country_lower = country_name.lower()
-        for country in self.countries:
+        for country in countries:
             if country_lower in country['country'].lower():
-                return country
+                return {**country, 'period': period} if period else country
         
         return {}
     
@@ -198,11 +378,7 @@ class AnalyticsTools:
         Returns:
             Список месячных данных
         """
-        artist_lower = artist_name.lower()
-        results = [
-            entry for entry in self.monthly
-            if artist_lower in entry['artist'].lower()
-        ]
+        results = self._contains(self.monthly, 'artist', artist_name)
         return sorted(results, key=lambda x: x['month'])
     
     def compare_artists(self, artist1: str, artist2: str) -> Dict:
@@ -216,14 +392,11 @@ class AnalyticsTools:
         Returns:
             Сравнительная статистика
         """
-        artist1_data = None
-        artist2_data = None
-        
-        for artist in self.artists:
-            if artist1.lower() in artist['artist'].lower():
-                artist1_data = artist
-            if artist2.lower() in artist['artist'].lower():
-                artist2_data = artist
+        # При нескольких совпадениях берётся последнее
+        matches1 = self._contains(self.artists, 'artist', artist1)
+        matches2 = self._contains(self.artists, 'artist', artist2)
+        artist1_data = matches1[-1] if matches1 else None
+        artist2_data = matches2[-1] if matches2 else None
         
         if not artist1_data or not artist2_data:
             return {'error': 'Один или оба артиста не найдены'}
@@ -292,16 +465,26 @@ class AnalyticsTools:
             'top_5_countries': sorted(self.countries, key=lambda x: x['revenue'], reverse=True)[:5]
         }
     
-    def analyze_monetization(self, artist_name: Optional[str] = None) -> Dict:
+    def analyze_monetization(self, artist_name: Optional[str] = None,
+                             start_month: Optional[str] = None, end_month: Optional[str] = None) -> Dict:
         """
         Анализ монетизации
         
         Args:
             artist_name: имя артиста (если None, общая статистика)
+            start_month: начало периода ('2025-07'), включительно
+            end_month: конец периода ('2025-09'), включительно
         
         Returns:
             Анализ монетизации
         """
+        if start_month or end_month:
+            try:
+                i, j = self._month_range(start_month, end_month)
+            except ValueError as e:
+                return {'error': str(e)}
+            return self._period_monetization(artist_name, i, j)
+        
         if artist_name:
             tracks = self.get_artist_tracks(artist_name)
             if not tracks:
@@ -332,83 +515,275 @@ class AnalyticsTools:
                 'unique_tracks': self.metadata['stats']['unique_tracks'],
                 'unique_artists': self.metadata['stats']['unique_artists']
             }
+    
+    def _period_monetization(self, artist_name: Optional[str], i: int, j: int) -> Dict:
+        """Анализ монетизации за месяцы [i, j) по накопленным суммам"""
+        period = self._period_info(i, j)
+        tracks = self._period_tracks(i, j)
+        
+        if artist_name:
+            artist_lower = artist_name.lower()
+            tracks = [t for t in tracks if artist_lower in t['artist'].lower()]
+            if not tracks:
+                return {'error': 'Артист не найден или нет данных за период', 'period': period}
+            tracks.sort(key=lambda x: x['revenue'], reverse=True)
+            total_revenue = sum(t['revenue'] for t in tracks)
+            total_streams = sum(t['streams'] for t in tracks)
+            return {
+                'artist': artist_name,
+                'period': period,
+                'total_revenue': total_revenue,
+                'total_streams': total_streams,
+                'avg_rate_per_stream': total_revenue / total_streams if total_streams > 0 else 0,
+                'tracks_count': len(tracks),
+                'avg_revenue_per_track': total_revenue / len(tracks),
+                'best_track': tracks[0],
+                'worst_track': tracks[-1]
+            }
+        
+        total_revenue = sum(t['revenue'] for t in tracks)
+        total_streams = sum(t['streams'] for t in tracks)
+        return {
+            'period': period,
+            'total_revenue': total_revenue,
+            'total_streams': total_streams,
+            'avg_rate_per_stream': total_revenue / total_streams if total_streams > 0 else 0,
+            'unique_tracks': len(tracks),
+            'unique_artists': len({t['artist'] for t in tracks})
+        }
+
+    
+    def query_cube(self, filters: Optional[Dict[str, Any]] = None,
+                   group_by: Optional[List[str]] = None,
+                   metrics: Optional[List[str]] = None,
+                   limit: int = 50) -> Dict:
+        """
+        Произвольный срез по кубу трек × платформа × страна × подписка × месяц
+        
+        Args:
+            filters: {измерение: значение}, например
+                {'artist': 'Yenlik', 'platform': 'Spotify', 'country': 'Kazakhstan'}
+            group_by: измерения группировки (track, artist, label, platform,
+                country, subscription, month)
+            metrics: streams, revenue, avg_rate
+            limit: максимум строк результата
+        
+        Returns:
+            Строки агрегации (см. OLAPCube.query)
+        """
+        if self._cube is None:
+            return {'error': 'Куб не построен (запустите precalc_data.py)'}
+        return self._cube.query(filters, group_by, metrics, limit)
+
+
+def _round_number(value: float, digits: int) -> float:
+    """Округление до значащих цифр (ставки за стрим - очень маленькие числа)"""
+    if value == 0 or value != value:
+        return value
+    return float(f"{value:.{digits}g}")
+
+
+def _map_sort_key(item):
+    """Ключ сортировки элементов разбивки: по стримам, затем по значению"""
+    value = item[1]
+    if isinstance(value, Mapping):
+        return value.get('Количество', value.get('streams', 0)) or 0
+    return value if isinstance(value, (int, float)) else 0
+
+
+def _truncate_map(name: str, value: Mapping, max_map_items: int) -> Dict:
+    """
+    Сократить разбивку до max_map_items ключей
+
+    platforms / countries / subscription_types - крупнейшие по стримам,
+    monthly - последние месяцы в хронологическом порядке; 'more' -
+    сколько ключей отброшено.
+    """
+    if name in TIMELINE_FIELDS:
+        items = sorted(value.items())[-max_map_items:]
+    else:
+        items = sorted(value.items(), key=_map_sort_key, reverse=True)[:max_map_items]
+    truncated = dict(items)
+    truncated['more'] = len(value) - max_map_items
+    return truncated
+
+
+def _compact(value: Any, max_items: int, max_map_items: int, digits: int,
+             projections: List[List[str]]) -> Any:
+    """Рекурсивно сокращает результат: проекция полей, округление, top-K"""
+    if isinstance(value, float):
+        return _round_number(value, digits)
+
+    if isinstance(value, list):
+        items = [_compact(v, max_items, max_map_items, digits, projections) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append({'more': len(value) - max_items})
+        return items
+
+    if isinstance(value, Mapping):
+        fields = next((p for p in projections if all(f in value for f in p)), None)
+        if fields:
+            value = {k: value[k] for k in fields}
+        result = {}
+        for k, v in value.items():
+            if (k in BREAKDOWN_FIELDS or k in TIMELINE_FIELDS) and isinstance(v, Mapping) \
+                    and len(v) > max_map_items:
+                v = _truncate_map(k, v, max_map_items)
+            result[k] = _compact(v, max_items, max_map_items, digits, projections)
+        return result
+
+    return value
+
+
+def to_tool_json(result: Any, *projections: List[str], config: Dict[str, Any] = None) -> str:
+    """
+    Компактная сериализация результата инструмента для LLM
+
+    Args:
+        result: результат метода AnalyticsTools
+        projections: наборы полей (TRACK_FIELDS, ARTIST_FIELDS); запись,
+            содержащая все поля набора, сокращается до этих полей
+        config: параметры (см. TOOL_RESULT_CONFIG); инструменты с
+            параметром limit передают его как max_items
+
+    Returns:
+        JSON без отступов; если ответ не укладывается в token_budget,
+        количество элементов списков и разбивок уменьшается вдвое
+    """
+    config = {**TOOL_RESULT_CONFIG, **(config or {})}
+    max_items = config['max_items']
+    max_map_items = config['max_map_items']
+
+    while True:
+        compact = _compact(result, max_items, max_map_items, config['float_digits'], projections)
+        text = dumps_str(compact)
+        # ~3 символа на токен для смеси кириллицы, латиницы и чисел
+        if len(text) / 3 <= config['token_budget'] or (max_items <= 1 and max_map_items <= 1):
+            return text
+        max_items = max(1, max_items // 2)
+        max_map_items = max(1, max_map_items // 2)
+
+
+_tools_instance = None
+_tools_lock = threading.Lock()
+
+
+def get_analytics_tools() -> AnalyticsTools:
+    """
+    Общий экземпляр AnalyticsTools (данные загружаются один раз)
+    
+    Если задан ANALYTICS_SHM_NAME, данные берутся из общей памяти
+    (опубликованы main.py или shared_dataset.py publish).
+    """
+    global _tools_instance
+    if _tools_instance is None:
+        with _tools_lock:
+            if _tools_instance is None:
+                shm_name = os.getenv("ANALYTICS_SHM_NAME")
+                if shm_name:
+                    _tools_instance = AnalyticsTools.from_shared_memory(shm_name)
+                else:
+                    _tools_instance = AnalyticsTools()
+    return _tools_instance
 
 
 # Функции-обертки для LangGraph tools
-def get_top_tracks_tool(limit: int = 10, sort_by: str = "revenue") -> str:
-    """Получить топ треков по доходу или стримам"""
-    tools = AnalyticsTools()
-    result = tools.get_top_tracks(limit, sort_by)
-    return json.dumps(result, ensure_ascii=False, indent=2)
-
-def get_top_artists_tool(limit: int = 10, sort_by: str = "revenue") -> str:
-    """Получить топ артистов по доходу или стримам"""
-    tools = AnalyticsTools()
-    result = tools.get_top_artists(limit, sort_by)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+def get_top_tracks_tool(limit: int = 10, sort_by: str = "revenue",
+                        start_month: str = "", end_month: str = "") -> str:
+    """Получить топ треков по доходу или стримам (за период, если он задан)"""
+    tools = get_analytics_tools()
+    result = tools.get_top_tracks(limit, sort_by, start_month or None, end_month or None)
+    return to_tool_json(result, TRACK_FIELDS, config={'max_items': limit})
+
+def get_top_artists_tool(limit: int = 10, sort_by: str = "revenue",
+                         start_month: str = "", end_month: str = "") -> str:
+    """Получить топ артистов по доходу или стримам (за период, если он задан)"""
+    tools = get_analytics_tools()
+    result = tools.get_top_artists(limit, sort_by, start_month or None, end_month or None)
+    return to_tool_json(result, ARTIST_FIELDS, config={'max_items': limit})
 
 def search_track_tool(query: str) -> str:
     """Поиск трека по названию"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.search_track(query)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result, TRACK_FIELDS)
 
 def search_artist_tool(query: str) -> str:
     """Поиск артиста по имени"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.search_artist(query)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result, ARTIST_FIELDS)
 
 def get_track_details_tool(track_name: str, artist_name: str = "") -> str:
     """Получить детальную информацию о треке"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.get_track_details(track_name, artist_name if artist_name else None)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result)
 
 def get_artist_tracks_tool(artist_name: str) -> str:
     """Получить все треки артиста"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.get_artist_tracks(artist_name)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result, TRACK_FIELDS)
 
-def get_platform_stats_tool(platform_name: str = "") -> str:
-    """Получить статистику по платформе"""
-    tools = AnalyticsTools()
-    result = tools.get_platform_stats(platform_name if platform_name else None)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+def get_platform_stats_tool(platform_name: str = "", start_month: str = "", end_month: str = "") -> str:
+    """Получить статистику по платформе (за период, если он задан)"""
+    tools = get_analytics_tools()
+    result = tools.get_platform_stats(platform_name if platform_name else None,
+                                      start_month or None, end_month or None)
+    return to_tool_json(result)
 
-def get_country_stats_tool(country_name: str = "") -> str:
-    """Получить статистику по стране"""
-    tools = AnalyticsTools()
-    result = tools.get_country_stats(country_name if country_name else None)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+def get_country_stats_tool(country_name: str = "", start_month: str = "", end_month: str = "") -> str:
+    """Получить статистику по стране (за период, если он задан)"""
+    tools = get_analytics_tools()
+    result = tools.get_country_stats(country_name if country_name else None,
+                                     start_month or None, end_month or None)
+    return to_tool_json(result)
 
 def get_artist_timeline_tool(artist_name: str) -> str:
     """Получить временную динамику артиста по месяцам"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.get_artist_timeline(artist_name)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result)
 
 def compare_artists_tool(artist1: str, artist2: str) -> str:
     """Сравнить двух артистов"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.compare_artists(artist1, artist2)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result, ARTIST_FIELDS)
 
 def get_viral_tracks_tool(threshold: float = 10.0) -> str:
     """Найти вирусные треки с коэффициентом вирусности выше порога"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.get_viral_tracks(threshold)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result)
 
 def get_summary_stats_tool() -> str:
     """Получить общую статистику по всем данным"""
-    tools = AnalyticsTools()
+    tools = get_analytics_tools()
     result = tools.get_summary_stats()
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return to_tool_json(result, TRACK_FIELDS, ARTIST_FIELDS)
+
+def analyze_monetization_tool(artist_name: str = "", start_month: str = "", end_month: str = "") -> str:
+    """Анализ монетизации артиста или общей статистики (за период, если он задан)"""
+    tools = get_analytics_tools()
+    result = tools.analyze_monetization(artist_name if artist_name else None,
+                                        start_month or None, end_month or None)
+    return to_tool_json(result, TRACK_FIELDS)
 
-def analyze_monetization_tool(artist_name: str = "") -> str:
-    """Анализ монетизации артиста или общей статистики"""
-    tools = AnalyticsTools()
-    result = tools.analyze_monetization(artist_name if artist_name else None)
-    return json.dumps(result, ensure_ascii=False, indent=2)
+def query_cube_tool(artist: str = "", track: str = "", label: str = "", platform: str = "",
+                    country: str = "", subscription: str = "", month: str = "",
+                    group_by: str = "", metrics: str = "", limit: int = 20) -> str:
+    """Срез и агрегация по кубу трек × платформа × страна × подписка × месяц"""
+    tools = get_analytics_tools()
+    filters = {
+        'artist': artist, 'track': track, 'label': label, 'platform': platform,
+        'country': country, 'subscription': subscription, 'month': month
+    }
+    result = tools.query_cube(
+        {dim: value for dim, value in filters.items() if value},
+        [d.strip() for d in group_by.split(',') if d.strip()],
+        [m.strip() for m in metrics.split(',') if m.strip()],
+        limit
+    )
+    return to_tool_json(result, config={'max_items': limit})
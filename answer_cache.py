@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Кэш готовых ответов агента
+
+Ключ - нормализованный вопрос, модель и версия прекалькулированных данных
+(metadata.json → generated_at), поэтому после пересчёта данных старые
+ответы автоматически перестают использоваться. Записи живут ttl секунд,
+при переполнении вытесняются давно не использованные (LRU).
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.…]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Приводит вопрос к канонической форме: регистр, ё→е, пробелы, знаки в конце"""
+    text = question.lower().replace('ё', 'е')
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return _TRAILING_PUNCT_RE.sub('', text)
+
+
+def make_key(question: str, model: str, data_version: Optional[str]) -> Tuple[str, str, str]:
+    """Ключ кэша: (нормализованный вопрос, модель, версия данных)"""
+    return normalize_question(question), model, data_version or ''
+
+
+class AnswerCache:
+    """Потокобезопасный LRU кэш с TTL"""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Вернуть значение или None (просроченные записи удаляются)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Tuple, value: Dict[str, Any]):
+        """Сохранить значение, вытеснив самые старые записи при переполнении"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер кэша и счётчики попаданий"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
@@ -17,6 +17,8 @@ class QueryResponse(BaseModel):
     answer: str = Field(..., description="Ответ агента")
     model: str = Field(..., description="Использованная модель")
     execution_time: float = Field(..., description="Время выполнения в секундах")
+    cache_status: Optional[str] = Field(None, description="Статус кэша ответов: hit / miss / bypass / coalesced")
+    route: Optional[str] = Field(None, description="Путь ответа: fast_path (без LLM) / llm")
 
 
 class ErrorResponse(BaseModel):
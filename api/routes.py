@@ -1,7 +1,10 @@
 """
 API роуты
 """
-from fastapi import APIRouter, HTTPException, status
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, status
+from fastapi.responses import StreamingResponse
 from api.models import (
     QueryRequest, 
     QueryResponse, 
@@ -10,7 +13,8 @@ from api.models import (
     ToolsResponse,
     ToolInfo
 )
-from api.services import agent_service
+from fast_json import dumps_str
+from api.services import get_agent_service, AgentConfigError, AgentOverloadedError, AgentTimeoutError
 
 router = APIRouter()
 
@@ -20,31 +24,58 @@ router = APIRouter()
     response_model=QueryResponse,
     responses={
         400: {"model": ErrorResponse},
-        500: {"model": ErrorResponse}
+        500: {"model": ErrorResponse},
+        503: {"model": ErrorResponse},
+        504: {"model": ErrorResponse}
     },
     summary="Отправить запрос агенту",
     description="Отправляет вопрос на естественном языке AI агенту и получает ответ"
 )
-async def query_agent(request: QueryRequest):
+async def query_agent(
+    request: QueryRequest,
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None)
+):
     """
     Отправить запрос AI агенту
     
     - **query**: Вопрос на естественном языке (русский или английский)
     - **model**: Модель LLM (gpt-4o, gpt-4o-mini, gpt-4-turbo)
     
+    Повторные вопросы отдаются из кэша ответов. Чтобы получить свежий ответ,
+    передайте заголовок `X-Cache-Bypass: 1` или `Cache-Control: no-cache`.
+    
     Примеры запросов:
     - "Покажи топ-10 треков по доходу"
     - "Найди информацию о треке Meili"
     - "Сравни артистов Yenlik и Shiza"
     """
     try:
-        result = agent_service.query(request.query, request.model)
+        bypass = bool(x_cache_bypass and x_cache_bypass not in ("0", "false")) or \
+            "no-cache" in (cache_control or "").lower()
+        result = await get_agent_service().aquery(request.query, request.model, use_cache=not bypass)
         return QueryResponse(**result)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except AgentConfigError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    except AgentOverloadedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
+    except AgentTimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -52,6 +83,46 @@ async def query_agent(request: QueryRequest):
         )
 
 
+@router.post(
+    "/query/stream",
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        400: {"model": ErrorResponse}
+    },
+    summary="Потоковый запрос к агенту (SSE)",
+    description="Отправляет вопрос агенту и возвращает ход выполнения и ответ как Server-Sent Events"
+)
+async def query_agent_stream(request: QueryRequest):
+    """
+    Потоковый запрос к AI агенту
+    
+    События (Server-Sent Events):
+    - **tool_call**: агент вызывает инструмент (name, args)
+    - **tool_result**: инструмент отработал (name, size)
+    - **token**: очередной фрагмент ответа
+    - **answer**: итоговый ответ
+    - **done** / **error**: завершение запроса
+    """
+    try:
+        model = get_agent_service().resolve_model(request.model)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    async def event_stream():
+        async for event in get_agent_service().astream(request.query, model):
+            data = dumps_str(event)
+            yield f"event: {event['type']}\ndata: {data}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get(
     "/health",
     response_model=HealthResponse,
@@ -68,13 +139,14 @@ async def health_check():
     - Доступные модели
     - Количество инструментов
     """
-    health = agent_service.get_health()
+    health = get_agent_service().get_health()
     return HealthResponse(**health)
 
 
 @router.get(
     "/tools",
     response_model=ToolsResponse,
+    responses={503: {"model": ErrorResponse}},
     summary="Список доступных инструментов",
     description="Возвращает список всех аналитических инструментов агента"
 )
@@ -82,17 +154,44 @@ async def get_tools():
     """
     Получить список доступных инструментов
     
-    Возвращает информацию о всех 13 аналитических инструментах:
+    Возвращает информацию о всех 14 аналитических инструментах:
     - Название инструмента
     - Описание функциональности
     """
-    tools_info = agent_service.get_tools_info()
+    try:
+        tools_info = await asyncio.to_thread(get_agent_service().get_tools_info)
+    except AgentConfigError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     return ToolsResponse(
         tools=[ToolInfo(**tool) for tool in tools_info],
         count=len(tools_info)
     )
 
 
+@router.get(
+    "/cache/stats",
+    summary="Статистика кэша ответов",
+    description="Размер кэша ответов агента, попадания и промахи"
+)
+async def get_cache_stats():
+    """Статистика кэша ответов агента и объединения параллельных запросов"""
+    service = get_agent_service()
+    return {**service.answer_cache.stats(), "single_flight": service.flight.stats()}
+
+
+@router.get(
+    "/llm-stats",
+    summary="Состояние LLM провайдеров",
+    description="Гистограмма латентности и состояние circuit breaker по провайдерам"
+)
+async def get_llm_stats():
+    """Латентность запросов к LLM (p50/p95/p99, корзины) и состояние circuit breaker"""
+    return get_agent_service().get_llm_stats()
+
+
 @router.get(
     "/models",
     summary="Список доступных моделей",
@@ -104,8 +203,9 @@ async def get_models():
     
     Возвращает список всех поддерживаемых LLM моделей
     """
+    service = get_agent_service()
     return {
-        "models": agent_service.available_models,
-        "default": agent_service.default_model,
-        "count": len(agent_service.available_models)
+        "models": service.available_models,
+        "default": service.default_model,
+        "count": len(service.available_models)
     }
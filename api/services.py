@@ -3,13 +3,45 @@
 """
 import os
 import time
-from typing import Dict, Any
+import asyncio
+import importlib
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, AsyncIterator
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
-from analytics_agent_openai_simple import run_agent, tools
+from answer_cache import AnswerCache, make_key
+from intent_router import answer_fast_path
+from single_flight import SingleFlight
+from llm_client import get_breaker, llm_stats
+
+# Модуль агента (langchain, langgraph, клиенты OpenAI) импортируется при
+# первом обращении к LLM, а не при импорте API
+AGENT_MODULE = "analytics_agent_openai_simple"
+
+
+class AgentOverloadedError(Exception):
+    """Все слоты агента заняты - запрос не дождался очереди"""
+
+
+class AgentTimeoutError(Exception):
+    """Запрос к агенту не уложился в таймаут"""
+
+
+class AgentConfigError(Exception):
+    """Сервис настроен неверно (нет OPENAI_API_KEY) - ошибка сервера, а не запроса"""
+
+
+def _is_provider_error(error: Exception) -> bool:
+    """Ошибка провайдера LLM (сеть, таймаут, 429, 5xx), а не самого запроса"""
+    import openai
+    
+    return isinstance(error, (
+        openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError
+    ))
 
 
 class AgentService:
@@ -17,34 +49,291 @@ class AgentService:
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("OPENAI_API_KEY не найден в .env")
-        
         self.default_model = os.getenv("OPENAI_MODEL", "gpt-4o")
         self.available_models = ["gpt-4o", "gpt-4o-mini", "gpt-4-turbo"]
-        self.tools = tools
+        self._agent = None
+        self._agent_lock = threading.Lock()
+        self._data_version = None
+        
+        # Ограничение параллельных запросов к агенту (back-pressure)
+        self.max_concurrency = int(os.getenv("AGENT_MAX_CONCURRENCY", "16"))
+        self.queue_timeout = float(os.getenv("AGENT_QUEUE_TIMEOUT", "5"))
+        self.request_timeout = float(os.getenv("AGENT_REQUEST_TIMEOUT", "90"))
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        
+        # Ответы на частые вопросы без LLM (intent_router)
+        self.fast_path_enabled = os.getenv("AGENT_FAST_PATH", "1") not in ("0", "false")
+        
+        # Кэш готовых ответов (вопрос + модель + версия данных)
+        self.answer_cache = AnswerCache(
+            max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        )
+        self.flight = SingleFlight()
+        
+    @property
+    def agent(self):
+        """
+        Модуль агента (импортируется при первом обращении)
+        
+        Клиенты LLM создаются один раз и переиспользуются между запросами.
+        
+        Raises:
+            AgentConfigError: не задан OPENAI_API_KEY
+        """
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    if not self.api_key:
+                        raise AgentConfigError("OPENAI_API_KEY не найден в .env")
+                    agent = importlib.import_module(AGENT_MODULE)
+                    agent.warm_up_llm_clients(self.available_models, self.api_key)
+                    self._agent = agent
+        return self._agent
     
-    def query(self, query: str, model: str = None) -> Dict[str, Any]:
+    async def aget_agent(self):
+        """Модуль агента; первый импорт - в потоке, не блокируя event loop"""
+        if self._agent is not None:
+            return self._agent
+        return await asyncio.to_thread(lambda: self.agent)
+    
+    @property
+    def tools(self) -> list:
+        return self.agent.tools
+    
+    def warm_up(self) -> Dict[str, float]:
         """
-        Отправить запрос агенту
+        Прогрев: импорт агента, клиенты LLM и загрузка данных AnalyticsTools
+        
+        Returns:
+            Время каждого шага в секундах
+        """
+        from analytics_tools import get_analytics_tools
+        
+        timings = {}
+        start = time.perf_counter()
+        self.agent
+        timings['agent'] = round(time.perf_counter() - start, 3)
+        
+        start = time.perf_counter()
+        try:
+            get_analytics_tools()
+        except (OSError, ValueError):
+            pass
+        timings['data'] = round(time.perf_counter() - start, 3)
+        return timings
+    
+    @asynccontextmanager
+    async def _slot(self):
+        """Занять слот агента или отказать, если очередь не освободилась за queue_timeout"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AgentOverloadedError(
+                f"Агент перегружен ({self.max_concurrency} запросов в работе), повторите позже"
+            )
+        try:
+            yield
+        finally:
+            self._slots.release()
+    
+    def get_data_version(self):
+        """Версия прекалькулированных данных (generated_at из metadata.json)"""
+        from analytics_tools import get_analytics_tools
+        
+        try:
+            return get_analytics_tools().metadata.get('generated_at')
+        except (OSError, ValueError):
+            return None
+    
+    async def aget_data_version(self):
+        """
+        Версия данных без блокировки event loop
+        
+        Первая загрузка AnalyticsTools (или ожидание фонового прогрева)
+        идёт в потоке; загруженные данные в процессе не меняются, поэтому
+        версия запоминается.
+        """
+        if self._data_version is None:
+            self._data_version = await asyncio.to_thread(self.get_data_version)
+        return self._data_version
+    
+    async def aquery(self, query: str, model: str = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Асинхронный запрос к агенту (не блокирует event loop)
         
         Args:
             query: Вопрос на естественном языке
             model: Модель LLM (опционально)
+            use_cache: False - не читать ответ из кэша (результат всё равно кэшируется)
         
         Returns:
-            Словарь с ответом и метаданными
+            Словарь с ответом и метаданными (cache_status: hit / miss / bypass /
+            coalesced - ответ получен от такого же параллельного запроса)
+        
+        Raises:
+            ValueError: неподдерживаемая модель
+            AgentConfigError: сервис не настроен (нет OPENAI_API_KEY)
+            AgentOverloadedError: нет свободного слота
+            AgentTimeoutError: превышен request_timeout
+        """
+        model = self.resolve_model(model)
+        start_time = time.time()
+        
+        cache_key = make_key(query, model, await self.aget_data_version())
+        if use_cache:
+            cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                return {
+                    **cached,
+                    "query": query,
+                    "execution_time": round(time.time() - start_time, 4),
+                    "cache_status": "hit"
+                }
+        
+        # Одинаковые параллельные вопросы ждут одно выполнение (single-flight)
+        result, shared = await self.flight.do(cache_key, lambda: self._answer(query, model, cache_key))
+        if shared:
+            cache_status = "coalesced"
+        else:
+            cache_status = "miss" if use_cache else "bypass"
+        return {
+            **result,
+            "query": query,
+            "execution_time": round(time.time() - start_time, 4 if result["route"] == "fast_path" else 2),
+            "cache_status": cache_status
+        }
+    
+    async def _answer(self, query: str, model: str, cache_key) -> Dict[str, Any]:
+        """Ответ fast path или агента (сохраняется в кэш)"""
+        # Частые вопросы отвечаются напрямую из AnalyticsTools, без LLM
+        fast = await asyncio.to_thread(self.answer_fast_path, query) if self.fast_path_enabled else None
+        if fast is not None:
+            result = {"answer": fast["answer"], "model": model, "route": "fast_path"}
+            self.answer_cache.set(cache_key, result)
+            return result
+        
+        async with self._slot():
+            with self._llm_permit() as breaker:
+                try:
+                    agent = await self.aget_agent()
+                    answer = await asyncio.wait_for(
+                        agent.arun_agent(query, self.api_key, model),
+                        timeout=self.request_timeout
+                    )
+                except asyncio.TimeoutError:
+                    breaker.record_failure()
+                    raise AgentTimeoutError(f"Агент не ответил за {self.request_timeout:.0f} с")
+                except AgentConfigError:
+                    raise
+                except Exception as e:
+                    if _is_provider_error(e):
+                        breaker.record_failure()
+                    raise Exception(f"Ошибка при выполнении запроса: {str(e)}")
+                breaker.record_success()
+        
+        result = {"answer": answer, "model": model, "route": "llm"}
+        # Пустой ответ и NO_ANSWER (агент не уложился в шаги) не кэшируются
+        if answer and answer != agent.NO_ANSWER:
+            self.answer_cache.set(cache_key, result)
+        return result
+    
+    @contextmanager
+    def _llm_permit(self):
+        """
+        Разрешение circuit breaker провайдера OpenAI (llm_client.py)
+        
+        Берётся после слота агента и возвращается при любом выходе
+        (ошибка запроса, таймаут, отключение клиента SSE), поэтому
+        пробный запрос half_open не остаётся занятым навсегда.
+        
+        Raises:
+            AgentOverloadedError: провайдер недоступен - отказ без вызова LLM
         """
+        breaker = get_breaker('openai')
+        permit = breaker.acquire()
+        if permit is None:
+            raise AgentOverloadedError("LLM провайдер временно недоступен, повторите позже")
+        try:
+            yield breaker
+        finally:
+            breaker.release(permit)
+    
+    def get_llm_stats(self) -> Dict[str, Any]:
+        """Латентность и состояние LLM провайдеров"""
+        return llm_stats()
+    
+    def answer_fast_path(self, query: str):
+        """Ответ без LLM для распознанных вопросов или None"""
+        from analytics_tools import get_analytics_tools
+        
+        try:
+            tools_instance = get_analytics_tools()
+        except (OSError, ValueError):
+            return None
+        return answer_fast_path(query, tools_instance)
+    
+    def resolve_model(self, model: str = None) -> str:
+        """Модель по умолчанию или проверка поддерживаемой модели"""
         if not model:
             model = self.default_model
         
         if model not in self.available_models:
             raise ValueError(f"Модель {model} не поддерживается. Доступные: {self.available_models}")
+        return model
+    
+    async def astream(self, query: str, model: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый запрос к агенту
         
+        Args:
+            query: Вопрос на естественном языке
+            model: Модель LLM (уже проверенная через resolve_model)
+        
+        Yields:
+            События агента (tool_call, tool_result, token, answer),
+            в конце - 'done' с временем выполнения или 'error'
+        """
         start_time = time.time()
         
         try:
-            answer = run_agent(query, self.api_key, model)
+            async with self._slot():
+                with self._llm_permit() as breaker:
+                    agent = await self.aget_agent()
+                    try:
+                        async for event in agent.astream_agent(query, self.api_key, model):
+                            yield event
+                    except Exception as e:
+                        if _is_provider_error(e):
+                            breaker.record_failure()
+                        raise
+                    breaker.record_success()
+            yield {
+                "type": "done",
+                "query": query,
+                "model": model,
+                "execution_time": round(time.time() - start_time, 2)
+            }
+        except Exception as e:
+            yield {"type": "error", "detail": f"Ошибка при выполнении запроса: {str(e)}"}
+    
+    def query(self, query: str, model: str = None) -> Dict[str, Any]:
+        """
+        Отправить запрос агенту
+        
+        Args:
+            query: Вопрос на естественном языке
+            model: Модель LLM (опционально)
+        
+        Returns:
+            Словарь с ответом и метаданными
+        """
+        model = self.resolve_model(model)
+        
+        start_time = time.time()
+        
+        try:
+            answer = self.agent.run_agent(query, self.api_key, model)
             execution_time = time.time() - start_time
             
             return {
@@ -69,13 +358,25 @@ class AgentService:
     
     def get_health(self) -> Dict[str, Any]:
         """Получить статус здоровья сервиса"""
+        # Пока агент не загружен (прогрев ещё идёт) - статус starting
+        loaded = self._agent is not None
         return {
-            "status": "healthy",
+            "status": "healthy" if loaded else "starting",
             "version": "1.0.0",
             "models_available": self.available_models,
-            "tools_count": len(self.tools)
+            "tools_count": len(self._agent.tools) if loaded else 0
         }
 
 
-# Глобальный экземпляр сервиса
-agent_service = AgentService()
+_agent_service = None
+_agent_service_lock = threading.Lock()
+
+
+def get_agent_service() -> AgentService:
+    """Общий экземпляр сервиса (создаётся при первом запросе)"""
+    global _agent_service
+    if _agent_service is None:
+        with _agent_service_lock:
+            if _agent_service is None:
+                _agent_service = AgentService()
+    return _agent_service
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк параллельных запросов к API агента (/api/v1/query)
+
+Запуск против фейкового LLM сервера:
+    python fake_llm_server.py --port 9100 --latency-ms 800
+    OPENAI_BASE_URL=http://localhost:9100/v1 OPENAI_API_KEY=sk-fake python main.py
+    python bench_agent_concurrency.py --url http://localhost:8000 --concurrency 1 8 32
+
+При блокирующем агенте пропускная способность не растёт с concurrency,
+при асинхронном - растёт почти линейно до AGENT_MAX_CONCURRENCY.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Any
+
+import httpx
+
+from query_log import percentile
+
+
+async def run_level(url: str, concurrency: int, requests_count: int, query: str, model: str) -> Dict[str, Any]:
+    """Отправить requests_count запросов с заданным числом параллельных клиентов"""
+    latencies = []
+    statuses: Dict[int, int] = {}
+    counter = iter(range(requests_count))
+
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/query", json={"query": query, "model": model})
+                    code = response.status_code
+                except httpx.HTTPError:
+                    code = 0
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'rps': round(requests_count / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) or 0.0, 1),
+        'p95_ms': round(percentile(latencies, 95) or 0.0, 1),
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк параллельных запросов к API агента")
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=32, help="Запросов на уровень параллелизма")
+    parser.add_argument('--query', default="Покажи топ-5 треков по доходу")
+    parser.add_argument('--model', default="gpt-4o-mini")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  ⚡ БЕНЧМАРК ПАРАЛЛЕЛЬНЫХ ЗАПРОСОВ К АГЕНТУ")
+    print("=" * 80)
+    print(f"{'клиентов':>9} {'запросов':>9} {'RPS':>8} {'p50, ms':>10} {'p95, ms':>10}  статусы")
+
+    for level in args.concurrency:
+        result = asyncio.run(run_level(args.url, level, args.requests, args.query, args.model))
+        print(f"{result['concurrency']:>9} {result['requests']:>9} {result['rps']:>8} "
+              f"{result['p50_ms']:>10} {result['p95_ms']:>10}  {result['statuses']}")
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+End-to-end бенчмарк API при фиксированном параллелизме
+
+Прогоняет набор вопросов через /api/v1/query (API агента), /api/query и
+/api/telegram (SQL агент) и печатает пропускную способность и перцентили
+латентности по каждому endpoint.
+
+Офлайн запуск против фейкового LLM:
+    python fake_llm_server.py --port 9100 --latency-ms 500
+    OPENAI_BASE_URL=http://localhost:9100/v1 OPENAI_API_KEY=sk-fake python main.py
+    ALEM_API_URL=http://localhost:9100/v1/chat/completions ALEM_API_KEY=fake python sql_agent_fastapi.py
+    python bench_api.py --concurrency 8 --requests 64 --bypass-cache --output bench.json
+
+Без PostgreSQL SQL агент вернёт success=false, но время генерации SQL
+(вызов LLM) всё равно измеряется.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Dict, Any
+
+import httpx
+
+from query_log import percentile
+
+DEFAULT_QUESTIONS = [
+    "Покажи топ-10 треков по доходу",
+    "Сколько заработал Yenlik?",
+    "Сравни артистов Yenlik и Shiza",
+    "Yenlik на Spotify",
+    "Какие треки стали вирусными?",
+    "Найди информацию о треке Meili",
+]
+
+ENDPOINTS = {
+    'agent': {'path': '/api/v1/query', 'url_arg': 'agent_url'},
+    'sql': {'path': '/api/query', 'url_arg': 'sql_url'},
+    'telegram': {'path': '/api/telegram', 'url_arg': 'sql_url'},
+}
+
+
+async def run_endpoint(base_url: str, path: str, questions: List[str], concurrency: int,
+                       requests_count: int, headers: Dict[str, str]) -> Dict[str, Any]:
+    """requests_count запросов с concurrency параллельными клиентами"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests_count))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, headers=headers) as client:
+        async def worker():
+            for i in counter:
+                payload = {"query": questions[i % len(questions)]}
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=payload)
+                    status = str(response.status_code)
+                    if response.status_code == 200 and response.json().get('success') is False:
+                        status = '200-error'
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests_count,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'rps': round(requests_count / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) or 0.0, 1),
+        'p95_ms': round(percentile(latencies, 95) or 0.0, 1),
+        'p99_ms': round(percentile(latencies, 99) or 0.0, 1),
+        'max_ms': round(latencies[-1], 1) if latencies else None,
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end бенчмарк API")
+    parser.add_argument('--agent-url', default='http://localhost:8000', help="API агента (main.py)")
+    parser.add_argument('--sql-url', default='http://localhost:8006', help="SQL агент (sql_agent_fastapi.py)")
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=32, help="Запросов на endpoint")
+    parser.add_argument('--questions', help="Файл с вопросами (по одному в строке)")
+    parser.add_argument('--bypass-cache', action='store_true', help="Отправлять X-Cache-Bypass: 1")
+    parser.add_argument('--output', help="Куда сохранить JSON отчёт")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    headers = {"X-Cache-Bypass": "1"} if args.bypass_cache else {}
+
+    print("=" * 80)
+    print("  ⏱️  END-TO-END БЕНЧМАРК API")
+    print("=" * 80)
+    print(f"Параллелизм: {args.concurrency}, запросов на endpoint: {args.requests}, вопросов: {len(questions)}\n")
+    print(f"{'endpoint':<10} {'RPS':>8} {'p50, ms':>10} {'p95, ms':>10} {'p99, ms':>10}  статусы")
+
+    report = {}
+    for name in args.endpoints:
+        endpoint = ENDPOINTS[name]
+        base_url = getattr(args, endpoint['url_arg'])
+        result = asyncio.run(run_endpoint(
+            base_url, endpoint['path'], questions, args.concurrency, args.requests, headers
+        ))
+        report[name] = result
+        print(f"{name:<10} {result['rps']:>8} {result['p50_ms']:>10} {result['p95_ms']:>10} "
+              f"{result['p99_ms']:>10}  {result['statuses']}")
+
+    print("=" * 80)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк сериализации больших ответов /api/direct-sql
+
+Строки как у psycopg2 RealDictCursor (NUMERIC → Decimal, DATE → date)
+сериализуются тремя способами:
+
+- pydantic: DirectSQLResponse (response_model) → JSON, как FastAPI
+  сериализовал ответ раньше;
+- json: стандартный json.dumps с default для Decimal / date;
+- fast_json: FastJSONResponse (orjson, если установлен).
+
+    python bench_json.py --rows 1000 10000 50000 --repeat 5
+"""
+
+import argparse
+import datetime
+import json
+import statistics
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+import fast_json
+from sql_agent_fastapi import DirectSQLResponse
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    """Строки результата в формате RealDictCursor"""
+    return [
+        {
+            'track_id': i,
+            'track_name': f"Трек {i}",
+            'artist_name': f"Артист {i % 500}",
+            'label_name': "õzen",
+            'total_revenue': Decimal(f"{(i * 7919) % 100000 / 100:.2f}"),
+            'total_streams': (i * 104729) % 10_000_000,
+            'avg_rate': Decimal(f"0.00{(i % 9000) + 1000}"),
+            'month_date': datetime.date(2025, i % 12 + 1, 1),
+        }
+        for i in range(count)
+    ]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(type(value).__name__)
+
+
+SERIALIZERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    'pydantic': lambda payload: DirectSQLResponse(**payload).model_dump_json().encode('utf-8'),
+    'json': lambda payload: json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8'),
+    'fast_json': lambda payload: fast_json.FastJSONResponse(payload).body,
+}
+
+
+def measure(serializer: Callable, payload: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(serializer(payload))
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 2), 'min_ms': round(min(timings), 2), 'bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации ответов /api/direct-sql")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Куда сохранить JSON отчёт")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  ⏱️  СЕРИАЛИЗАЦИЯ ОТВЕТОВ /api/direct-sql")
+    print("=" * 80)
+    print(f"Бэкенд fast_json: {'orjson' if fast_json.orjson else 'json'}\n")
+    print(f"{'строк':>8} {'сериализатор':<12} {'медиана, ms':>12} {'мин, ms':>10} {'размер, KB':>11} {'×':>6}")
+
+    report = {}
+    for count in args.rows:
+        data = make_rows(count)
+        payload = {
+            "sql": "SELECT * FROM v_tracks_full", "success": True, "data": data,
+            "count": len(data), "error": None, "guard": None
+        }
+        results = {name: measure(fn, payload, args.repeat) for name, fn in SERIALIZERS.items()}
+        baseline = results['pydantic']['median_ms']
+        for name, result in results.items():
+            speedup = round(baseline / result['median_ms'], 1) if result['median_ms'] else None
+            result['speedup'] = speedup
+            print(f"{count:>8} {name:<12} {result['median_ms']:>12} {result['min_ms']:>10} "
+                  f"{result['bytes'] / 1024:>11.1f} {speedup:>6}")
+        report[count] = results
+
+    print("=" * 80)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта API агента
+
+- импорт: python -X importtime -c "import main" в отдельном процессе
+  (медиана по нескольким запускам) и самые дорогие модули;
+- --serve: запуск uvicorn main:app и время до первого ответа /ping
+  и до статуса healthy на /api/v1/health (агент прогрет).
+
+Отчёт можно сохранить и сравнивать между версиями:
+    python bench_startup.py --output startup.json
+    python bench_startup.py --serve --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Any, Optional
+
+import httpx
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """Строки 'import time: self | cumulative | module' → {модуль: {self_us, cumulative_us}}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules[name.strip()] = {'self_us': int(self_us), 'cumulative_us': int(cumulative_us)}
+    return modules
+
+
+def measure_import(module: str, runs: int, top: int) -> Dict[str, Any]:
+    """Время импорта module в чистом процессе"""
+    totals = []
+    modules = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, env=os.environ.copy()
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} завершился с ошибкой:\n{result.stderr[-2000:]}")
+        modules = parse_importtime(result.stderr)
+        totals.append(modules[module]['cumulative_us'] / 1000)
+
+    # Модули верхнего уровня этого импорта, отсортированные по суммарному времени
+    heaviest = sorted(modules.items(), key=lambda item: item[1]['cumulative_us'], reverse=True)
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': round(statistics.median(totals), 1),
+        'min_ms': round(min(totals), 1),
+        'modules_count': len(modules),
+        'heaviest': [
+            {'module': name, 'cumulative_ms': round(times['cumulative_us'] / 1000, 1)}
+            for name, times in heaviest[1:top + 1]
+        ]
+    }
+
+
+def wait_for(client: httpx.Client, url: str, predicate, deadline: float) -> Optional[float]:
+    """Опрашивать url, пока predicate(response) не станет истинным; время в секундах"""
+    while time.monotonic() < deadline:
+        try:
+            response = client.get(url)
+            if predicate(response):
+                return time.monotonic()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_serve(port: int, timeout: float) -> Dict[str, Any]:
+    """Время от запуска uvicorn до ответа /ping и до прогретого агента"""
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+        env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=2) as client:
+            deadline = start + timeout
+            ping = wait_for(client, f"{base_url}/ping", lambda r: r.status_code == 200, deadline)
+            healthy = wait_for(
+                client, f"{base_url}/api/v1/health",
+                lambda r: r.status_code == 200 and r.json().get('status') == 'healthy', deadline
+            )
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    return {
+        'first_ping_ms': round((ping - start) * 1000, 1) if ping else None,
+        'agent_ready_ms': round((healthy - start) * 1000, 1) if healthy else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта API агента")
+    parser.add_argument('--module', default='main', help="Какой модуль импортировать")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="Сколько самых дорогих модулей показать")
+    parser.add_argument('--serve', action='store_true', help="Замерить запуск uvicorn до /ping и /health")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="Куда сохранить JSON отчёт")
+    parser.add_argument('--baseline', help="Отчёт предыдущего замера для сравнения")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  🚀 ХОЛОДНЫЙ СТАРТ API")
+    print("=" * 80)
+
+    report = {'import': measure_import(args.module, args.runs, args.top)}
+    result = report['import']
+    print(f"import {args.module}: медиана {result['median_ms']} ms, мин {result['min_ms']} ms, "
+          f"модулей {result['modules_count']}")
+    for item in result['heaviest']:
+        print(f"   {item['cumulative_ms']:>9.1f} ms  {item['module']}")
+
+    if args.serve:
+        report['serve'] = measure_serve(args.port, args.timeout)
+        print(f"\nuvicorn → /ping: {report['serve']['first_ping_ms']} ms, "
+              f"агент прогрет: {report['serve']['agent_ready_ms']} ms")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        before = baseline['import']['median_ms']
+        after = report['import']['median_ms']
+        print(f"\n📊 Импорт: {before} → {after} ms ({(after - before) / before * 100:+.1f}%)")
+        if 'serve' in baseline and 'serve' in report and baseline['serve']['first_ping_ms'] and report['serve']['first_ping_ms']:
+            print(f"📊 До /ping: {baseline['serve']['first_ping_ms']} → {report['serve']['first_ping_ms']} ms")
+
+    print("=" * 80)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
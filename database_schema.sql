@@ -134,26 +134,114 @@ CREATE TABLE track_subscription_stats (
 );
 
 -- Помесячная статистика по трекам (из track_details.json)
+-- Секционирована по month_date: одна секция на месяц (см. create_monthly_partition)
 CREATE TABLE track_monthly_stats (
-    track_monthly_stat_id SERIAL PRIMARY KEY,
+    track_monthly_stat_id SERIAL,
     track_id INTEGER REFERENCES tracks(track_id),
     month_date DATE NOT NULL,
     streams BIGINT NOT NULL,
     revenue DECIMAL(15, 10) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (track_monthly_stat_id, month_date),
     UNIQUE(track_id, month_date)
-);
+) PARTITION BY RANGE (month_date);
+
+-- Строки за месяц без секции не теряются (см. create_monthly_partition)
+CREATE TABLE track_monthly_stats_default PARTITION OF track_monthly_stats DEFAULT;
 
 -- Помесячная статистика по артистам (из monthly_aggregated.json)
+-- Секционирована по month_date: одна секция на месяц (см. create_monthly_partition)
 CREATE TABLE artist_monthly_stats (
-    artist_monthly_stat_id SERIAL PRIMARY KEY,
+    artist_monthly_stat_id SERIAL,
     artist_id INTEGER REFERENCES artists(artist_id),
     month_date DATE NOT NULL,
     streams BIGINT NOT NULL,
     revenue DECIMAL(15, 10) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (artist_monthly_stat_id, month_date),
     UNIQUE(artist_id, month_date)
-);
+) PARTITION BY RANGE (month_date);
+
+CREATE TABLE artist_monthly_stats_default PARTITION OF artist_monthly_stats DEFAULT;
+
+
+-- Секционирование помесячной статистики
+-- =====================================================
+-- Секции создаются загрузчиком (load_data_to_db.py) перед вставкой
+-- данных нового месяца. Имя секции: <таблица>_YYYY_MM. Отсоединённая
+-- секция переименовывается в <секция>_detached_<время>; строки вне
+-- созданных секций попадают в секцию DEFAULT и переносятся в секцию
+-- месяца при её создании.
+
+-- Создать секцию для месяца (если она ещё не присоединена к родителю)
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent_table TEXT, month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month_start)::date;
+    end_date DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+    partition_name TEXT := parent_table || '_' || to_char(start_date, 'YYYY_MM');
+    default_name TEXT := parent_table || '_default';
+BEGIN
+    -- Проверяем именно присоединённые секции: таблица с таким именем могла
+    -- остаться после DETACH и не принимает строки родителя
+    IF EXISTS (
+        SELECT 1
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent_table::regclass
+          AND c.relname = partition_name
+    ) THEN
+        RETURN partition_name;
+    END IF;
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RAISE EXCEPTION 'Таблица % существует, но не является секцией %', partition_name, parent_table
+            USING HINT = 'Переименуйте или удалите отсоединённую таблицу';
+    END IF;
+
+    -- Секция создаётся отдельно и присоединяется после переноса строк месяца
+    -- из DEFAULT: иначе ATTACH упадёт на строках, попавших туда раньше
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   partition_name, parent_table);
+    IF to_regclass(default_name) IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE month_date >= %L AND month_date < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            default_name, start_date, end_date, partition_name
+        );
+    END IF;
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent_table, partition_name, start_date, end_date);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Отсоединить секции за месяцы раньше older_than (данные остаются в
+-- отдельных таблицах <секция>_detached_<время>)
+CREATE OR REPLACE FUNCTION detach_monthly_partitions(parent_table TEXT, older_than DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    part RECORD;
+    archived_name TEXT;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent_table::regclass
+          AND c.relname ~ ('^' || parent_table || '_[0-9]{4}_[0-9]{2}$')
+        ORDER BY c.relname
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY_MM') < date_trunc('month', older_than) THEN
+            archived_name := part.relname || '_detached_' || to_char(clock_timestamp(), 'YYYYMMDDHH24MISS');
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent_table, part.relname);
+            -- Имя секции освобождается: повторная загрузка месяца создаст новую
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', part.relname, archived_name);
+            RETURN NEXT archived_name;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
 
 
 -- Связующие таблицы (Many-to-Many)
@@ -190,23 +278,31 @@ CREATE TABLE artist_countries (
 
 -- Индексы для оптимизации запросов
 -- =====================================================
+-- Набор индексов подобран под запросы SQL агента: JOIN
+-- artists → tracks → track_platform_stats → platforms с фильтрами
+-- ILIKE по artist_name/track_name и помесячные выборки по артисту.
+
+-- Триграммы для ILIKE '%...%' по именам
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Индексы для треков
-CREATE INDEX idx_tracks_artist_id ON tracks(artist_id);
+CREATE INDEX idx_tracks_artist_id ON tracks(artist_id) INCLUDE (track_id, track_name);
 CREATE INDEX idx_tracks_label_id ON tracks(label_id);
 CREATE INDEX idx_tracks_name ON tracks(track_name);
+CREATE INDEX idx_tracks_name_trgm ON tracks USING GIN (track_name gin_trgm_ops);
 
 -- Индексы для артистов
 CREATE INDEX idx_artists_label_id ON artists(label_id);
 CREATE INDEX idx_artists_name ON artists(artist_name);
+CREATE INDEX idx_artists_name_trgm ON artists USING GIN (artist_name gin_trgm_ops);
 
 -- Индексы для агрегатов треков
-CREATE INDEX idx_track_aggregates_track_id ON track_aggregates(track_id);
+CREATE INDEX idx_track_aggregates_track_id ON track_aggregates(track_id) INCLUDE (total_revenue, total_streams, avg_rate);
 CREATE INDEX idx_track_aggregates_revenue ON track_aggregates(total_revenue DESC);
 CREATE INDEX idx_track_aggregates_streams ON track_aggregates(total_streams DESC);
 
 -- Индексы для агрегатов артистов
-CREATE INDEX idx_artist_aggregates_artist_id ON artist_aggregates(artist_id);
+CREATE INDEX idx_artist_aggregates_artist_id ON artist_aggregates(artist_id) INCLUDE (total_revenue, total_streams, tracks_count);
 CREATE INDEX idx_artist_aggregates_revenue ON artist_aggregates(total_revenue DESC);
 CREATE INDEX idx_artist_aggregates_streams ON artist_aggregates(total_streams DESC);
 
@@ -214,17 +310,16 @@ CREATE INDEX idx_artist_aggregates_streams ON artist_aggregates(total_streams DE
 CREATE INDEX idx_platform_aggregates_platform_id ON platform_aggregates(platform_id);
 CREATE INDEX idx_platform_aggregates_revenue ON platform_aggregates(total_revenue DESC);
 
--- Индексы для детальной статистики
-CREATE INDEX idx_track_platform_stats_track_id ON track_platform_stats(track_id);
-CREATE INDEX idx_track_platform_stats_platform_id ON track_platform_stats(platform_id);
-CREATE INDEX idx_track_country_stats_track_id ON track_country_stats(track_id);
-CREATE INDEX idx_track_country_stats_country_id ON track_country_stats(country_id);
+-- Покрывающие индексы для детальной статистики (index-only scan для SUM)
+CREATE INDEX idx_track_platform_stats_track_cover ON track_platform_stats(track_id) INCLUDE (platform_id, streams, revenue);
+CREATE INDEX idx_track_platform_stats_platform_track ON track_platform_stats(platform_id, track_id) INCLUDE (streams, revenue);
+CREATE INDEX idx_track_country_stats_track_cover ON track_country_stats(track_id) INCLUDE (country_id, streams, revenue);
+CREATE INDEX idx_track_country_stats_country_track ON track_country_stats(country_id, track_id) INCLUDE (streams, revenue);
 
 -- Индексы для помесячной статистики
-CREATE INDEX idx_track_monthly_stats_track_id ON track_monthly_stats(track_id);
-CREATE INDEX idx_track_monthly_stats_month ON track_monthly_stats(month_date);
-CREATE INDEX idx_artist_monthly_stats_artist_id ON artist_monthly_stats(artist_id);
-CREATE INDEX idx_artist_monthly_stats_month ON artist_monthly_stats(month_date);
+-- (фильтр по month_date обрабатывается отсечением секций, отдельный индекс не нужен)
+CREATE INDEX idx_track_monthly_stats_track_month ON track_monthly_stats(track_id, month_date) INCLUDE (streams, revenue);
+CREATE INDEX idx_artist_monthly_stats_artist_month ON artist_monthly_stats(artist_id, month_date) INCLUDE (streams, revenue);
 
 
 -- Представления (Views) для удобных запросов
@@ -264,9 +359,10 @@ FROM artists a
 JOIN labels l ON a.label_id = l.label_id
 LEFT JOIN artist_aggregates aa ON a.artist_id = aa.artist_id;
 
--- Топ треков по выручке
-CREATE VIEW v_top_tracks_by_revenue AS
+-- Топ треков по выручке (материализованное представление)
+CREATE MATERIALIZED VIEW mv_top_tracks_by_revenue AS
 SELECT 
+    t.track_id,
     t.track_name,
     a.artist_name,
     l.label_name,
@@ -276,12 +372,12 @@ SELECT
 FROM tracks t
 JOIN artists a ON t.artist_id = a.artist_id
 JOIN labels l ON t.label_id = l.label_id
-JOIN track_aggregates ta ON t.track_id = ta.track_id
-ORDER BY ta.total_revenue DESC;
+JOIN track_aggregates ta ON t.track_id = ta.track_id;
 
--- Топ артистов по выручке
-CREATE VIEW v_top_artists_by_revenue AS
+-- Топ артистов по выручке (материализованное представление)
+CREATE MATERIALIZED VIEW mv_top_artists_by_revenue AS
 SELECT 
+    a.artist_id,
     a.artist_name,
     l.label_name,
     aa.total_revenue,
@@ -290,8 +386,7 @@ SELECT
     aa.avg_revenue_per_track
 FROM artists a
 JOIN labels l ON a.label_id = l.label_id
-JOIN artist_aggregates aa ON a.artist_id = aa.artist_id
-ORDER BY aa.total_revenue DESC;
+JOIN artist_aggregates aa ON a.artist_id = aa.artist_id;
 
 -- Топ платформ по выручке
 CREATE VIEW v_top_platforms_by_revenue AS
@@ -306,9 +401,10 @@ FROM platforms p
 JOIN platform_aggregates pa ON p.platform_id = pa.platform_id
 ORDER BY pa.total_revenue DESC;
 
--- Помесячная динамика по артистам
-CREATE VIEW v_artist_monthly_trends AS
+-- Помесячная динамика по артистам (материализованное представление)
+CREATE MATERIALIZED VIEW mv_artist_monthly_trends AS
 SELECT 
+    a.artist_id,
     a.artist_name,
     l.label_name,
     ams.month_date,
@@ -316,12 +412,12 @@ SELECT
     ams.revenue
 FROM artist_monthly_stats ams
 JOIN artists a ON ams.artist_id = a.artist_id
-JOIN labels l ON a.label_id = l.label_id
-ORDER BY a.artist_name, ams.month_date;
+JOIN labels l ON a.label_id = l.label_id;
 
--- Помесячная динамика по трекам
-CREATE VIEW v_track_monthly_trends AS
+-- Помесячная динамика по трекам (материализованное представление)
+CREATE MATERIALIZED VIEW mv_track_monthly_trends AS
 SELECT 
+    t.track_id,
     t.track_name,
     a.artist_name,
     tms.month_date,
@@ -329,8 +425,43 @@ SELECT
     tms.revenue
 FROM track_monthly_stats tms
 JOIN tracks t ON tms.track_id = t.track_id
-JOIN artists a ON t.artist_id = a.artist_id
-ORDER BY t.track_name, tms.month_date;
+JOIN artists a ON t.artist_id = a.artist_id;
+
+-- Индексы для материализованных представлений
+-- (уникальные индексы нужны для REFRESH MATERIALIZED VIEW CONCURRENTLY)
+CREATE UNIQUE INDEX idx_mv_top_tracks_track_id ON mv_top_tracks_by_revenue(track_id);
+CREATE INDEX idx_mv_top_tracks_revenue ON mv_top_tracks_by_revenue(total_revenue DESC);
+CREATE INDEX idx_mv_top_tracks_artist ON mv_top_tracks_by_revenue(artist_name);
+
+CREATE UNIQUE INDEX idx_mv_top_artists_artist_id ON mv_top_artists_by_revenue(artist_id);
+CREATE INDEX idx_mv_top_artists_revenue ON mv_top_artists_by_revenue(total_revenue DESC);
+
+CREATE UNIQUE INDEX idx_mv_artist_monthly_key ON mv_artist_monthly_trends(artist_id, month_date);
+CREATE INDEX idx_mv_artist_monthly_name ON mv_artist_monthly_trends(artist_name, month_date);
+
+CREATE UNIQUE INDEX idx_mv_track_monthly_key ON mv_track_monthly_trends(track_id, month_date);
+CREATE INDEX idx_mv_track_monthly_name ON mv_track_monthly_trends(track_name, month_date);
+
+-- Представления поверх материализованных (прежние имена и порядок сортировки)
+CREATE VIEW v_top_tracks_by_revenue AS
+SELECT track_name, artist_name, label_name, total_revenue, total_streams, avg_rate
+FROM mv_top_tracks_by_revenue
+ORDER BY total_revenue DESC;
+
+CREATE VIEW v_top_artists_by_revenue AS
+SELECT artist_name, label_name, total_revenue, total_streams, tracks_count, avg_revenue_per_track
+FROM mv_top_artists_by_revenue
+ORDER BY total_revenue DESC;
+
+CREATE VIEW v_artist_monthly_trends AS
+SELECT artist_name, label_name, month_date, streams, revenue
+FROM mv_artist_monthly_trends
+ORDER BY artist_name, month_date;
+
+CREATE VIEW v_track_monthly_trends AS
+SELECT track_name, artist_name, month_date, streams, revenue
+FROM mv_track_monthly_trends
+ORDER BY track_name, month_date;
 
 
 -- Комментарии к таблицам
@@ -350,11 +481,16 @@ COMMENT ON TABLE platform_aggregates IS 'Агрегированная стати
 COMMENT ON TABLE track_platform_stats IS 'Детальная статистика: трек + платформа';
 COMMENT ON TABLE track_country_stats IS 'Детальная статистика: трек + страна';
 COMMENT ON TABLE track_subscription_stats IS 'Детальная статистика: трек + тип подписки';
-COMMENT ON TABLE track_monthly_stats IS 'Помесячная статистика по трекам';
-COMMENT ON TABLE artist_monthly_stats IS 'Помесячная статистика по артистам';
+COMMENT ON TABLE track_monthly_stats IS 'Помесячная статистика по трекам (секции по месяцам)';
+COMMENT ON TABLE artist_monthly_stats IS 'Помесячная статистика по артистам (секции по месяцам)';
 
 COMMENT ON VIEW v_tracks_full IS 'Полная информация о треках с агрегатами';
 COMMENT ON VIEW v_artists_full IS 'Полная информация об артистах с агрегатами';
 COMMENT ON VIEW v_top_tracks_by_revenue IS 'Топ треков по выручке';
 COMMENT ON VIEW v_top_artists_by_revenue IS 'Топ артистов по выручке';
 COMMENT ON VIEW v_top_platforms_by_revenue IS 'Топ платформ по выручке';
+
+COMMENT ON MATERIALIZED VIEW mv_top_tracks_by_revenue IS 'Треки с агрегатами (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_top_artists_by_revenue IS 'Артисты с агрегатами (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_artist_monthly_trends IS 'Помесячная динамика по артистам (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_track_monthly_trends IS 'Помесячная динамика по трекам (обновляется после загрузки данных)';
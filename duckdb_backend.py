@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Встроенный аналитический бэкенд на DuckDB поверх Parquet снапшотов
+
+precalc_data.py пишет таблицы схемы (labels, artists, tracks, *_aggregates,
+*_stats) в precalc_data/parquet/*.parquet. DuckDB читает их напрямую
+(колоночные векторизованные сканы), а поверх создаются те же представления,
+что и в database_schema.sql - SQL агент работает без PostgreSQL, без
+отдельной загрузки данных и без сетевых запросов.
+
+Включается в SQL агенте переменной окружения SQL_BACKEND=duckdb.
+Требует пакет duckdb (pip install duckdb).
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Any
+
+DEFAULT_SNAPSHOT_DIR = os.getenv("PARQUET_SNAPSHOT_DIR", "precalc_data/parquet")
+
+# Представления из database_schema.sql (материализованные mv_* здесь не нужны -
+# сканы Parquet и так колоночные)
+VIEWS = {
+    'v_tracks_full': """
+        SELECT t.track_id, t.track_name, a.artist_name, l.label_name,
+               ta.total_revenue, ta.total_streams, ta.avg_rate,
+               ta.platforms_count, ta.countries_count
+        FROM tracks t
+        JOIN artists a ON t.artist_id = a.artist_id
+        JOIN labels l ON t.label_id = l.label_id
+        LEFT JOIN track_aggregates ta ON t.track_id = ta.track_id
+    """,
+    'v_artists_full': """
+        SELECT a.artist_id, a.artist_name, l.label_name,
+               aa.total_revenue, aa.total_streams, aa.tracks_count, aa.avg_rate,
+               aa.avg_revenue_per_track, aa.platforms_count, aa.countries_count
+        FROM artists a
+        JOIN labels l ON a.label_id = l.label_id
+        LEFT JOIN artist_aggregates aa ON a.artist_id = aa.artist_id
+    """,
+    'v_top_platforms_by_revenue': """
+        SELECT p.platform_name, pa.total_revenue, pa.total_streams,
+               pa.tracks_count, pa.artists_count, pa.avg_rate
+        FROM platforms p
+        JOIN platform_aggregates pa ON p.platform_id = pa.platform_id
+        ORDER BY pa.total_revenue DESC
+    """,
+    'v_top_tracks_by_revenue': """
+        SELECT t.track_name, a.artist_name, l.label_name,
+               ta.total_revenue, ta.total_streams, ta.avg_rate
+        FROM tracks t
+        JOIN artists a ON t.artist_id = a.artist_id
+        JOIN labels l ON t.label_id = l.label_id
+        JOIN track_aggregates ta ON t.track_id = ta.track_id
+        ORDER BY ta.total_revenue DESC
+    """,
+    'v_top_artists_by_revenue': """
+        SELECT a.artist_name, l.label_name, aa.total_revenue, aa.total_streams,
+               aa.tracks_count, aa.avg_revenue_per_track
+        FROM artists a
+        JOIN labels l ON a.label_id = l.label_id
+        JOIN artist_aggregates aa ON a.artist_id = aa.artist_id
+        ORDER BY aa.total_revenue DESC
+    """,
+    'v_artist_monthly_trends': """
+        SELECT a.artist_name, l.label_name, ams.month_date, ams.streams, ams.revenue
+        FROM artist_monthly_stats ams
+        JOIN artists a ON ams.artist_id = a.artist_id
+        JOIN labels l ON a.label_id = l.label_id
+        ORDER BY a.artist_name, ams.month_date
+    """,
+    'v_track_monthly_trends': """
+        SELECT t.track_name, a.artist_name, tms.month_date, tms.streams, tms.revenue
+        FROM track_monthly_stats tms
+        JOIN tracks t ON tms.track_id = t.track_id
+        JOIN artists a ON t.artist_id = a.artist_id
+        ORDER BY t.track_name, tms.month_date
+    """,
+}
+
+
+class DuckDBBackend:
+    """
+    In-process SQL движок над Parquet снапшотами
+
+    Args:
+        snapshot_dir: каталог с <таблица>.parquet
+        threads: число потоков DuckDB (по умолчанию - все ядра)
+    """
+
+    def __init__(self, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR, threads: int = None):
+        import duckdb
+
+        self.snapshot_dir = Path(snapshot_dir)
+        files = sorted(self.snapshot_dir.glob("*.parquet"))
+        if not files:
+            raise FileNotFoundError(
+                f"Parquet снапшоты не найдены в {self.snapshot_dir} (запустите precalc_data.py)"
+            )
+
+        self.conn = duckdb.connect(database=':memory:')
+        if threads:
+            self.conn.execute(f"SET threads = {int(threads)}")
+        # Метаданные Parquet файлов кэшируются между запросами
+        self.conn.execute("SET enable_object_cache = true")
+
+        self.tables = []
+        for path in files:
+            path_literal = str(path).replace("'", "''")
+            self.conn.execute(f'CREATE VIEW "{path.stem}" AS SELECT * FROM read_parquet(\'{path_literal}\')')
+            self.tables.append(path.stem)
+
+        self.views = []
+        for name, sql in VIEWS.items():
+            try:
+                self.conn.execute(f"CREATE VIEW {name} AS {sql}")
+                self.views.append(name)
+            except Exception as e:
+                # Снапшот неполный (нет одной из таблиц) - представление пропускаем
+                print(f"⚠️  Представление {name} не создано: {e}")
+
+        self._lock_down()
+
+    def _lock_down(self):
+        """
+        Запретить запросам доступ к файлам вне каталога снапшотов
+
+        SQL приходит от LLM и из /api/direct-sql, а табличные функции
+        DuckDB (read_text, read_csv, glob, ...) читают любые локальные
+        файлы. Представления над Parquet продолжают работать: каталог
+        снапшотов остаётся в allowed_directories. lock_configuration не
+        даёт запросу вернуть настройки через SET.
+        """
+        directory = str(self.snapshot_dir.resolve()).replace("'", "''")
+        self.conn.execute(f"SET allowed_directories = ['{directory}/']")
+        self.conn.execute("SET enable_external_access = false")
+        self.conn.execute("SET lock_configuration = true")
+
+    def execute(self, sql: str) -> List[Dict[str, Any]]:
+        """
+        Выполнить запрос
+
+        Returns:
+            Строки результата как список словарей (как RealDictCursor)
+        """
+        # Отдельный курсор на запрос: соединение DuckDB нельзя делить между потоками
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def schema(self) -> Dict[str, List[str]]:
+        """{таблица/представление: [колонки]} для промпта SQL агента"""
+        rows = self.execute("""
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'main'
+            ORDER BY table_name, ordinal_position
+        """)
+        schema: Dict[str, List[str]] = {}
+        for row in rows:
+            schema.setdefault(row['table_name'], []).append(row['column_name'])
+        return schema
+
+    def row_counts(self) -> Dict[str, int]:
+        """Число строк в каждой таблице снапшота"""
+        return {
+            table: self.execute(f'SELECT COUNT(*) AS count FROM "{table}"')[0]['count']
+            for table in self.tables
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_duckdb_backend() -> DuckDBBackend:
+    """Общий экземпляр бэкенда (создаётся при первом обращении)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = DuckDBBackend(threads=int(os.getenv("DUCKDB_THREADS", "0")) or None)
+    return _backend
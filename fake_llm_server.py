@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Локальный фейковый LLM сервер (OpenAI-совместимый) для нагрузочных тестов
+
+Отвечает на POST /v1/chat/completions с заданной задержкой, имитируя LLM
+без затрат на API:
+- запрос с tools (агент) → сначала вызовы инструментов по сценарию,
+  после ответов инструментов - итоговый текст;
+- запрос без tools (SQL агент, Alem) → JSON {"sql": ..., "explanation": ...};
+- "stream": true → ответ чанками (SSE) с задержкой на токен.
+
+Пример:
+    python fake_llm_server.py --port 9100 --latency-ms 800 --script fake_llm_script.json
+
+    # API агента против фейкового сервера
+    OPENAI_BASE_URL=http://localhost:9100/v1 OPENAI_API_KEY=sk-fake python main.py
+
+    # SQL агент против фейкового сервера
+    ALEM_API_URL=http://localhost:9100/v1/chat/completions ALEM_API_KEY=fake python sql_agent_fastapi.py
+
+Формат сценария (JSON, все поля необязательны):
+    {
+        "tool_calls": [{"match": "сравни", "calls": [{"name": "compare_artists",
+                        "args": {"artist1": "Yenlik", "artist2": "Shiza"}}]}],
+        "default_tool_calls": [{"name": "get_summary_stats", "args": {}}],
+        "sql": [{"match": "spotify", "sql": "SELECT ..."}],
+        "default_sql": "SELECT * FROM v_top_tracks_by_revenue LIMIT 10",
+        "answer": "Текст итогового ответа"
+    }
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, Any, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Fake LLM Server")
+
+# Параметры (переопределяются аргументами командной строки)
+LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "20"))
+
+DEFAULT_SCRIPT = {
+    "tool_calls": [
+        {"match": "сравни", "calls": [
+            {"name": "compare_artists", "args": {"artist1": "Yenlik", "artist2": "Shiza"}},
+            {"name": "get_artist_timeline", "args": {"artist_name": "Yenlik"}},
+            {"name": "get_artist_timeline", "args": {"artist_name": "Shiza"}}
+        ]},
+        {"match": "вирус", "calls": [{"name": "get_viral_tracks", "args": {"threshold": 10.0}}]}
+    ],
+    "default_tool_calls": [{"name": "get_top_tracks", "args": {"limit": 5, "sort_by": "revenue"}}],
+    "sql": [
+        {"match": "spotify", "sql": "SELECT a.artist_name, p.platform_name, SUM(tps.revenue) AS total_revenue FROM artists a JOIN tracks t ON a.artist_id = t.artist_id JOIN track_platform_stats tps ON t.track_id = tps.track_id JOIN platforms p ON tps.platform_id = p.platform_id WHERE p.platform_name ILIKE 'Spotify' GROUP BY a.artist_name, p.platform_name"}
+    ],
+    "default_sql": "SELECT * FROM v_top_tracks_by_revenue LIMIT 10",
+    "answer": "Это тестовый ответ фейкового LLM сервера: данные получены, топ треков выше."
+}
+
+SCRIPT: Dict[str, Any] = dict(DEFAULT_SCRIPT)
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            return message["content"].lower()
+    return ""
+
+
+def _scripted_calls(question: str) -> List[Dict[str, Any]]:
+    for rule in SCRIPT.get("tool_calls", []):
+        if rule["match"].lower() in question:
+            return rule["calls"]
+    return SCRIPT.get("default_tool_calls", [])
+
+
+def _scripted_sql(question: str) -> str:
+    for rule in SCRIPT.get("sql", []):
+        if rule["match"].lower() in question:
+            return rule["sql"]
+    return SCRIPT["default_sql"]
+
+
+def build_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Сообщение ассистента по сценарию: content и/или tool_calls"""
+    messages = body.get("messages", [])
+    question = _last_user_text(messages)
+
+    if body.get("tools"):
+        # Инструменты уже отработали - отдаём итоговый ответ
+        if messages and messages[-1].get("role") == "tool":
+            return {"role": "assistant", "content": SCRIPT["answer"]}
+        calls = [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["args"], ensure_ascii=False)}
+            }
+            for call in _scripted_calls(question)
+        ]
+        if calls:
+            return {"role": "assistant", "content": None, "tool_calls": calls}
+        return {"role": "assistant", "content": SCRIPT["answer"]}
+
+    # NL → SQL (SQL агент ждёт JSON в тексте ответа)
+    content = json.dumps(
+        {"sql": _scripted_sql(question), "explanation": "Сценарный SQL фейкового сервера"},
+        ensure_ascii=False
+    )
+    return {"role": "assistant", "content": content}
+
+
+async def _sleep_latency():
+    delay = LATENCY_MS + (random.uniform(-JITTER_MS, JITTER_MS) if JITTER_MS else 0)
+    await asyncio.sleep(max(0.0, delay) / 1000)
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _stream_reply(completion_id: str, model: str, reply: Dict[str, Any]):
+    """Ответ чанками в формате OpenAI streaming"""
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+    if reply.get("tool_calls"):
+        for index, call in enumerate(reply["tool_calls"]):
+            await asyncio.sleep(TOKEN_MS / 1000)
+            yield _chunk(completion_id, model, {"tool_calls": [{"index": index, **call}]})
+        yield _chunk(completion_id, model, {}, "tool_calls")
+    else:
+        for token in (reply.get("content") or "").split(" "):
+            await asyncio.sleep(TOKEN_MS / 1000)
+            yield _chunk(completion_id, model, {"content": token + " "})
+        yield _chunk(completion_id, model, {}, "stop")
+
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Имитация OpenAI Chat Completions"""
+    body = await request.json()
+    reply = build_reply(body)
+    model = body.get("model", "fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    await _sleep_latency()
+
+    if body.get("stream"):
+        return StreamingResponse(_stream_reply(completion_id, model, reply), media_type="text/event-stream")
+
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": reply,
+            "finish_reason": "tool_calls" if reply.get("tool_calls") else "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+
+
+def main():
+    global LATENCY_MS, JITTER_MS, TOKEN_MS, SCRIPT
+
+    parser = argparse.ArgumentParser(description="Фейковый OpenAI-совместимый LLM сервер")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency-ms', type=float, default=LATENCY_MS, help="Задержка ответа, мс")
+    parser.add_argument('--jitter-ms', type=float, default=JITTER_MS, help="Случайный разброс задержки, ±мс")
+    parser.add_argument('--token-ms', type=float, default=TOKEN_MS, help="Задержка на токен при стриминге, мс")
+    parser.add_argument('--script', help="JSON файл со сценарием ответов")
+    args = parser.parse_args()
+
+    LATENCY_MS = args.latency_ms
+    JITTER_MS = args.jitter_ms
+    TOKEN_MS = args.token_ms
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            SCRIPT = {**DEFAULT_SCRIPT, **json.load(f)}
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
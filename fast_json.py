@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Быстрая JSON сериализация ответов API и результатов инструментов
+
+Использует orjson (сериализация в C, datetime/date/UUID/numpy нативно),
+если он установлен, иначе - стандартный json с компактными разделителями.
+Значения, которых нет в JSON, приводятся одинаково в обоих режимах:
+
+- Decimal (NUMERIC из psycopg2) → число;
+- date / datetime / time → ISO строка;
+- timedelta (INTERVAL) → секунды;
+- Mapping (записи records.py) → объект; set / tuple → массив;
+- прочее → str(value).
+"""
+
+import datetime
+import json
+import uuid
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def _default(value: Any) -> Any:
+    """Приведение значений, которые сериализатор не знает"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, 'item'):
+        # numpy скаляр без orjson
+        return value.item()
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """JSON в UTF-8 байтах (без пробелов, кириллица без экранирования)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        value, ensure_ascii=False, separators=(',', ':'), default=_default
+    ).encode('utf-8')
+
+
+def dumps_str(value: Any) -> str:
+    """JSON строкой (для промпта LLM и SSE событий)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse через dumps()
+
+    Ответ, возвращённый из обработчика напрямую, FastAPI не прогоняет
+    через response_model - большие списки строк (data) не валидируются
+    pydantic повторно.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
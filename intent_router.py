@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Детерминированный роутер частых вопросов (fast path без LLM)
+
+Вопрос сопоставляется с шаблонами на русском и английском. Если вопрос
+целиком совпадает с шаблоном (топ треков/артистов, сводка, платформы,
+страны, вирусные треки, динамика или сравнение артистов), ответ строится
+напрямую из AnalyticsTools (агент) или из SQL шаблона (SQL агент).
+При любой неуверенности возвращается None и запрос уходит в LLM.
+"""
+
+import re
+from typing import Dict, Any, Optional, List
+
+from answer_cache import normalize_question
+
+# Префиксы-глаголы, которые не меняют смысл вопроса
+_VERB = r"(?:(?:покажи|выведи|дай|какие|какой|show|list|give me|what are)(?: мне| me)?\s+)?"
+_TOP = r"(?:топ|top)[\s-]*(?P<limit>\d+)?\s*"
+_SORT = r"(?:\s+(?:по|by)\s+(?P<sort>доходу|выручке|заработку|стримам|прослушиваниям|revenue|income|earnings|streams|plays))?"
+
+_TRACKS = r"(?:треков|трека|треки|песен|песни|tracks|songs)"
+_ARTISTS = r"(?:артистов|артиста|артисты|исполнителей|исполнители|artists)"
+
+_PATTERNS = [
+    ('top_tracks', re.compile(rf"^{_VERB}{_TOP}{_TRACKS}{_SORT}$")),
+    ('top_tracks', re.compile(rf"^{_VERB}(?:самые популярные|most popular) {_TRACKS}(?P<streams>)$")),
+    ('top_artists', re.compile(rf"^{_VERB}{_TOP}{_ARTISTS}{_SORT}$")),
+    ('top_artists', re.compile(rf"^{_VERB}(?:самые популярные|most popular) {_ARTISTS}(?P<streams>)$")),
+    ('summary_stats', re.compile(
+        rf"^{_VERB}(?:общ(?:ая|ую) статистик[ау]|сводк[ау]|обзор(?: данных)?|summary|overview|general stat(?:istic)?s)$"
+    )),
+    ('platform_stats', re.compile(
+        rf"^{_VERB}(?:статистик[ау] )?по (?:всем )?платформам$|^{_VERB}(?:stats|statistics) (?:by|for all) platforms$"
+    )),
+    ('country_stats', re.compile(
+        rf"^{_VERB}(?:статистик[ау] )?по (?:всем )?странам$|^{_VERB}(?:stats|statistics) (?:by|for all) countries$"
+    )),
+    ('viral_tracks', re.compile(
+        rf"^{_VERB}(?:треки стали вирусными|вирусные треки|viral tracks)$"
+    )),
+    ('artist_timeline', re.compile(
+        rf"^{_VERB}(?:динамик[ау]|статистик[ау] по месяцам) (?:артиста |исполнителя )?(?P<name>.+)$"
+    )),
+    ('artist_timeline', re.compile(
+        rf"^{_VERB}(?:monthly )?(?:timeline|trend|trends) (?:for|of) (?:artist )?(?P<name>.+)$"
+    )),
+    ('compare_artists', re.compile(r"^сравни(?:ть)? (?:артистов )?(?P<a>.+?) и (?P<b>.+)$")),
+    ('compare_artists', re.compile(r"^compare (?:artists )?(?P<a>.+?) (?:and|with|vs\.?) (?P<b>.+)$")),
+]
+
+_STREAMS_WORDS = {'стримам', 'прослушиваниям', 'streams', 'plays'}
+
+# Верхняя граница лимита для fast path
+MAX_LIMIT = 50
+
+
+def route_question(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Определить намерение вопроса
+
+    Returns:
+        {'intent': ..., 'params': {...}} или None, если вопрос не распознан
+    """
+    text = normalize_question(question)
+
+    for intent, pattern in _PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+
+        groups = match.groupdict()
+        params: Dict[str, Any] = {}
+
+        if intent in ('top_tracks', 'top_artists'):
+            params['limit'] = min(int(groups.get('limit') or 10), MAX_LIMIT)
+            sort = groups.get('sort')
+            streams = sort in _STREAMS_WORDS or groups.get('streams') is not None
+            params['sort_by'] = 'streams' if streams else 'revenue'
+        elif intent == 'artist_timeline':
+            params['artist_name'] = groups['name'].strip()
+        elif intent == 'compare_artists':
+            params['artist1'] = groups['a'].strip()
+            params['artist2'] = groups['b'].strip()
+
+        return {'intent': intent, 'params': params}
+
+    return None
+
+
+# ============================================================================
+# Fast path для агента (AnalyticsTools)
+# ============================================================================
+
+def _money(value: float) -> str:
+    return f"€{value:,.2f}"
+
+
+def _count(value: float) -> str:
+    return f"{int(value):,}".replace(',', ' ')
+
+
+def _sort_label(sort_by: str) -> str:
+    return 'стримам' if sort_by == 'streams' else 'доходу'
+
+
+def _answer_top_tracks(tools, limit: int, sort_by: str) -> Optional[str]:
+    tracks = tools.get_top_tracks(limit, sort_by)
+    if not tracks:
+        return None
+    lines = [f"Топ-{len(tracks)} треков по {_sort_label(sort_by)}:"]
+    for i, t in enumerate(tracks, 1):
+        lines.append(f"{i}. {t['track']} — {t['artist']}: {_money(t['revenue'])}, {_count(t['streams'])} стримов")
+    return '\n'.join(lines)
+
+
+def _answer_top_artists(tools, limit: int, sort_by: str) -> Optional[str]:
+    artists = tools.get_top_artists(limit, sort_by)
+    if not artists:
+        return None
+    lines = [f"Топ-{len(artists)} артистов по {_sort_label(sort_by)}:"]
+    for i, a in enumerate(artists, 1):
+        lines.append(
+            f"{i}. {a['artist']}: {_money(a['revenue'])}, {_count(a['streams'])} стримов, "
+            f"{a['tracks_count']} треков"
+        )
+    return '\n'.join(lines)
+
+
+def _answer_summary_stats(tools) -> Optional[str]:
+    summary = tools.get_summary_stats()
+    stats = summary['metadata']['stats']
+    lines = [
+        "Общая статистика:",
+        f"• Доход: {_money(stats['total_revenue'])}",
+        f"• Стримы: {_count(stats['total_streams'])}",
+        f"• Треков: {_count(stats['unique_tracks'])}, артистов: {_count(stats['unique_artists'])}",
+        f"• Платформ: {stats['unique_platforms']}, стран: {stats['unique_countries']}",
+        "",
+        "Топ-5 треков:"
+    ]
+    for i, t in enumerate(summary['top_5_tracks'], 1):
+        lines.append(f"{i}. {t['track']} — {t['artist']}: {_money(t['revenue'])}")
+    lines.append("")
+    lines.append("Топ-5 артистов:")
+    for i, a in enumerate(summary['top_5_artists'], 1):
+        lines.append(f"{i}. {a['artist']}: {_money(a['revenue'])}")
+    return '\n'.join(lines)
+
+
+def _answer_breakdown(title: str, items: List[Dict], name_key: str) -> Optional[str]:
+    if not items:
+        return None
+    lines = [title]
+    for i, item in enumerate(items, 1):
+        lines.append(f"{i}. {item[name_key]}: {_money(item['revenue'])}, {_count(item['streams'])} стримов")
+    return '\n'.join(lines)
+
+
+def _answer_viral_tracks(tools) -> Optional[str]:
+    viral = tools.get_viral_tracks()
+    if not viral:
+        return "Вирусных треков (коэффициент ≥ 10) не найдено."
+    lines = [f"Вирусные треки (коэффициент ≥ 10): {len(viral)}"]
+    for i, v in enumerate(viral[:10], 1):
+        lines.append(
+            f"{i}. {v['track']} — {v['artist']}: коэффициент {v['virality_coefficient']:.1f}, "
+            f"пик {_count(v['max_streams'])} стримов"
+        )
+    if len(viral) > 10:
+        lines.append(f"... и ещё {len(viral) - 10}")
+    return '\n'.join(lines)
+
+
+def _answer_artist_timeline(tools, artist_name: str) -> Optional[str]:
+    timeline = tools.get_artist_timeline(artist_name)
+    artists = {entry['artist'] for entry in timeline}
+    # Несколько совпадений по подстроке - пусть разбирается LLM
+    if len(artists) != 1:
+        return None
+    lines = [f"Динамика {artists.pop()} по месяцам:"]
+    for entry in timeline:
+        lines.append(f"• {entry['month']}: {_count(entry['streams'])} стримов, {_money(entry['revenue'])}")
+    return '\n'.join(lines)
+
+
+def _unique_artist(tools, name: str) -> Optional[str]:
+    """Полное имя артиста, если подстрока name совпадает ровно с одним"""
+    artists = {artist['artist'] for artist in tools.search_artist(name)}
+    return artists.pop() if len(artists) == 1 else None
+
+
+def _answer_compare_artists(tools, artist1: str, artist2: str) -> Optional[str]:
+    # compare_artists берёт последнее совпадение по подстроке - при
+    # неоднозначном имени отвечать уверенно нельзя, пусть разбирается LLM
+    artist1, artist2 = _unique_artist(tools, artist1), _unique_artist(tools, artist2)
+    if artist1 is None or artist2 is None:
+        return None
+    result = tools.compare_artists(artist1, artist2)
+    if 'error' in result:
+        return None
+    a, b = result['artist1'], result['artist2']
+    lines = [f"Сравнение {a['artist']} и {b['artist']}:"]
+    for artist in (a, b):
+        lines.append(
+            f"• {artist['artist']}: {_money(artist['revenue'])}, {_count(artist['streams'])} стримов, "
+            f"{artist['tracks_count']} треков, ставка {artist['avg_rate']:.5f}"
+        )
+    leader = a if a['revenue'] >= b['revenue'] else b
+    lines.append(f"Больше зарабатывает {leader['artist']} (разница {_money(abs(result['comparison']['revenue_diff']))}).")
+    return '\n'.join(lines)
+
+
+def answer_fast_path(question: str, tools) -> Optional[Dict[str, Any]]:
+    """
+    Ответить на вопрос без LLM
+
+    Args:
+        question: вопрос пользователя
+        tools: экземпляр AnalyticsTools
+
+    Returns:
+        {'intent': ..., 'answer': ...} или None (нужен LLM)
+    """
+    routed = route_question(question)
+    if routed is None:
+        return None
+
+    intent, params = routed['intent'], routed['params']
+    if intent == 'top_tracks':
+        answer = _answer_top_tracks(tools, **params)
+    elif intent == 'top_artists':
+        answer = _answer_top_artists(tools, **params)
+    elif intent == 'summary_stats':
+        answer = _answer_summary_stats(tools)
+    elif intent == 'platform_stats':
+        answer = _answer_breakdown("Статистика по платформам:", tools.get_platform_stats()['platforms'], 'platform')
+    elif intent == 'country_stats':
+        answer = _answer_breakdown("Топ-20 стран по доходу:", tools.get_country_stats()['top_countries'], 'country')
+    elif intent == 'viral_tracks':
+        answer = _answer_viral_tracks(tools)
+    elif intent == 'artist_timeline':
+        answer = _answer_artist_timeline(tools, **params)
+    elif intent == 'compare_artists':
+        answer = _answer_compare_artists(tools, **params)
+    else:
+        answer = None
+
+    if answer is None:
+        return None
+    return {'intent': intent, 'answer': answer}
+
+
+# ============================================================================
+# Fast path для SQL агента (шаблоны SQL)
+# ============================================================================
+
+def _quote(value: str) -> str:
+    """Строковый литерал SQL"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def route_sql(question: str) -> Optional[Dict[str, Any]]:
+    """
+    SQL шаблон для распознанного вопроса
+
+    Returns:
+        {'sql': ..., 'explanation': ..., 'intent': ...} или None (нужен LLM)
+    """
+    routed = route_question(question)
+    if routed is None:
+        return None
+
+    intent, params = routed['intent'], routed['params']
+    if intent == 'top_tracks':
+        # Только представления v_*: в DuckDB бэкенде материализованных mv_* нет
+        if params['sort_by'] == 'streams':
+            sql = f"SELECT * FROM v_top_tracks_by_revenue ORDER BY total_streams DESC LIMIT {params['limit']}"
+        else:
+            sql = f"SELECT * FROM v_top_tracks_by_revenue LIMIT {params['limit']}"
+        explanation = f"Топ-{params['limit']} треков по {_sort_label(params['sort_by'])}"
+    elif intent == 'top_artists':
+        if params['sort_by'] == 'streams':
+            sql = f"SELECT * FROM v_top_artists_by_revenue ORDER BY total_streams DESC LIMIT {params['limit']}"
+        else:
+            sql = f"SELECT * FROM v_top_artists_by_revenue LIMIT {params['limit']}"
+        explanation = f"Топ-{params['limit']} артистов по {_sort_label(params['sort_by'])}"
+    elif intent == 'platform_stats':
+        sql = "SELECT * FROM v_top_platforms_by_revenue"
+        explanation = "Доход и стримы по платформам"
+    elif intent == 'country_stats':
+        sql = ("SELECT c.country_name, SUM(tcs.streams) AS total_streams, "
+               "ROUND(SUM(tcs.revenue)::numeric, 2) AS total_revenue "
+               "FROM track_country_stats tcs JOIN countries c ON tcs.country_id = c.country_id "
+               "GROUP BY c.country_name ORDER BY total_revenue DESC LIMIT 20")
+        explanation = "Топ-20 стран по доходу"
+    elif intent == 'artist_timeline':
+        sql = f"SELECT * FROM v_artist_monthly_trends WHERE artist_name ILIKE {_quote(params['artist_name'])}"
+        explanation = f"Помесячная динамика артиста {params['artist_name']}"
+    elif intent == 'compare_artists':
+        artist1, artist2 = _quote(params['artist1']), _quote(params['artist2'])
+        if artist1.lower() == artist2.lower():
+            return None
+        # Строки возвращаются, только если каждое имя совпало ровно с одним
+        # артистом; иначе результат пустой и вопрос уходит в LLM (сравнение
+        # одного артиста с самим собой отдавать нельзя)
+        sql = (f"WITH a1 AS (SELECT * FROM v_top_artists_by_revenue WHERE artist_name ILIKE {artist1}), "
+               f"a2 AS (SELECT * FROM v_top_artists_by_revenue WHERE artist_name ILIKE {artist2}) "
+               "SELECT * FROM (SELECT * FROM a1 UNION ALL SELECT * FROM a2) pair "
+               "WHERE (SELECT COUNT(*) FROM a1) = 1 AND (SELECT COUNT(*) FROM a2) = 1")
+        explanation = f"Сравнение артистов {params['artist1']} и {params['artist2']}"
+    else:
+        return None
+
+    return {'sql': sql, 'explanation': explanation, 'intent': intent}
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Устойчивый клиент LLM провайдеров (Alem AI, OpenAI-совместимые API)
+
+- requests.Session с пулом соединений и раздельными таймаутами
+  на подключение и чтение (зависший провайдер не держит воркер вечно);
+- повтор при сетевых ошибках, 429 и 5xx с экспоненциальной задержкой
+  и полным джиттером;
+- хеджирование (опционально): если ответ не пришёл за p95 латентности,
+  отправляется второй такой же запрос, используется первый ответ;
+- circuit breaker: после серии ошибок подряд провайдер считается
+  недоступным на cooldown секунд - запросы сразу получают
+  CircuitOpenError (вызывающий код переходит на детерминированный fast
+  path), затем один пробный запрос решает, закрыть ли цепь;
+- гистограммы латентности по провайдерам (/api/llm-stats).
+
+Настройки через окружение с префиксом провайдера, например
+ALEM_CONNECT_TIMEOUT, ALEM_READ_TIMEOUT, ALEM_RETRIES, ALEM_HEDGE.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from query_log import percentile
+
+# Границы корзин гистограммы, мс
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000]
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Провайдер LLM признан недоступным (circuit breaker разомкнут)"""
+
+
+class LatencyHistogram:
+    """Гистограмма латентности и окно последних замеров для перцентилей"""
+
+    def __init__(self, buckets_ms: List[float] = None, window: int = 500):
+        self.buckets_ms = buckets_ms or LATENCY_BUCKETS_MS
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ms: float):
+        with self._lock:
+            index = next((i for i, bound in enumerate(self.buckets_ms) if ms <= bound), len(self.buckets_ms))
+            self.counts[index] += 1
+            self._recent.append(ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Перцентиль по последним замерам (None, если замеров нет)"""
+        with self._lock:
+            values = sorted(self._recent)
+        return percentile(values, p)
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self.counts)
+        labels = [f"le_{bound}" for bound in self.buckets_ms] + ["inf"]
+        return {
+            'count': sum(counts),
+            'buckets_ms': dict(zip(labels, counts)),
+            'p50_ms': _round(self.percentile(50)),
+            'p95_ms': _round(self.percentile(95)),
+            'p99_ms': _round(self.percentile(99))
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд на cooldown секунд
+
+    Состояния: closed (запросы идут), open (запросы сразу отклоняются),
+    half_open (после cooldown пропускается один пробный запрос).
+
+    Каждый запрос берёт разрешение (acquire) и возвращает его
+    (release) при любом исходе: если исход не записан (ошибка самого
+    запроса, отмена, отключение клиента), пробный запрос снимается и
+    следующий вызов получит новую пробу - цепь не остаётся half_open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = 0        # номер пробного запроса в полёте (0 - нет)
+        self._probe_seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+    def acquire(self) -> Optional[int]:
+        """
+        Разрешение на запрос
+
+        Returns:
+            None - цепь разомкнута; иначе разрешение для release()
+            (0 - обычный запрос, больше 0 - пробный запрос half_open)
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return 0
+            if state == 'half_open' and not self._probe:
+                self._probe_seq += 1
+                self._probe = self._probe_seq
+                return self._probe
+            return None
+
+    def release(self, permit: Optional[int]):
+        """Вернуть разрешение: снять пробный запрос, если его исход не записан"""
+        if not permit:
+            return
+        with self._lock:
+            if self._probe == permit:
+                self._probe = 0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probe = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class RetryableError(Exception):
+    """Ошибка, после которой запрос имеет смысл повторить"""
+
+
+def _env(prefix: str, name: str, default: str) -> str:
+    return os.getenv(f"{prefix}_{name}", default)
+
+
+class LLMClient:
+    """
+    POST к chat/completions endpoint провайдера с таймаутами, повторами,
+    хеджированием и circuit breaker
+
+    Args:
+        name: имя провайдера (для метрик и префикса переменных окружения)
+        url: URL chat/completions
+        api_key: ключ API (Bearer)
+        connect_timeout, read_timeout: таймауты, секунды
+        retries: число повторов после первой попытки
+        backoff_base, backoff_max: параметры задержки между повторами, секунды
+        hedge: отправлять второй запрос, если первый дольше p95
+        hedge_min_ms: нижняя граница задержки хеджирования
+        failure_threshold, cooldown: параметры circuit breaker
+    """
+
+    def __init__(self, name: str, url: str, api_key: Optional[str],
+                 connect_timeout: float = None, read_timeout: float = None,
+                 retries: int = None, backoff_base: float = None, backoff_max: float = None,
+                 hedge: bool = None, hedge_min_ms: float = None,
+                 failure_threshold: int = None, cooldown: float = None):
+        prefix = name.upper()
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout or float(_env(prefix, "CONNECT_TIMEOUT", "5"))
+        self.read_timeout = read_timeout or float(_env(prefix, "READ_TIMEOUT", "60"))
+        self.retries = retries if retries is not None else int(_env(prefix, "RETRIES", "2"))
+        self.backoff_base = backoff_base or float(_env(prefix, "BACKOFF_BASE", "0.5"))
+        self.backoff_max = backoff_max or float(_env(prefix, "BACKOFF_MAX", "8"))
+        self.hedge = hedge if hedge is not None else _env(prefix, "HEDGE", "0") not in ("0", "false")
+        self.hedge_min_ms = hedge_min_ms or float(_env(prefix, "HEDGE_MIN_MS", "1000"))
+        self.breaker = CircuitBreaker(
+            failure_threshold or int(_env(prefix, "BREAKER_FAILURES", "5")),
+            cooldown or float(_env(prefix, "BREAKER_COOLDOWN", "30"))
+        )
+        self.latency = LatencyHistogram()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(_env(prefix, "MAX_CONNECTIONS", "20")))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"{name}-hedge")
+
+        self.counters = {
+            'requests': 0, 'success': 0, 'failures': 0, 'retries': 0,
+            'hedged': 0, 'hedge_wins': 0, 'short_circuited': 0
+        }
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter: str, value: int = 1):
+        with self._counters_lock:
+            self.counters[counter] += value
+
+    def _post_once(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Один HTTP запрос; RetryableError для ошибок, которые стоит повторить"""
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url, json=payload, headers=headers,
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
+
+        if response.status_code in RETRYABLE_STATUSES:
+            raise RetryableError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+        self.latency.record((time.perf_counter() - start) * 1000)
+        return data
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Через сколько секунд отправлять второй запрос (None - не хеджировать)"""
+        if not self.hedge or len(self.latency) < 20:
+            return None
+        return max(self.latency.percentile(95), self.hedge_min_ms) / 1000
+
+    def _attempt(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Попытка с хеджированием: второй запрос, если первый дольше p95"""
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._post_once(payload)
+
+        primary = self._hedge_pool.submit(self._post_once, payload)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count('hedged')
+        hedge = self._hedge_pool.submit(self._post_once, payload)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Запрос chat/completions
+
+        Args:
+            payload: тело запроса (model, messages, ...)
+
+        Returns:
+            JSON ответа провайдера
+
+        Raises:
+            CircuitOpenError: провайдер недоступен (цепь разомкнута)
+            requests.RequestException / RetryableError: запрос не удался
+                после всех повторов
+        """
+        permit = self.breaker.acquire()
+        if permit is None:
+            self._count('short_circuited')
+            raise CircuitOpenError(f"LLM провайдер {self.name} временно недоступен")
+
+        self._count('requests')
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    data = self._attempt(payload)
+                except RetryableError:
+                    if attempt == self.retries:
+                        self._count('failures')
+                        self.breaker.record_failure()
+                        raise
+                    self._count('retries')
+                    # Экспоненциальная задержка с полным джиттером
+                    time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                    continue
+                except requests.HTTPError:
+                    # 4xx - ошибка самого запроса: провайдер ответил, значит доступен
+                    self._count('failures')
+                    self.breaker.record_success()
+                    raise
+                except Exception:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    raise
+                self._count('success')
+                self.breaker.record_success()
+                return data
+        finally:
+            self.breaker.release(permit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            'url': self.url,
+            'latency': self.latency.snapshot(),
+            'breaker': self.breaker.snapshot(),
+            'hedge': self.hedge,
+            **counters
+        }
+
+
+# Метрики провайдеров, которые вызываются не через LLMClient (ChatOpenAI в агенте)
+_histograms: Dict[str, LatencyHistogram] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_clients: Dict[str, LLMClient] = {}
+_registry_lock = threading.Lock()
+
+
+def register_client(client: LLMClient) -> LLMClient:
+    with _registry_lock:
+        _clients[client.name] = client
+    return client
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """Гистограмма латентности провайдера (создаётся при первом обращении)"""
+    with _registry_lock:
+        return _histograms.setdefault(name, LatencyHistogram())
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Circuit breaker провайдера (параметры - <NAME>_BREAKER_FAILURES / _COOLDOWN)"""
+    prefix = name.upper()
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                int(_env(prefix, "BREAKER_FAILURES", "5")),
+                float(_env(prefix, "BREAKER_COOLDOWN", "30"))
+            )
+        return _breakers[name]
+
+
+def llm_stats() -> Dict[str, Any]:
+    """Статистика всех провайдеров: латентность, состояние цепи, счётчики"""
+    with _registry_lock:
+        clients = dict(_clients)
+        histograms = dict(_histograms)
+        breakers = dict(_breakers)
+    stats = {name: client.stats() for name, client in clients.items()}
+    for name, histogram in histograms.items():
+        stats.setdefault(name, {})['latency'] = histogram.snapshot()
+    for name, breaker in breakers.items():
+        stats.setdefault(name, {})['breaker'] = breaker.snapshot()
+    return stats
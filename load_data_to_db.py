@@ -23,6 +23,14 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', '')
 }
 
+# Материализованные представления, которые обновляются после загрузки
+MATERIALIZED_VIEWS = [
+    'mv_top_tracks_by_revenue',
+    'mv_top_artists_by_revenue',
+    'mv_artist_monthly_trends',
+    'mv_track_monthly_trends',
+]
+
 class DataLoader:
     def __init__(self):
         self.conn = None
@@ -36,6 +44,9 @@ class DataLoader:
         self.country_cache = {}
         self.subscription_cache = {}
         
+        # Уже созданные месячные секции: (таблица, месяц)
+        self.partition_cache = set()
+        
     def connect(self):
         """Подключение к БД"""
         print("🔌 Подключение к базе данных...")
@@ -151,6 +162,35 @@ class DataLoader:
         self.subscription_cache[subscription_type_name] = subscription_type_id
         return subscription_type_id
     
+    def ensure_month_partitions(self, table_name, month_dates):
+        """Создать месячные секции таблицы для всех указанных месяцев"""
+        created = []
+        for month_date in sorted(set(d.replace(day=1) for d in month_dates)):
+            if (table_name, month_date) in self.partition_cache:
+                continue
+            self.cursor.execute("SELECT create_monthly_partition(%s, %s)", (table_name, month_date))
+            created.append(self.cursor.fetchone()[0])
+            self.partition_cache.add((table_name, month_date))
+        
+        # Фиксируем сразу, чтобы не держать блокировку родительской таблицы
+        self.conn.commit()
+        if created:
+            print(f"   Секции {table_name}: {', '.join(created)}")
+    
+    def detach_old_partitions(self, table_name, older_than):
+        """
+        Отсоединить секции за месяцы раньше older_than (дешёвое удаление старых периодов)
+        
+        Данные остаются в таблицах <секция>_detached_<время>; имя секции
+        освобождается, поэтому повторная загрузка месяца создаст новую.
+        """
+        self.cursor.execute("SELECT detach_monthly_partitions(%s, %s)", (table_name, older_than))
+        detached = [row[0] for row in self.cursor.fetchall()]
+        self.conn.commit()
+        self.partition_cache = {key for key in self.partition_cache if key[0] != table_name or key[1] >= older_than}
+        print(f"🗄️  Отсоединено секций {table_name}: {len(detached)}")
+        return detached
+    
     def load_tracks_aggregated(self, filepath='precalc_data/tracks_aggregated.json'):
         """Загрузка агрегированных данных по трекам"""
         print("\n📊 Загрузка tracks_aggregated.json...")
@@ -191,8 +231,8 @@ class DataLoader:
                 item.get('revenue', 0),
                 item.get('streams', 0),
                 item.get('avg_rate', 0),
-                len(platforms),
-                len(countries)
+                item.get('platforms_count', len(platforms)),
+                item.get('countries_count', len(countries))
             ))
             
             # Связи трек-платформа
@@ -258,8 +298,8 @@ class DataLoader:
                 item.get('tracks_count', 0),
                 item.get('avg_rate', 0),
                 item.get('avg_revenue_per_track', 0),
-                len(platforms),
-                len(countries)
+                item.get('platforms_count', len(platforms)),
+                item.get('countries_count', len(countries))
             ))
             
             # Связи артист-платформа
@@ -330,6 +370,12 @@ class DataLoader:
         total = len(data)
         print(f"   Найдено записей: {total}")
         
+        # Секции для всех месяцев файла создаются до вставки
+        self.ensure_month_partitions(
+            'artist_monthly_stats',
+            [datetime.strptime(item['month'], '%Y/%m/%d').date() for item in data]
+        )
+        
         for i, item in enumerate(data, 1):
             if i % 500 == 0:
                 print(f"   Обработано: {i}/{total} ({i*100//total}%)")
@@ -380,6 +426,13 @@ class DataLoader:
         total = len(data)
         print(f"   Найдено записей: {total}")
         
+        # Секции для всех месяцев файла создаются до вставки
+        self.ensure_month_partitions('track_monthly_stats', [
+            datetime.strptime(month_str, '%Y/%m/%d').date()
+            for item in data if isinstance(item.get('monthly'), dict)
+            for month_str in item['monthly']
+        ])
+        
         for i, item in enumerate(data, 1):
             if i % 100 == 0:
                 print(f"   Обработано: {i}/{total} ({i*100//total}%)")
@@ -463,6 +516,24 @@ class DataLoader:
         self.conn.commit()
         print(f"✅ Загружено детальных записей: {total}")
     
+    def refresh_materialized_views(self):
+        """Обновление материализованных представлений после загрузки"""
+        print("\n🔄 Обновление материализованных представлений...")
+        
+        for view_name in MATERIALIZED_VIEWS:
+            try:
+                # CONCURRENTLY не блокирует чтение (нужен уникальный индекс)
+                self.cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}")
+                self.conn.commit()
+            except psycopg2.errors.ObjectNotInPrerequisiteState:
+                # Представление ещё ни разу не заполнялось - обычный REFRESH
+                self.conn.rollback()
+                self.cursor.execute(f"REFRESH MATERIALIZED VIEW {view_name}")
+                self.conn.commit()
+            print(f"   ✓ {view_name}")
+        
+        print(f"✅ Обновлено представлений: {len(MATERIALIZED_VIEWS)}")
+    
     def print_statistics(self):
         """Вывод статистики по загруженным данным"""
         print("\n" + "="*60)
@@ -522,6 +593,16 @@ def main():
             limit = int(limit_choice) if limit_choice.isdigit() else None
             loader.load_track_details(limit=limit)
         
+        # Отсоединение старых месяцев (DETACH_MONTHS_BEFORE=2025-01-01)
+        detach_before = os.getenv('DETACH_MONTHS_BEFORE')
+        if detach_before:
+            older_than = datetime.strptime(detach_before, '%Y-%m-%d').date()
+            for table_name in ('track_monthly_stats', 'artist_monthly_stats'):
+                loader.detach_old_partitions(table_name, older_than)
+        
+        # Обновление материализованных представлений
+        loader.refresh_materialized_views()
+        
         # Статистика
         loader.print_statistics()
         
@@ -1,13 +1,43 @@
 """
 FastAPI приложение для AI агента аналитики музыкальных данных
 """
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from api.routes import router
+from api.services import get_agent_service
+from fast_json import FastJSONResponse
+
+
+async def warm_up_agent():
+    """Фоновый прогрев: импорт агента, клиенты LLM, данные AnalyticsTools"""
+    try:
+        timings = await asyncio.to_thread(get_agent_service().warm_up)
+        print(f"🔥 Агент прогрет: импорт {timings['agent']} с, данные {timings['data']} с")
+    except Exception as e:
+        print(f"⚠️  Прогрев агента не удался: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Сервер принимает запросы сразу; тяжёлый стек агента грузится в фоне
+    # (AGENT_WARMUP=0 - загрузка при первом запросе к LLM)
+    warm_up_task = None
+    if os.getenv("AGENT_WARMUP", "1") not in ("0", "false"):
+        warm_up_task = asyncio.create_task(warm_up_agent())
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+
 
 # Создаем приложение
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
     title="🎵 AI Analytics Agent API",
     description="""
     AI агент для аналитики музыкальных данных на базе OpenAI GPT-4o.
@@ -20,7 +50,7 @@ app = FastAPI(
     - 🌍 География и платформы
     - 🔬 Специальная аналитика
     
-    ## Инструменты (13 шт.)
+    ## Инструменты (14 шт.)
     
     1. **get_top_tracks** - Топ треков
     2. **get_top_artists** - Топ артистов
@@ -35,6 +65,7 @@ app = FastAPI(
     11. **get_viral_tracks** - Вирусные треки
     12. **get_summary_stats** - Общая статистика
     13. **analyze_monetization** - Анализ монетизации
+    14. **query_cube** - Срез по треку, платформе, стране и месяцу
     
     ## Примеры запросов
     
@@ -210,10 +241,27 @@ async def ping():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+
+    workers = int(os.getenv("API_WORKERS", "1"))
+    if workers > 1:
+        # Данные загружаются один раз и публикуются в общую память,
+        # воркеры подключаются к ним только на чтение
+        from analytics_tools import AnalyticsTools
+        from shared_dataset import DEFAULT_SHM_NAME, publish_dataset
+
+        shm_name = os.environ.setdefault("ANALYTICS_SHM_NAME", DEFAULT_SHM_NAME)
+        shm = publish_dataset(AnalyticsTools(), shm_name)
+        print(f"📦 Данные в общей памяти '{shm_name}' ({shm.size / 1024 / 1024:.1f} MB), воркеров: {workers}")
+        try:
+            uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, log_level="info")
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
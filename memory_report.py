@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Отчёт о памяти данных AnalyticsTools: словари json.load vs компактные записи
+
+Для tracks_aggregated.json, artists_aggregated.json и track_details.json
+считает полный размер в памяти (deep_sizeof - объект со всеми вложенными,
+общие объекты учитываются один раз) в исходном виде и в виде записей
+records.py и печатает байты на запись до и после.
+
+С --latency дополнительно замеряет время типичных вызовов инструментов
+(медиана, мс) на данных в памяти процесса и на тех же данных из общей
+памяти (shared_dataset.py) - экономия памяти не должна стоить латентности.
+
+    python memory_report.py
+    python memory_report.py --latency --data-dir precalc_data --output memory.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from records import (
+    ArtistRecord, TrackDetail, TrackRecord, Vocabulary, build_records, deep_sizeof
+)
+
+DATASETS = {
+    'tracks': ('tracks_aggregated.json', TrackRecord),
+    'artists': ('artists_aggregated.json', ArtistRecord),
+    'track_details': ('track_details.json', TrackDetail),
+}
+
+
+def measure(path: Path, cls) -> dict:
+    """Размер одного файла в виде словарей и в виде записей cls"""
+    with open(path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+
+    vocabularies = {name: Vocabulary() for name in cls.BREAKDOWNS.values()}
+    records = build_records(cls, items, vocabularies)
+
+    seen = set()
+    records_bytes = deep_sizeof(records, seen)
+    # Словари измерений общие для всех записей - учитываем один раз
+    records_bytes += sum(deep_sizeof(v.names, seen) + deep_sizeof(v._codes, seen)
+                         for v in vocabularies.values())
+    dict_bytes = deep_sizeof(items)
+
+    count = max(len(items), 1)
+    return {
+        'records': len(items),
+        'dict_bytes': dict_bytes,
+        'compact_bytes': records_bytes,
+        'dict_bytes_per_record': round(dict_bytes / count),
+        'compact_bytes_per_record': round(records_bytes / count),
+        'ratio': round(dict_bytes / records_bytes, 2) if records_bytes else None
+    }
+
+
+def latency_calls(tools):
+    """Типичные вызовы инструментов агента: (подпись, функция)"""
+    track = tools.tracks[len(tools.tracks) // 2]
+    return [
+        ('get_top_tracks(10)', lambda: tools.get_top_tracks(10)),
+        ('get_top_artists(10)', lambda: tools.get_top_artists(10)),
+        ('search_track', lambda: tools.search_track(track['track'])),
+        ('get_track_details', lambda: tools.get_track_details(track['track'], track['artist'])),
+        ('get_artist_tracks', lambda: tools.get_artist_tracks(track['artist'])),
+        ('get_artist_timeline', lambda: tools.get_artist_timeline(track['artist'])),
+        ('get_viral_tracks', lambda: tools.get_viral_tracks()),
+    ]
+
+
+def median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+def measure_latency(data_dir: Path, repeat: int) -> dict:
+    """Латентность вызовов: данные в процессе vs общая память"""
+    from analytics_tools import AnalyticsTools
+    from shared_dataset import publish_dataset
+
+    local = AnalyticsTools(str(data_dir))
+    shm = publish_dataset(local, f"memory_report_{os.getpid()}")
+    try:
+        shared = AnalyticsTools.from_shared_memory(shm.name.lstrip('/'))
+        if sys.version_info < (3, 13):
+            # Подключение сняло сегмент с учёта resource_tracker этого же
+            # процесса (см. shared_dataset._open_segment) - вернуть для unlink()
+            from multiprocessing import resource_tracker
+            resource_tracker.register(shm._name, 'shared_memory')
+        result = {}
+        for (label, local_call), (_, shared_call) in zip(latency_calls(local), latency_calls(shared)):
+            result[label] = {'local_ms': median_ms(local_call, repeat),
+                             'shared_ms': median_ms(shared_call, repeat)}
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память данных AnalyticsTools до/после компактных записей")
+    parser.add_argument('--data-dir', default="precalc_data")
+    parser.add_argument('--latency', action='store_true',
+                        help="Замерить латентность инструментов: в процессе vs общая память")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Куда сохранить JSON отчёт")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.is_absolute():
+        data_dir = Path(__file__).parent / data_dir
+
+    print("=" * 80)
+    print("  🧠 ПАМЯТЬ ДАННЫХ ANALYTICS TOOLS")
+    print("=" * 80)
+    print(f"{'данные':<15} {'записей':>8} {'dict, MB':>10} {'records, MB':>12} "
+          f"{'B/запись до':>12} {'B/запись после':>15} {'×':>6}")
+
+    report = {}
+    for name, (filename, cls) in DATASETS.items():
+        path = data_dir / filename
+        if not path.exists():
+            print(f"{name:<15} ⚠️  нет файла {path}")
+            continue
+        result = measure(path, cls)
+        report[name] = result
+        print(f"{name:<15} {result['records']:>8} {result['dict_bytes'] / 1024 / 1024:>10.2f} "
+              f"{result['compact_bytes'] / 1024 / 1024:>12.2f} {result['dict_bytes_per_record']:>12} "
+              f"{result['compact_bytes_per_record']:>15} {result['ratio']:>6}")
+
+    if args.latency:
+        report['latency'] = measure_latency(data_dir, args.repeat)
+        print(f"\n⏱️  Латентность вызовов (медиана из {args.repeat})")
+        print(f"{'вызов':<22} {'в процессе, ms':>15} {'общая память, ms':>17}")
+        for label, timings in report['latency'].items():
+            print(f"{label:<22} {timings['local_ms']:>15} {timings['shared_ms']:>17}")
+
+    print("=" * 80)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
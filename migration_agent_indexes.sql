@@ -0,0 +1,66 @@
+-- ============================================================================
+-- МИГРАЦИЯ: Покрывающие и составные индексы под запросы SQL агента
+-- ============================================================================
+-- Дата: 2026-10-18
+-- Описание: Заменяем одноколоночные индексы на составные/покрывающие
+-- (index-only scan для SUM(streams)/SUM(revenue)) и добавляем триграммные
+-- GIN индексы для ILIKE по artist_name / track_name.
+--
+-- Индексы создаются CONCURRENTLY (кроме секционированной помесячной
+-- статистики, см. ниже), поэтому файл выполняется БЕЗ транзакции:
+--   psql -d music_analytics -f migration_agent_indexes.sql
+-- или через replay_agent_queries.py --apply migration_agent_indexes.sql
+-- ============================================================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Триграммы для ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_artists_name_trgm ON artists USING GIN (artist_name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_name_trgm ON tracks USING GIN (track_name gin_trgm_ops);
+
+-- Треки артиста (artist_id → track_id, track_name без обращения к таблице)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_artist_id_cover ON tracks(artist_id) INCLUDE (track_id, track_name);
+DROP INDEX CONCURRENTLY IF EXISTS idx_tracks_artist_id;
+ALTER INDEX IF EXISTS idx_tracks_artist_id_cover RENAME TO idx_tracks_artist_id;
+
+-- Агрегаты
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_track_aggregates_track_id_cover ON track_aggregates(track_id) INCLUDE (total_revenue, total_streams, avg_rate);
+DROP INDEX CONCURRENTLY IF EXISTS idx_track_aggregates_track_id;
+ALTER INDEX IF EXISTS idx_track_aggregates_track_id_cover RENAME TO idx_track_aggregates_track_id;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_artist_aggregates_artist_id_cover ON artist_aggregates(artist_id) INCLUDE (total_revenue, total_streams, tracks_count);
+DROP INDEX CONCURRENTLY IF EXISTS idx_artist_aggregates_artist_id;
+ALTER INDEX IF EXISTS idx_artist_aggregates_artist_id_cover RENAME TO idx_artist_aggregates_artist_id;
+
+-- Трек × платформа / страна
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_track_platform_stats_track_cover ON track_platform_stats(track_id) INCLUDE (platform_id, streams, revenue);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_track_platform_stats_platform_track ON track_platform_stats(platform_id, track_id) INCLUDE (streams, revenue);
+DROP INDEX CONCURRENTLY IF EXISTS idx_track_platform_stats_track_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_track_platform_stats_platform_id;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_track_country_stats_track_cover ON track_country_stats(track_id) INCLUDE (country_id, streams, revenue);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_track_country_stats_country_track ON track_country_stats(country_id, track_id) INCLUDE (streams, revenue);
+DROP INDEX CONCURRENTLY IF EXISTS idx_track_country_stats_track_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_track_country_stats_country_id;
+
+-- Помесячная статистика
+-- После migration_partition_monthly_stats.sql это секционированные таблицы:
+-- Postgres не поддерживает CONCURRENTLY для индекса на родителе, поэтому
+-- индексы создаются обычным CREATE INDEX (каскадно на все секции). Таблицы
+-- небольшие, блокировка записи короткая; на несекционированных таблицах
+-- (до миграции) оператор тоже работает.
+CREATE INDEX IF NOT EXISTS idx_track_monthly_stats_track_month ON track_monthly_stats(track_id, month_date) INCLUDE (streams, revenue);
+DROP INDEX IF EXISTS idx_track_monthly_stats_track_id;
+
+CREATE INDEX IF NOT EXISTS idx_artist_monthly_stats_artist_month ON artist_monthly_stats(artist_id, month_date) INCLUDE (streams, revenue);
+DROP INDEX IF EXISTS idx_artist_monthly_stats_artist_id;
+
+-- Обновляем статистику планировщика
+ANALYZE artists;
+ANALYZE tracks;
+ANALYZE track_aggregates;
+ANALYZE artist_aggregates;
+ANALYZE track_platform_stats;
+ANALYZE track_country_stats;
+ANALYZE track_monthly_stats;
+ANALYZE artist_monthly_stats;
@@ -0,0 +1,123 @@
+-- ============================================================================
+-- МИГРАЦИЯ: Материализованные представления для частых аналитических запросов
+-- ============================================================================
+-- Дата: 2026-10-18
+-- Описание: v_top_tracks_by_revenue, v_top_artists_by_revenue,
+-- v_artist_monthly_trends и v_track_monthly_trends пересчитывали JOIN
+-- tracks/artists/labels при каждом чтении. Теперь данные хранятся в
+-- материализованных представлениях mv_* с индексами, а v_* остаются
+-- тонкими представлениями поверх них (имена и сортировка не меняются).
+-- Обновление: load_data_to_db.py в конце загрузки выполняет
+-- REFRESH MATERIALIZED VIEW CONCURRENTLY.
+-- ============================================================================
+
+BEGIN;
+
+DROP VIEW IF EXISTS v_top_tracks_by_revenue;
+DROP VIEW IF EXISTS v_top_artists_by_revenue;
+DROP VIEW IF EXISTS v_artist_monthly_trends;
+DROP VIEW IF EXISTS v_track_monthly_trends;
+
+-- Топ треков по выручке (материализованное представление)
+CREATE MATERIALIZED VIEW mv_top_tracks_by_revenue AS
+SELECT 
+    t.track_id,
+    t.track_name,
+    a.artist_name,
+    l.label_name,
+    ta.total_revenue,
+    ta.total_streams,
+    ta.avg_rate
+FROM tracks t
+JOIN artists a ON t.artist_id = a.artist_id
+JOIN labels l ON t.label_id = l.label_id
+JOIN track_aggregates ta ON t.track_id = ta.track_id;
+
+-- Топ артистов по выручке (материализованное представление)
+CREATE MATERIALIZED VIEW mv_top_artists_by_revenue AS
+SELECT 
+    a.artist_id,
+    a.artist_name,
+    l.label_name,
+    aa.total_revenue,
+    aa.total_streams,
+    aa.tracks_count,
+    aa.avg_revenue_per_track
+FROM artists a
+JOIN labels l ON a.label_id = l.label_id
+JOIN artist_aggregates aa ON a.artist_id = aa.artist_id;
+
+-- Помесячная динамика по артистам (материализованное представление)
+CREATE MATERIALIZED VIEW mv_artist_monthly_trends AS
+SELECT 
+    a.artist_id,
+    a.artist_name,
+    l.label_name,
+    ams.month_date,
+    ams.streams,
+    ams.revenue
+FROM artist_monthly_stats ams
+JOIN artists a ON ams.artist_id = a.artist_id
+JOIN labels l ON a.label_id = l.label_id;
+
+-- Помесячная динамика по трекам (материализованное представление)
+CREATE MATERIALIZED VIEW mv_track_monthly_trends AS
+SELECT 
+    t.track_id,
+    t.track_name,
+    a.artist_name,
+    tms.month_date,
+    tms.streams,
+    tms.revenue
+FROM track_monthly_stats tms
+JOIN tracks t ON tms.track_id = t.track_id
+JOIN artists a ON t.artist_id = a.artist_id;
+
+-- Индексы для материализованных представлений
+-- (уникальные индексы нужны для REFRESH MATERIALIZED VIEW CONCURRENTLY)
+CREATE UNIQUE INDEX idx_mv_top_tracks_track_id ON mv_top_tracks_by_revenue(track_id);
+CREATE INDEX idx_mv_top_tracks_revenue ON mv_top_tracks_by_revenue(total_revenue DESC);
+CREATE INDEX idx_mv_top_tracks_artist ON mv_top_tracks_by_revenue(artist_name);
+
+CREATE UNIQUE INDEX idx_mv_top_artists_artist_id ON mv_top_artists_by_revenue(artist_id);
+CREATE INDEX idx_mv_top_artists_revenue ON mv_top_artists_by_revenue(total_revenue DESC);
+
+CREATE UNIQUE INDEX idx_mv_artist_monthly_key ON mv_artist_monthly_trends(artist_id, month_date);
+CREATE INDEX idx_mv_artist_monthly_name ON mv_artist_monthly_trends(artist_name, month_date);
+
+CREATE UNIQUE INDEX idx_mv_track_monthly_key ON mv_track_monthly_trends(track_id, month_date);
+CREATE INDEX idx_mv_track_monthly_name ON mv_track_monthly_trends(track_name, month_date);
+
+-- Представления поверх материализованных (прежние имена и порядок сортировки)
+CREATE VIEW v_top_tracks_by_revenue AS
+SELECT track_name, artist_name, label_name, total_revenue, total_streams, avg_rate
+FROM mv_top_tracks_by_revenue
+ORDER BY total_revenue DESC;
+
+CREATE VIEW v_top_artists_by_revenue AS
+SELECT artist_name, label_name, total_revenue, total_streams, tracks_count, avg_revenue_per_track
+FROM mv_top_artists_by_revenue
+ORDER BY total_revenue DESC;
+
+CREATE VIEW v_artist_monthly_trends AS
+SELECT artist_name, label_name, month_date, streams, revenue
+FROM mv_artist_monthly_trends
+ORDER BY artist_name, month_date;
+
+CREATE VIEW v_track_monthly_trends AS
+SELECT track_name, artist_name, month_date, streams, revenue
+FROM mv_track_monthly_trends
+ORDER BY track_name, month_date;
+
+COMMENT ON MATERIALIZED VIEW mv_top_tracks_by_revenue IS 'Треки с агрегатами (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_top_artists_by_revenue IS 'Артисты с агрегатами (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_artist_monthly_trends IS 'Помесячная динамика по артистам (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_track_monthly_trends IS 'Помесячная динамика по трекам (обновляется после загрузки данных)';
+
+COMMIT;
+
+-- Проверка результата
+SELECT matviewname, ispopulated
+FROM pg_matviews
+WHERE schemaname = 'public'
+ORDER BY matviewname;
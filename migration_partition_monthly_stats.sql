@@ -0,0 +1,204 @@
+-- ============================================================================
+-- МИГРАЦИЯ: Секционирование помесячной статистики по month_date
+-- ============================================================================
+-- Дата: 2026-10-18
+-- Описание: track_monthly_stats и artist_monthly_stats превращаются в
+-- секционированные (PARTITION BY RANGE (month_date)) таблицы с секцией на
+-- каждый месяц. Запросы с фильтром по месяцам читают только нужные секции,
+-- загрузка нового месяца пишет в одну секцию, а старые периоды можно
+-- отсоединить без DELETE:
+--   SELECT detach_monthly_partitions('track_monthly_stats', '2025-01-01');
+-- (или DETACH_MONTHS_BEFORE=2025-01-01 python load_data_to_db.py).
+-- Отсоединённая секция переименовывается в <секция>_detached_<время>, так
+-- что повторная загрузка этого месяца создаёт новую секцию. Строки вне
+-- созданных секций попадают в секцию DEFAULT и переносятся в секцию месяца
+-- при её создании.
+--
+-- Выполнять после migration_materialized_views.sql и
+-- migration_agent_indexes.sql: зависимые представления пересоздаются.
+-- ============================================================================
+
+BEGIN;
+
+-- Создать секцию для месяца (если она ещё не присоединена к родителю)
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent_table TEXT, month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month_start)::date;
+    end_date DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+    partition_name TEXT := parent_table || '_' || to_char(start_date, 'YYYY_MM');
+    default_name TEXT := parent_table || '_default';
+BEGIN
+    -- Проверяем именно присоединённые секции: таблица с таким именем могла
+    -- остаться после DETACH и не принимает строки родителя
+    IF EXISTS (
+        SELECT 1
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent_table::regclass
+          AND c.relname = partition_name
+    ) THEN
+        RETURN partition_name;
+    END IF;
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RAISE EXCEPTION 'Таблица % существует, но не является секцией %', partition_name, parent_table
+            USING HINT = 'Переименуйте или удалите отсоединённую таблицу';
+    END IF;
+
+    -- Секция создаётся отдельно и присоединяется после переноса строк месяца
+    -- из DEFAULT: иначе ATTACH упадёт на строках, попавших туда раньше
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   partition_name, parent_table);
+    IF to_regclass(default_name) IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE month_date >= %L AND month_date < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            default_name, start_date, end_date, partition_name
+        );
+    END IF;
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent_table, partition_name, start_date, end_date);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Отсоединить секции за месяцы раньше older_than (данные остаются в
+-- отдельных таблицах <секция>_detached_<время>)
+CREATE OR REPLACE FUNCTION detach_monthly_partitions(parent_table TEXT, older_than DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    part RECORD;
+    archived_name TEXT;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent_table::regclass
+          AND c.relname ~ ('^' || parent_table || '_[0-9]{4}_[0-9]{2}$')
+        ORDER BY c.relname
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY_MM') < date_trunc('month', older_than) THEN
+            archived_name := part.relname || '_detached_' || to_char(clock_timestamp(), 'YYYYMMDDHH24MISS');
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent_table, part.relname);
+            -- Имя секции освобождается: повторная загрузка месяца создаст новую
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', part.relname, archived_name);
+            RETURN NEXT archived_name;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- ---------------------------------------------------------------------------
+-- track_monthly_stats
+-- ---------------------------------------------------------------------------
+CREATE TEMP TABLE track_monthly_stats_backup AS SELECT * FROM track_monthly_stats;
+DROP TABLE track_monthly_stats CASCADE;
+
+CREATE TABLE track_monthly_stats (
+    track_monthly_stat_id SERIAL,
+    track_id INTEGER REFERENCES tracks(track_id),
+    month_date DATE NOT NULL,
+    streams BIGINT NOT NULL,
+    revenue DECIMAL(15, 10) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (track_monthly_stat_id, month_date),
+    UNIQUE(track_id, month_date)
+) PARTITION BY RANGE (month_date);
+
+-- Строки за месяц без секции не теряются (см. create_monthly_partition)
+CREATE TABLE track_monthly_stats_default PARTITION OF track_monthly_stats DEFAULT;
+
+SELECT create_monthly_partition('track_monthly_stats', month_start)
+FROM (SELECT DISTINCT date_trunc('month', month_date)::date AS month_start FROM track_monthly_stats_backup) months;
+
+INSERT INTO track_monthly_stats SELECT * FROM track_monthly_stats_backup;
+SELECT setval(pg_get_serial_sequence('track_monthly_stats', 'track_monthly_stat_id'),
+              COALESCE((SELECT MAX(track_monthly_stat_id) FROM track_monthly_stats), 0) + 1, false);
+
+CREATE INDEX idx_track_monthly_stats_track_month ON track_monthly_stats(track_id, month_date) INCLUDE (streams, revenue);
+
+-- ---------------------------------------------------------------------------
+-- artist_monthly_stats
+-- ---------------------------------------------------------------------------
+CREATE TEMP TABLE artist_monthly_stats_backup AS SELECT * FROM artist_monthly_stats;
+DROP TABLE artist_monthly_stats CASCADE;
+
+CREATE TABLE artist_monthly_stats (
+    artist_monthly_stat_id SERIAL,
+    artist_id INTEGER REFERENCES artists(artist_id),
+    month_date DATE NOT NULL,
+    streams BIGINT NOT NULL,
+    revenue DECIMAL(15, 10) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (artist_monthly_stat_id, month_date),
+    UNIQUE(artist_id, month_date)
+) PARTITION BY RANGE (month_date);
+
+CREATE TABLE artist_monthly_stats_default PARTITION OF artist_monthly_stats DEFAULT;
+
+SELECT create_monthly_partition('artist_monthly_stats', month_start)
+FROM (SELECT DISTINCT date_trunc('month', month_date)::date AS month_start FROM artist_monthly_stats_backup) months;
+
+INSERT INTO artist_monthly_stats SELECT * FROM artist_monthly_stats_backup;
+SELECT setval(pg_get_serial_sequence('artist_monthly_stats', 'artist_monthly_stat_id'),
+              COALESCE((SELECT MAX(artist_monthly_stat_id) FROM artist_monthly_stats), 0) + 1, false);
+
+CREATE INDEX idx_artist_monthly_stats_artist_month ON artist_monthly_stats(artist_id, month_date) INCLUDE (streams, revenue);
+
+-- ---------------------------------------------------------------------------
+-- Зависимые представления (удалены через CASCADE)
+-- ---------------------------------------------------------------------------
+CREATE MATERIALIZED VIEW mv_artist_monthly_trends AS
+SELECT 
+    a.artist_id,
+    a.artist_name,
+    l.label_name,
+    ams.month_date,
+    ams.streams,
+    ams.revenue
+FROM artist_monthly_stats ams
+JOIN artists a ON ams.artist_id = a.artist_id
+JOIN labels l ON a.label_id = l.label_id;
+
+CREATE MATERIALIZED VIEW mv_track_monthly_trends AS
+SELECT 
+    t.track_id,
+    t.track_name,
+    a.artist_name,
+    tms.month_date,
+    tms.streams,
+    tms.revenue
+FROM track_monthly_stats tms
+JOIN tracks t ON tms.track_id = t.track_id
+JOIN artists a ON t.artist_id = a.artist_id;
+
+CREATE UNIQUE INDEX idx_mv_artist_monthly_key ON mv_artist_monthly_trends(artist_id, month_date);
+CREATE INDEX idx_mv_artist_monthly_name ON mv_artist_monthly_trends(artist_name, month_date);
+CREATE UNIQUE INDEX idx_mv_track_monthly_key ON mv_track_monthly_trends(track_id, month_date);
+CREATE INDEX idx_mv_track_monthly_name ON mv_track_monthly_trends(track_name, month_date);
+
+CREATE VIEW v_artist_monthly_trends AS
+SELECT artist_name, label_name, month_date, streams, revenue
+FROM mv_artist_monthly_trends
+ORDER BY artist_name, month_date;
+
+CREATE VIEW v_track_monthly_trends AS
+SELECT track_name, artist_name, month_date, streams, revenue
+FROM mv_track_monthly_trends
+ORDER BY track_name, month_date;
+
+COMMENT ON TABLE track_monthly_stats IS 'Помесячная статистика по трекам (секции по месяцам)';
+COMMENT ON TABLE artist_monthly_stats IS 'Помесячная статистика по артистам (секции по месяцам)';
+COMMENT ON MATERIALIZED VIEW mv_artist_monthly_trends IS 'Помесячная динамика по артистам (обновляется после загрузки данных)';
+COMMENT ON MATERIALIZED VIEW mv_track_monthly_trends IS 'Помесячная динамика по трекам (обновляется после загрузки данных)';
+
+COMMIT;
+
+-- Проверка результата: секции и число строк
+SELECT inhparent::regclass AS parent, inhrelid::regclass AS partition
+FROM pg_inherits
+WHERE inhparent IN ('track_monthly_stats'::regclass, 'artist_monthly_stats'::regclass)
+ORDER BY 1, 2;
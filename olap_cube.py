@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OLAP куб: трек × платформа × страна × тип подписки × месяц
+
+precalc_data.py сохраняет исходные CSV в разрезе (трек, платформа, страна,
+тип подписки, месяц) в виде разреженного куба: измерения закодированы
+словарями (int32 коды в cube.npz, значения в cube_dims.json), метрики -
+стримы и выручка. OLAPCube.query считает произвольные срезы и
+агрегации (roll-up) векторно через numpy: фильтр - булевой маской по
+кодам, группировка - np.unique + np.bincount.
+
+PeriodIndex - помесячные накопленные суммы по трекам, артистам,
+платформам и странам: итоги за любой период без прохода по кубу.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+CUBE_FILE = "cube.npz"
+CUBE_DIMS_FILE = "cube_dims.json"
+
+# Измерения, хранящиеся в строках куба: колонка CSV для каждого
+CUBE_DIMENSIONS = {
+    'platform': 'Платформа',
+    'country': 'страна / регион',
+    'subscription': 'Тип абонемента на стриминг',
+    'month': 'Месяц отчета',
+}
+
+# track - ключ (ISRC, название, артист); artist и label - атрибуты трека
+# (в файле куба не хранятся построчно, берутся через код трека)
+GROUPABLE = ['track', 'artist', 'label'] + list(CUBE_DIMENSIONS)
+METRICS = ['streams', 'revenue', 'avg_rate']
+
+
+def _encode(values):
+    """Словарное кодирование: (int32 коды, список значений)"""
+    import pandas as pd
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int32), [str(v) for v in uniques]
+
+
+def build_cube(df_all) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+    """
+    Построить куб из объединённых CSV данных
+
+    Args:
+        df_all: DataFrame с колонками исходного отчёта и 'Основной артист'
+
+    Returns:
+        (массивы для cube.npz, словари измерений для cube_dims.json)
+    """
+    key_columns = ['ISRC', 'Название трека', 'Основной артист']
+    grouped = (
+        df_all.dropna(subset=key_columns)
+        .groupby(key_columns + list(CUBE_DIMENSIONS.values()), sort=False)
+        .agg({'Количество': 'sum', 'Сумма вознаграждения': 'sum', 'Лейбл': 'first'})
+        .reset_index()
+    )
+
+    # Ключ трека - как в tracks_aggregated.json
+    track_keys = grouped[key_columns].astype(str).agg('\x1f'.join, axis=1)
+    track_codes, _ = _encode(track_keys)
+    tracks = grouped.groupby(track_codes, sort=True).first()
+
+    artist_codes, artists = _encode(tracks['Основной артист'])
+    label_codes, labels = _encode(tracks['Лейбл'].fillna(''))
+
+    arrays = {
+        'track': track_codes,
+        'streams': grouped['Количество'].to_numpy(dtype=np.int64),
+        'revenue': grouped['Сумма вознаграждения'].to_numpy(dtype=np.float64),
+        'track_artist': artist_codes,
+        'track_label': label_codes,
+    }
+    dims = {
+        'track': tracks['Название трека'].astype(str).tolist(),
+        'isrc': tracks['ISRC'].astype(str).tolist(),
+        'artist': artists,
+        'label': labels,
+    }
+    for dim, column in CUBE_DIMENSIONS.items():
+        arrays[dim], dims[dim] = _encode(grouped[column].fillna(''))
+
+    return arrays, dims
+
+
+def save_cube(arrays: Dict[str, np.ndarray], dims: Dict[str, List[str]], output_dir: Path) -> List[Path]:
+    """Сохранить куб в output_dir (cube.npz + cube_dims.json)"""
+    cube_path = Path(output_dir) / CUBE_FILE
+    dims_path = Path(output_dir) / CUBE_DIMS_FILE
+    np.savez_compressed(cube_path, **arrays)
+    with open(dims_path, 'w', encoding='utf-8') as f:
+        json.dump(dims, f, ensure_ascii=False)
+    return [cube_path, dims_path]
+
+
+def top_indices(values: np.ndarray, limit: int) -> np.ndarray:
+    """Индексы limit наибольших значений (argpartition + сортировка только top-K)"""
+    if limit >= len(values):
+        return np.argsort(-values)
+    top = np.argpartition(-values, limit - 1)[:limit]
+    return top[np.argsort(-values[top])]
+
+
+class OLAPCube:
+    """
+    Куб в памяти с векторными запросами
+
+    Args:
+        arrays: колонки куба (коды измерений, streams, revenue,
+            track_artist, track_label)
+        dims: значения измерений по кодам
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], dims: Dict[str, List[str]]):
+        self.dims = dims
+        self.columns = {name: np.asarray(values) for name, values in arrays.items()}
+        track = self.columns['track']
+        # Атрибуты трека разворачиваем в колонки строк куба
+        # (из общей памяти куб приходит уже развёрнутым)
+        if 'artist' not in self.columns:
+            self.columns['artist'] = self.columns['track_artist'][track]
+        if 'label' not in self.columns:
+            self.columns['label'] = self.columns['track_label'][track]
+        self.rows = len(track)
+
+    @classmethod
+    def load(cls, data_dir: Path) -> "OLAPCube":
+        """Загрузить куб из data_dir"""
+        with np.load(Path(data_dir) / CUBE_FILE) as data:
+            arrays = {name: data[name] for name in data.files}
+        with open(Path(data_dir) / CUBE_DIMS_FILE, 'r', encoding='utf-8') as f:
+            dims = json.load(f)
+        return cls(arrays, dims)
+
+    def _allowed_codes(self, dim: str, value: Any) -> np.ndarray:
+        """Булева таблица по кодам измерения: значение подходит под фильтр"""
+        names = self.dims[dim]
+        values = value if isinstance(value, (list, tuple)) else [value]
+        needles = [str(v).lower() for v in values]
+        return np.array(
+            [any(needle in name.lower() for needle in needles) for name in names],
+            dtype=bool
+        )
+
+    def query(self, filters: Optional[Dict[str, Any]] = None,
+              group_by: Optional[List[str]] = None,
+              metrics: Optional[List[str]] = None,
+              limit: int = 50) -> Dict[str, Any]:
+        """
+        Срез и агрегация куба
+
+        Args:
+            filters: {измерение: значение или список значений}; сравнение -
+                вхождение подстроки без учёта регистра
+                (например {'artist': 'Yenlik', 'platform': 'Spotify', 'country': 'Kazakhstan'})
+            group_by: измерения группировки (track, artist, label, platform,
+                country, subscription, month); пусто - общий итог
+            metrics: streams, revenue, avg_rate (по умолчанию все)
+            limit: максимум строк результата (по убыванию первой метрики;
+                при группировке по месяцу - по порядку месяцев)
+
+        Returns:
+            {'rows': [...], 'total_groups': N, 'matched_rows': M} или {'error': ...}
+        """
+        filters = filters or {}
+        group_by = group_by or []
+        metrics = metrics or METRICS
+
+        unknown = [d for d in list(filters) + group_by if d not in GROUPABLE]
+        unknown += [m for m in metrics if m not in METRICS]
+        if unknown:
+            return {'error': f"Неизвестные измерения или метрики: {', '.join(unknown)}",
+                    'dimensions': GROUPABLE, 'metrics': METRICS}
+
+        mask = np.ones(self.rows, dtype=bool)
+        for dim, value in filters.items():
+            if value in (None, '', []):
+                continue
+            mask &= self._allowed_codes(dim, value)[self.columns[dim]]
+
+        streams = self.columns['streams'][mask]
+        revenue = self.columns['revenue'][mask]
+
+        if group_by:
+            codes = [self.columns[dim][mask] for dim in group_by]
+            sizes = [len(self.dims[dim]) for dim in group_by]
+            keys = np.ravel_multi_index(codes, sizes) if len(codes) > 1 else codes[0]
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            group_streams = np.bincount(inverse, weights=streams, minlength=len(unique_keys))
+            group_revenue = np.bincount(inverse, weights=revenue, minlength=len(unique_keys))
+            group_codes = np.unravel_index(unique_keys, sizes) if len(codes) > 1 else [unique_keys]
+        else:
+            group_streams = np.array([streams.sum()], dtype=np.float64)
+            group_revenue = np.array([revenue.sum()], dtype=np.float64)
+            group_codes = []
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            group_rate = np.where(group_streams > 0, group_revenue / group_streams, 0.0)
+        values = {'streams': group_streams, 'revenue': group_revenue, 'avg_rate': group_rate}
+
+        total_groups = len(group_streams)
+        if group_by == ['month']:
+            order = np.arange(total_groups)[:limit]
+        else:
+            # Частичная сортировка: top-K без полной сортировки всех групп
+            order = top_indices(values[metrics[0]], limit)
+
+        rows = []
+        for i in order:
+            row = {dim: self.dims[dim][int(codes[i])] for dim, codes in zip(group_by, group_codes)}
+            if 'track' in group_by and 'artist' not in group_by:
+                track = int(group_codes[group_by.index('track')][i])
+                row['artist'] = self.dims['artist'][int(self.columns['track_artist'][track])]
+            for metric in metrics:
+                row[metric] = int(values[metric][i]) if metric == 'streams' else float(values[metric][i])
+            rows.append(row)
+
+        return {
+            'rows': rows,
+            'total_groups': total_groups,
+            'matched_rows': int(mask.sum())
+        }
+
+
+def _month_key(month: str) -> str:
+    """'2025-07', '2025/07', '2025-07-01' → '2025/07'"""
+    return str(month).strip().replace('-', '/').replace('.', '/')[:7]
+
+
+class PeriodIndex:
+    """
+    Помесячные накопленные суммы по сущностям куба
+
+    Для каждого измерения (трек, артист, платформа, страна) хранится
+    матрица [сущность × (месяцев + 1)] накопленных стримов и выручки,
+    поэтому итог за любой период [start, end] - разность двух столбцов:
+    O(1) на сущность, без повторного прохода по кубу.
+
+    Args:
+        cube: OLAPCube
+    """
+
+    DIMENSIONS = ['track', 'artist', 'platform', 'country']
+
+    def __init__(self, cube: OLAPCube):
+        self.cube = cube
+        self.months = cube.dims['month']
+        self._month_keys = [_month_key(m) for m in self.months]
+        n_months = len(self.months)
+        month = cube.columns['month'].astype(np.int64)
+
+        self.cumulative = {}
+        for dim in self.DIMENSIONS:
+            n = len(cube.dims[dim])
+            keys = cube.columns[dim].astype(np.int64) * n_months + month
+            sums = {}
+            for metric in ('streams', 'revenue'):
+                monthly = np.bincount(keys, weights=cube.columns[metric], minlength=n * n_months)
+                cumulative = np.zeros((n, n_months + 1))
+                np.cumsum(monthly.reshape(n, n_months), axis=1, out=cumulative[:, 1:])
+                sums[metric] = cumulative
+            self.cumulative[dim] = sums
+
+    def month_range(self, start_month: Optional[str] = None, end_month: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Индексы месяцев периода [start_month, end_month] (включительно)
+
+        Returns:
+            (i, j) - срез месяцев [i, j); ValueError, если в периоде нет данных
+        """
+        start = _month_key(start_month) if start_month else self._month_keys[0]
+        end = _month_key(end_month) if end_month else self._month_keys[-1]
+        i = next((k for k, m in enumerate(self._month_keys) if m >= start), len(self.months))
+        j = next((k for k in range(len(self.months) - 1, -1, -1) if self._month_keys[k] <= end), -1) + 1
+        if i >= j:
+            raise ValueError(
+                f"Нет данных за период {start_month or '…'} - {end_month or '…'}; "
+                f"доступны месяцы {self.months[0]} - {self.months[-1]}"
+            )
+        return i, j
+
+    def totals(self, dim: str, i: int, j: int) -> Dict[str, np.ndarray]:
+        """Стримы, выручка и ставка каждой сущности измерения за месяцы [i, j)"""
+        sums = self.cumulative[dim]
+        streams = sums['streams'][:, j] - sums['streams'][:, i]
+        revenue = sums['revenue'][:, j] - sums['revenue'][:, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_rate = np.where(streams > 0, revenue / streams, 0.0)
+        return {'streams': streams, 'revenue': revenue, 'avg_rate': avg_rate}
+
+    def distinct_counts(self, dim: str, other: str, i: int, j: int) -> np.ndarray:
+        """Число различных значений other (трек, артист) на сущность dim за месяцы [i, j)"""
+        cube = self.cube
+        mask = (cube.columns['month'] >= i) & (cube.columns['month'] < j) & (cube.columns['streams'] > 0)
+        n_other = len(cube.dims[other])
+        pairs = np.unique(cube.columns[dim][mask].astype(np.int64) * n_other + cube.columns[other][mask])
+        return np.bincount(pairs // n_other, minlength=len(cube.dims[dim]))
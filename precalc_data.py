@@ -10,6 +10,33 @@ import json
 from pathlib import Path
 from datetime import datetime
 
+from olap_cube import build_cube, save_cube
+from sketches import group_sketches, merge_group_sketches
+
+TRACK_KEY = ['ISRC', 'Название трека', 'Основной артист']
+ARTIST_KEY = ['Основной артист', 'Лейбл']
+
+# Счётчики различных значений: (имя, ключ группы, колонка значений).
+# Считаются скетчами по каждому файлу и объединяются (sketches.py)
+DISTINCT_COUNTS = [
+    ('artist_tracks', ARTIST_KEY, 'Название трека'),
+    ('platform_tracks', 'Платформа', 'Название трека'),
+    ('platform_artists', 'Платформа', 'Основной артист'),
+    ('country_tracks', 'страна / регион', 'Название трека'),
+    ('country_artists', 'страна / регион', 'Основной артист'),
+]
+
+# Списки различных значений для загрузчика (load_data_to_db.py разбирает
+# 'platforms' / 'countries' по '|'): (имя, ключ группы, колонка значений).
+# Собираются из различных пар (ключ, значение) каждого файла - их немного,
+# и число различных значений по ним считается точно, без скетча
+DISTINCT_LISTS = [
+    ('track_platforms', TRACK_KEY, 'Платформа'),
+    ('track_countries', TRACK_KEY, 'страна / регион'),
+    ('artist_platforms', ARTIST_KEY, 'Платформа'),
+    ('artist_countries', ARTIST_KEY, 'страна / регион'),
+]
+
 def extract_main_artist(artist_string):
     """Извлекает основного артиста из строки с фитами"""
     if pd.isna(artist_string):
@@ -25,6 +52,215 @@ def extract_main_artist(artist_string):
     
     return artist_str
 
+def _dimension(values, id_column, name_column):
+    """Справочник с суррогатными ключами 1..N (как SERIAL в PostgreSQL)"""
+    names = sorted(set(v for v in values if pd.notna(v)), key=str)
+    return pd.DataFrame({id_column: range(1, len(names) + 1), name_column: names})
+
+
+def build_snapshot_tables(df_all, tracks_agg, artists_agg, platforms_agg, monthly_agg):
+    """
+    Таблицы схемы database_schema.sql из исходных данных и агрегатов
+
+    Ключи назначаются так же, как при загрузке load_data_to_db.py:
+    артист - пара (имя, лейбл), трек - (ISRC, название, артист).
+
+    Returns:
+        {имя таблицы: DataFrame}
+    """
+    labels = _dimension(
+        list(tracks_agg['label']) + list(artists_agg['label']), 'label_id', 'label_name'
+    )
+    label_ids = dict(zip(labels['label_name'], labels['label_id']))
+
+    artist_pairs = pd.concat([
+        artists_agg[['artist', 'label']], tracks_agg[['artist', 'label']]
+    ]).drop_duplicates().reset_index(drop=True)
+    artists = pd.DataFrame({
+        'artist_id': range(1, len(artist_pairs) + 1),
+        'artist_name': artist_pairs['artist'],
+        'label_id': artist_pairs['label'].map(label_ids)
+    })
+    artist_ids = {
+        (name, label): artist_id
+        for artist_id, name, label in zip(artists['artist_id'], artist_pairs['artist'], artist_pairs['label'])
+    }
+
+    tracks_agg = tracks_agg.reset_index(drop=True)
+    track_ids = pd.Series(range(1, len(tracks_agg) + 1))
+    tracks = pd.DataFrame({
+        'track_id': track_ids,
+        'track_name': tracks_agg['track'],
+        'artist_id': [artist_ids[(a, l)] for a, l in zip(tracks_agg['artist'], tracks_agg['label'])],
+        'label_id': tracks_agg['label'].map(label_ids),
+        'isrc': tracks_agg['isrc']
+    })
+    track_aggregates = pd.DataFrame({
+        'track_id': track_ids,
+        'total_revenue': tracks_agg['revenue'],
+        'total_streams': tracks_agg['streams'].astype('int64'),
+        'avg_rate': tracks_agg['avg_rate'],
+        'platforms_count': tracks_agg['platforms_count'],
+        'countries_count': tracks_agg['countries_count']
+    })
+
+    artist_aggregates = pd.DataFrame({
+        'artist_id': [artist_ids[(a, l)] for a, l in zip(artists_agg['artist'], artists_agg['label'])],
+        'total_revenue': artists_agg['revenue'].values,
+        'total_streams': artists_agg['streams'].astype('int64').values,
+        'tracks_count': artists_agg['tracks_count'].values,
+        'avg_rate': artists_agg['avg_rate'].values,
+        'avg_revenue_per_track': artists_agg['avg_revenue_per_track'].values,
+        'platforms_count': artists_agg['platforms_count'].values,
+        'countries_count': artists_agg['countries_count'].values
+    })
+
+    platforms = _dimension(df_all['Платформа'], 'platform_id', 'platform_name')
+    platform_ids = dict(zip(platforms['platform_name'], platforms['platform_id']))
+    platform_aggregates = pd.DataFrame({
+        'platform_id': platforms_agg['platform'].map(platform_ids).values,
+        'total_revenue': platforms_agg['revenue'].values,
+        'total_streams': platforms_agg['streams'].astype('int64').values,
+        'tracks_count': platforms_agg['tracks_count'].values,
+        'artists_count': platforms_agg['artists_count'].values,
+        'avg_rate': platforms_agg['avg_rate'].values
+    })
+
+    countries = _dimension(df_all['страна / регион'], 'country_id', 'country_name')
+    subscription_types = _dimension(
+        df_all['Тип абонемента на стриминг'], 'subscription_type_id', 'subscription_type_name'
+    )
+
+    # Детальная статистика: группировка по ключу трека + измерению
+    track_keys = pd.DataFrame({
+        'ISRC': tracks_agg['isrc'], 'Название трека': tracks_agg['track'],
+        'Основной артист': tracks_agg['artist'], 'track_id': track_ids
+    })
+    key_columns = ['ISRC', 'Название трека', 'Основной артист']
+
+    def track_stats(column, dimension, id_column, name_column, with_revenue=True):
+        values = ['Количество', 'Сумма вознаграждения'] if with_revenue else ['Количество']
+        grouped = df_all.groupby(key_columns + [column])[values].sum().reset_index()
+        grouped = grouped.merge(track_keys, on=key_columns)
+        grouped = grouped.merge(dimension, left_on=column, right_on=name_column)
+        result = pd.DataFrame({
+            'track_id': grouped['track_id'],
+            id_column: grouped[id_column],
+            'streams': grouped['Количество'].astype('int64')
+        })
+        if with_revenue:
+            result['revenue'] = grouped['Сумма вознаграждения']
+        return result
+
+    months = pd.DataFrame({'month': sorted(df_all['Месяц отчета'].dropna().unique())})
+    months['month_date'] = pd.to_datetime(months['month'], format='%Y/%m/%d').dt.date
+
+    track_monthly = df_all.groupby(key_columns + ['Месяц отчета'])[['Количество', 'Сумма вознаграждения']].sum().reset_index()
+    track_monthly = track_monthly.merge(track_keys, on=key_columns).merge(months, left_on='Месяц отчета', right_on='month')
+    track_monthly_stats = pd.DataFrame({
+        'track_id': track_monthly['track_id'],
+        'month_date': track_monthly['month_date'],
+        'streams': track_monthly['Количество'].astype('int64'),
+        'revenue': track_monthly['Сумма вознаграждения']
+    })
+
+    # Как в load_monthly_aggregated: первый артист с таким именем
+    first_artist = artists.drop_duplicates('artist_name')[['artist_name', 'artist_id']]
+    artist_monthly = monthly_agg.merge(first_artist, left_on='artist', right_on='artist_name').merge(months, on='month')
+    artist_monthly_stats = pd.DataFrame({
+        'artist_id': artist_monthly['artist_id'],
+        'month_date': artist_monthly['month_date'],
+        'streams': artist_monthly['streams'].astype('int64'),
+        'revenue': artist_monthly['revenue']
+    })
+
+    return {
+        'labels': labels,
+        'artists': artists,
+        'tracks': tracks,
+        'platforms': platforms,
+        'countries': countries,
+        'subscription_types': subscription_types,
+        'track_aggregates': track_aggregates,
+        'artist_aggregates': artist_aggregates,
+        'platform_aggregates': platform_aggregates,
+        'track_platform_stats': track_stats('Платформа', platforms, 'platform_id', 'platform_name'),
+        'track_country_stats': track_stats('страна / регион', countries, 'country_id', 'country_name'),
+        'track_subscription_stats': track_stats(
+            'Тип абонемента на стриминг', subscription_types,
+            'subscription_type_id', 'subscription_type_name', with_revenue=False
+        ),
+        'track_monthly_stats': track_monthly_stats,
+        'artist_monthly_stats': artist_monthly_stats,
+    }
+
+
+def write_parquet_snapshots(tables, output_dir):
+    """
+    Записать таблицы в <output_dir>/parquet/<таблица>.parquet
+
+    Снапшоты читает встроенный бэкенд duckdb_backend.py (SQL_BACKEND=duckdb).
+    Требует pyarrow; если его нет, снапшоты пропускаются.
+
+    Returns:
+        Список записанных файлов
+    """
+    parquet_dir = output_dir / "parquet"
+    parquet_dir.mkdir(exist_ok=True)
+
+    written = []
+    try:
+        for name, table in tables.items():
+            path = parquet_dir / f"{name}.parquet"
+            table.to_parquet(path, index=False)
+            written.append(path)
+    except ImportError as e:
+        print(f"⚠️  Parquet снапшоты пропущены ({e}); установите pyarrow")
+    return written
+
+
+def file_sketches(df):
+    """Скетчи различных значений для одного файла: {имя: {ключ группы: скетч}}"""
+    return {
+        name: group_sketches(df[key], df[column])
+        for name, key, column in DISTINCT_COUNTS
+    }
+
+
+def file_pairs(df):
+    """Различные пары (ключ группы, значение) одного файла: {имя: DataFrame}"""
+    return {
+        name: df[key + [column]].dropna(subset=[column]).drop_duplicates()
+        for name, key, column in DISTINCT_LISTS
+    }
+
+
+def distinct_lists(pair_frames, key, column):
+    """
+    '|'-списки различных значений по группам и их число
+
+    Returns:
+        (Series списков, Series чисел) с индексом по колонкам key
+    """
+    pairs = pd.concat(pair_frames, ignore_index=True).drop_duplicates()
+    pairs = pairs.sort_values(column, kind='stable')
+    grouped = pairs.groupby(key, sort=False)[column]
+    return grouped.agg('|'.join), grouped.size()
+
+
+def add_distinct_lists(agg, pairs, name, column):
+    """Колонки column ('|'-список) и column_count к агрегату с индексом по ключу группы"""
+    _, key, value_column = next(item for item in DISTINCT_LISTS if item[0] == name)
+    values, counts = distinct_lists(pairs[name], key, value_column)
+    agg[column] = values.reindex(agg.index).fillna('')
+    agg[f'{column}_count'] = counts.reindex(agg.index).fillna(0).astype(int)
+
+
+def sketch_counts(sketches, keys):
+    """Оценки числа различных значений для ключей групп (в порядке keys)"""
+    return [sketches[key].count() if key in sketches else 0 for key in keys]
+
+
 def precalculate_data():
     """Создает все необходимые агрегированные данные"""
     
@@ -46,6 +282,8 @@ def precalculate_data():
     ]
     
     all_data = []
+    sketches = {name: {} for name, _, _ in DISTINCT_COUNTS}
+    pairs = {name: [] for name, _, _ in DISTINCT_LISTS}
     
     # Загружаем все файлы
     for csv_file in csv_files:
@@ -68,6 +306,12 @@ def precalculate_data():
             # Добавляем основного артиста
             df['Основной артист'] = df['Исполнитель'].apply(extract_main_artist)
             
+            # Счётчики различных значений - скетчами по файлу, затем объединение
+            for name, file_sketch in file_sketches(df).items():
+                merge_group_sketches(sketches[name], file_sketch)
+            for name, file_pair in file_pairs(df).items():
+                pairs[name].append(file_pair)
+            
             all_data.append(df)
             print(f"✓ Загружено {len(df):,} записей")
             
@@ -90,15 +334,18 @@ def precalculate_data():
     
     # ВАЖНО: Группируем по ISRC (уникальный код записи), а не по названию
     # Один трек может быть в разных альбомах/релизах, но ISRC один
-    tracks_agg = df_all.groupby(['ISRC', 'Название трека', 'Основной артист']).agg({
+    tracks_agg = df_all.groupby(TRACK_KEY).agg({
         'Сумма вознаграждения': 'sum',
         'Количество': 'sum',
-        'Лейбл': 'first',  # Берём первый встретившийся лейбл
-        'Платформа': lambda x: '|'.join(sorted(set(x))),
-        'страна / регион': lambda x: '|'.join(sorted(set(x)))
-    }).reset_index()
-    
-    tracks_agg.columns = ['isrc', 'track', 'artist', 'revenue', 'streams', 'label', 'platforms', 'countries']
+        'Лейбл': 'first'  # Берём первый встретившийся лейбл
+    })
+    # Списки платформ и стран - из различных пар по файлам, а не set() по группам
+    add_distinct_lists(tracks_agg, pairs, 'track_platforms', 'platforms')
+    add_distinct_lists(tracks_agg, pairs, 'track_countries', 'countries')
+    tracks_agg = tracks_agg.reset_index()
+    
+    tracks_agg.columns = ['isrc', 'track', 'artist', 'revenue', 'streams', 'label',
+                          'platforms', 'platforms_count', 'countries', 'countries_count']
     tracks_agg['avg_rate'] = tracks_agg['revenue'] / tracks_agg['streams']
     tracks_agg = tracks_agg.sort_values('revenue', ascending=False)
     
@@ -111,15 +358,18 @@ def precalculate_data():
     # ============================================================================
     print(f"\n🎤 2. Агрегация по артистам...")
     
-    artists_agg = df_all.groupby(['Основной артист', 'Лейбл']).agg({
+    artists_agg = df_all.groupby(ARTIST_KEY).agg({
         'Сумма вознаграждения': 'sum',
-        'Количество': 'sum',
-        'Название трека': 'nunique',
-        'Платформа': lambda x: '|'.join(sorted(set(x))),
-        'страна / регион': lambda x: '|'.join(sorted(set(x)))
-    }).reset_index()
-    
-    artists_agg.columns = ['artist', 'label', 'revenue', 'streams', 'tracks_count', 'platforms', 'countries']
+        'Количество': 'sum'
+    })
+    add_distinct_lists(artists_agg, pairs, 'artist_platforms', 'platforms')
+    add_distinct_lists(artists_agg, pairs, 'artist_countries', 'countries')
+    artists_agg = artists_agg.reset_index()
+    
+    artists_agg.columns = ['artist', 'label', 'revenue', 'streams',
+                           'platforms', 'platforms_count', 'countries', 'countries_count']
+    artist_keys = list(zip(artists_agg['artist'], artists_agg['label']))
+    artists_agg['tracks_count'] = sketch_counts(sketches['artist_tracks'], artist_keys)
     artists_agg['avg_rate'] = artists_agg['revenue'] / artists_agg['streams']
     artists_agg['avg_revenue_per_track'] = artists_agg['revenue'] / artists_agg['tracks_count']
     artists_agg = artists_agg.sort_values('revenue', ascending=False)
@@ -135,12 +385,12 @@ def precalculate_data():
     
     platforms_agg = df_all.groupby('Платформа').agg({
         'Сумма вознаграждения': 'sum',
-        'Количество': 'sum',
-        'Название трека': 'nunique',
-        'Основной артист': 'nunique'
+        'Количество': 'sum'
     }).reset_index()
     
-    platforms_agg.columns = ['platform', 'revenue', 'streams', 'tracks_count', 'artists_count']
+    platforms_agg.columns = ['platform', 'revenue', 'streams']
+    platforms_agg['tracks_count'] = sketch_counts(sketches['platform_tracks'], platforms_agg['platform'])
+    platforms_agg['artists_count'] = sketch_counts(sketches['platform_artists'], platforms_agg['platform'])
     platforms_agg['avg_rate'] = platforms_agg['revenue'] / platforms_agg['streams']
     platforms_agg = platforms_agg.sort_values('revenue', ascending=False)
     
@@ -155,12 +405,12 @@ def precalculate_data():
     
     countries_agg = df_all.groupby('страна / регион').agg({
         'Сумма вознаграждения': 'sum',
-        'Количество': 'sum',
-        'Название трека': 'nunique',
-        'Основной артист': 'nunique'
+        'Количество': 'sum'
     }).reset_index()
     
-    countries_agg.columns = ['country', 'revenue', 'streams', 'tracks_count', 'artists_count']
+    countries_agg.columns = ['country', 'revenue', 'streams']
+    countries_agg['tracks_count'] = sketch_counts(sketches['country_tracks'], countries_agg['country'])
+    countries_agg['artists_count'] = sketch_counts(sketches['country_artists'], countries_agg['country'])
     countries_agg['avg_rate'] = countries_agg['revenue'] / countries_agg['streams']
     countries_agg = countries_agg.sort_values('revenue', ascending=False)
     
@@ -225,9 +475,29 @@ def precalculate_data():
     print(f"✓ Сохранено {len(track_details)} детальных записей → {details_file.name}")
     
     # ============================================================================
-    # 7. МЕТАДАННЫЕ
+    # 7. PARQUET СНАПШОТЫ (таблицы схемы БД для встроенного DuckDB бэкенда)
     # ============================================================================
-    print(f"\n📋 7. Создание метаданных...")
+    print(f"\n🗂️  7. Parquet снапшоты таблиц...")
+    
+    snapshot_tables = build_snapshot_tables(df_all, tracks_agg, artists_agg, platforms_agg, monthly_agg)
+    parquet_files = write_parquet_snapshots(snapshot_tables, output_dir)
+    if parquet_files:
+        print(f"✓ Сохранено {len(parquet_files)} таблиц → parquet/")
+    
+    # ============================================================================
+    # 8. OLAP КУБ (трек × платформа × страна × подписка × месяц)
+    # ============================================================================
+    print(f"\n🧊 8. OLAP куб...")
+    
+    cube_arrays, cube_dims = build_cube(df_all)
+    cube_files = save_cube(cube_arrays, cube_dims, output_dir)
+    print(f"✓ Сохранено {len(cube_arrays['track']):,} ячеек куба, "
+          f"{len(cube_dims['track']):,} треков → {cube_files[0].name}, {cube_files[1].name}")
+    
+    # ============================================================================
+    # 9. МЕТАДАННЫЕ
+    # ============================================================================
+    print(f"\n📋 9. Создание метаданных...")
     
     metadata = {
         'generated_at': datetime.now().isoformat(),
@@ -252,7 +522,9 @@ def precalculate_data():
             'countries': 'countries_aggregated.json',
             'monthly': 'monthly_aggregated.json',
             'details': 'track_details.json'
-        }
+        },
+        'parquet': [f"parquet/{path.name}" for path in parquet_files],
+        'cube': {'data': cube_files[0].name, 'dims': cube_files[1].name}
     }
     
     metadata_file = output_dir / "metadata.json"
@@ -276,7 +548,7 @@ def precalculate_data():
     print(f"   • Стран: {df_all['страна / регион'].nunique():,}")
     
     print(f"\n📁 Созданные файлы в {output_dir}:")
-    for file in output_dir.glob("*.json"):
+    for file in sorted(output_dir.glob("*.json")) + sorted(output_dir.glob("*.npz")):
         size_kb = file.stat().st_size / 1024
         print(f"   • {file.name} ({size_kb:.1f} KB)")
     
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Структурированный лог запросов SQL агента
+
+Каждый запрос (вопрос, SQL, отпечаток SQL, время LLM и БД, число строк,
+статус кэша) ставится в очередь и записывается в локальную SQLite базу
+фоновым потоком, поэтому запись не добавляет задержку к ответу API.
+"""
+
+import hashlib
+import math
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_COLUMNS = [
+    'ts', 'service', 'question', 'sql', 'fingerprint', 'normalized_sql',
+    'llm_ms', 'db_ms', 'total_ms', 'row_count', 'cache_status',
+    'guard_decision', 'success', 'error'
+]
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS query_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    service TEXT,
+    question TEXT,
+    sql TEXT,
+    fingerprint TEXT,
+    normalized_sql TEXT,
+    llm_ms REAL,
+    db_ms REAL,
+    total_ms REAL,
+    row_count INTEGER,
+    cache_status TEXT,
+    guard_decision TEXT,
+    success INTEGER,
+    error TEXT
+)
+"""
+
+
+def normalize_sql_text(sql: str) -> str:
+    """Заменяет литералы на '?' и схлопывает пробелы"""
+    text = _STRING_LITERAL_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = _WHITESPACE_RE.sub(' ', text).strip().rstrip(';').strip()
+    return text.lower()
+
+
+def fingerprint_sql(sql: Optional[str]) -> Optional[str]:
+    """Отпечаток SQL: одинаковый для запросов, отличающихся только литералами"""
+    if not sql:
+        return None
+    return hashlib.md5(normalize_sql_text(sql).encode('utf-8')).hexdigest()[:16]
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """
+    Перцентиль методом ближайшего ранга: наименьшее значение, не меньше
+    которого p% замеров (ранг ceil(p/100 * n))
+
+    Общий для лога запросов, бенчмарков и гистограмм llm_client.
+
+    Args:
+        sorted_values: замеры, отсортированные по возрастанию
+        p: перцентиль, 0-100
+
+    Returns:
+        Значение или None, если замеров нет
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _rounded_percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    value = percentile(sorted_values, p)
+    return round(value, 2) if value is not None else None
+
+
+def _latency_summary(values: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    values = sorted(v for v in values if v is not None)
+    return {
+        'p50': _rounded_percentile(values, 50),
+        'p95': _rounded_percentile(values, 95),
+        'p99': _rounded_percentile(values, 99),
+        'count': len(values)
+    }
+
+
+class QueryLog:
+    """Асинхронный лог запросов в SQLite"""
+
+    def __init__(self, path: str = "query_log.db", max_queue: int = 10000, batch_size: int = 100):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_writer(self):
+        """Запускает фоновый поток записи при первом обращении"""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._writer, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        """Фоновый поток: пачками пишет записи из очереди в SQLite"""
+        conn = sqlite3.connect(self.path)
+        conn.execute(_CREATE_TABLE)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_log_ts ON query_log(ts)")
+        conn.commit()
+
+        placeholders = ', '.join('?' for _ in _COLUMNS)
+        insert_sql = f"INSERT INTO query_log ({', '.join(_COLUMNS)}) VALUES ({placeholders})"
+
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                conn.executemany(insert_sql, [[entry.get(c) for c in _COLUMNS] for entry in batch])
+                conn.commit()
+            except sqlite3.Error:
+                self.dropped += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def record(self, question: str, sql: Optional[str], llm_ms: Optional[float] = None,
+               db_ms: Optional[float] = None, row_count: Optional[int] = None,
+               cache_status: str = "miss", success: bool = True, error: Optional[str] = None,
+               guard_decision: Optional[str] = None, service: str = "sql_agent"):
+        """
+        Поставить запись в очередь (не блокирует запрос)
+
+        Args:
+            question: вопрос пользователя
+            sql: выполненный SQL
+            llm_ms: время генерации SQL (мс)
+            db_ms: время выполнения в БД (мс)
+            row_count: число возвращённых строк
+            cache_status: статус кэша ('miss', 'hit', ...)
+        """
+        self._ensure_writer()
+        timings = [v for v in (llm_ms, db_ms) if v is not None]
+        # Без LLM и БД (ответ от параллельного запроса, 'coalesced') - времени нет
+        total_ms = sum(timings) if timings else None
+        entry = {
+            'ts': time.time(),
+            'service': service,
+            'question': question,
+            'sql': sql,
+            'fingerprint': fingerprint_sql(sql),
+            'normalized_sql': normalize_sql_text(sql) if sql else None,
+            'llm_ms': llm_ms,
+            'db_ms': db_ms,
+            'total_ms': total_ms,
+            'row_count': row_count,
+            'cache_status': cache_status,
+            'guard_decision': guard_decision,
+            'success': int(bool(success)),
+            'error': error
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Дождаться записи всех записей из очереди"""
+        if self._thread and self._thread.is_alive():
+            self._queue.join()
+
+    def _fetch(self, limit: int, since_hours: Optional[float]) -> List[sqlite3.Row]:
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute(_CREATE_TABLE)
+            since = time.time() - since_hours * 3600 if since_hours else 0
+            return conn.execute(
+                "SELECT * FROM query_log WHERE ts >= ? ORDER BY ts DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def summary(self, limit: int = 10000, since_hours: Optional[float] = None, top: int = 10) -> Dict[str, Any]:
+        """
+        Сводка по последним запросам
+
+        Args:
+            limit: сколько последних записей учитывать
+            since_hours: окно по времени (часы), None - без ограничения
+            top: сколько самых медленных отпечатков вернуть
+
+        Returns:
+            Перцентили p50/p95/p99 для LLM, БД и общего времени
+            и самые медленные отпечатки SQL
+        """
+        rows = self._fetch(limit, since_hours)
+
+        by_fingerprint: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            if row['fingerprint']:
+                by_fingerprint.setdefault(row['fingerprint'], []).append(row)
+
+        slowest = []
+        for fingerprint, group in by_fingerprint.items():
+            totals = sorted(r['total_ms'] for r in group if r['total_ms'] is not None)
+            db_times = [r['db_ms'] for r in group if r['db_ms'] is not None]
+            row_counts = [r['row_count'] for r in group if r['row_count'] is not None]
+            slowest.append({
+                'fingerprint': fingerprint,
+                'sample_sql': group[0]['normalized_sql'],
+                'count': len(group),
+                'avg_total_ms': round(sum(totals) / len(totals), 2) if totals else None,
+                'p95_total_ms': _rounded_percentile(totals, 95),
+                'avg_db_ms': round(sum(db_times) / len(db_times), 2) if db_times else None,
+                'avg_rows': round(sum(row_counts) / len(row_counts), 1) if row_counts else None
+            })
+        slowest.sort(key=lambda x: x['p95_total_ms'] or 0, reverse=True)
+
+        cache_statuses: Dict[str, int] = {}
+        for row in rows:
+            status = row['cache_status'] or 'unknown'
+            cache_statuses[status] = cache_statuses.get(status, 0) + 1
+
+        return {
+            'count': len(rows),
+            'since': datetime.fromtimestamp(rows[-1]['ts']).isoformat() if rows else None,
+            'errors': sum(1 for r in rows if not r['success']),
+            'dropped': self.dropped,
+            'cache_status': cache_statuses,
+            'latency_ms': {
+                'llm': _latency_summary([r['llm_ms'] for r in rows]),
+                'db': _latency_summary([r['db_ms'] for r in rows]),
+                'total': _latency_summary([r['total_ms'] for r in rows])
+            },
+            'slowest_fingerprints': slowest[:top]
+        }
+
+    def logged_sql(self, limit: int = 1000) -> List[str]:
+        """SQL запросы из лога (уникальные по отпечатку, самые медленные первыми)"""
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(_CREATE_TABLE)
+            rows = conn.execute("""
+                SELECT sql, MAX(total_ms) AS slowest
+                FROM query_log
+                WHERE sql IS NOT NULL AND success = 1
+                GROUP BY fingerprint
+                ORDER BY slowest DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактные записи прекалькулированных данных
+
+json.load даёт по словарю на трек/артиста с повторяющимися ключами и
+отдельными строковыми объектами, а track_details - словари словарей
+по каждой платформе, стране и месяцу. Здесь те же данные хранятся
+компактно:
+
+- TrackRecord / ArtistRecord / TrackDetail - классы со __slots__ (без
+  __dict__ на экземпляр), строковые значения интернированы (одно имя
+  артиста / лейбла - один объект на все записи);
+- разбивки (platforms, countries, monthly, subscription_types) - Breakdown:
+  коды измерения (array 'H' / 'I') в общем словаре Vocabulary плюс
+  массивы стримов и дохода вместо словаря словарей.
+
+Записи реализуют Mapping, поэтому код AnalyticsTools, intent_router и
+to_tool_json обращается к ним как к словарям (record['revenue'],
+record.get(...), .items()); обычные словари собираются только при
+сериализации (to_dict / dict(record)).
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Optional
+
+# Ключи метрик в разбивках track_details (как в исходных CSV)
+STREAMS_KEY = 'Количество'
+REVENUE_KEY = 'Сумма вознаграждения'
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Vocabulary:
+    """Словарь значений измерения: имя ↔ целочисленный код"""
+
+    __slots__ = ('names', '_codes')
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self.names)
+            name = _intern(name)
+            self.names.append(name)
+            self._codes[name] = code
+        return code
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class Breakdown(Mapping):
+    """
+    Разбивка трека по измерению: {имя: {'Количество', 'Сумма вознаграждения'}}
+
+    Без дохода (subscription_types) значения - просто число стримов.
+    """
+
+    __slots__ = ('vocabulary', 'codes', 'streams', 'revenue')
+
+    def __init__(self, vocabulary: Vocabulary, codes: array, streams: array,
+                 revenue: Optional[array] = None):
+        self.vocabulary = vocabulary
+        self.codes = codes
+        self.streams = streams
+        self.revenue = revenue
+
+    @classmethod
+    def from_dict(cls, vocabulary: Vocabulary, data: Dict[str, Any]) -> "Breakdown":
+        codes = array('H' if len(vocabulary) + len(data) <= 0xFFFF else 'I',
+                      [vocabulary.code(name) for name in data])
+        if all(isinstance(v, Mapping) for v in data.values()):
+            streams = [v.get(STREAMS_KEY, 0) for v in data.values()]
+            revenue = array('d', [v.get(REVENUE_KEY, 0.0) for v in data.values()])
+        else:
+            streams = list(data.values())
+            revenue = None
+        typecode = 'q' if all(isinstance(s, int) for s in streams) else 'd'
+        return cls(vocabulary, codes, array(typecode, streams), revenue)
+
+    def _value(self, i: int):
+        if self.revenue is None:
+            return self.streams[i]
+        return {STREAMS_KEY: self.streams[i], REVENUE_KEY: self.revenue[i]}
+
+    def __getitem__(self, name: str):
+        for i, code in enumerate(self.codes):
+            if self.vocabulary.names[code] == name:
+                return self._value(i)
+        raise KeyError(name)
+
+    def __iter__(self):
+        names = self.vocabulary.names
+        return (names[code] for code in self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def items(self):
+        names = self.vocabulary.names
+        return [(names[code], self._value(i)) for i, code in enumerate(self.codes)]
+
+    def values(self):
+        return [self._value(i) for i in range(len(self.codes))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+
+class Record(Mapping):
+    """
+    Базовая запись со __slots__ и интерфейсом словаря
+
+    Подклассы задают FIELDS (поля в порядке JSON файла); отсутствующие
+    в исходной записи поля хранятся как _MISSING и не видны как ключи.
+    """
+
+    __slots__ = ()
+    FIELDS: tuple = ()
+    # Поля-разбивки: {поле: имя словаря Vocabulary}
+    BREAKDOWNS: Dict[str, str] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any],
+                  vocabularies: Optional[Dict[str, Vocabulary]] = None) -> "Record":
+        record = cls.__new__(cls)
+        for field in cls.FIELDS:
+            value = data.get(field, _MISSING)
+            if field in cls.BREAKDOWNS and isinstance(value, Mapping):
+                value = Breakdown.from_dict(vocabularies[cls.BREAKDOWNS[field]], value)
+            else:
+                value = _intern(value)
+            object.__setattr__(record, field, value)
+        return record
+
+    def __getitem__(self, key: str):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (field for field in self.FIELDS if getattr(self, field) is not _MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Обычный словарь (вложенные разбивки - тоже словари)"""
+        return {
+            key: value.to_dict() if isinstance(value, Breakdown) else value
+            for key, value in ((key, getattr(self, key)) for key in self)
+        }
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return '<missing>'
+
+
+_MISSING = _Missing()
+
+
+class TrackRecord(Record):
+    """Запись tracks_aggregated.json"""
+
+    FIELDS = ('isrc', 'track', 'artist', 'revenue', 'streams', 'label', 'platforms',
+              'countries', 'avg_rate', 'platforms_count', 'countries_count')
+    __slots__ = FIELDS
+
+
+class ArtistRecord(Record):
+    """Запись artists_aggregated.json"""
+
+    FIELDS = ('artist', 'label', 'revenue', 'streams', 'platforms', 'countries', 'tracks_count',
+              'platforms_count', 'countries_count', 'avg_rate', 'avg_revenue_per_track')
+    __slots__ = FIELDS
+
+
+class TrackDetail(Record):
+    """Запись track_details.json (разбивки - Breakdown)"""
+
+    FIELDS = ('isrc', 'track', 'artist', 'label', 'total_revenue', 'total_streams', 'avg_rate',
+              'platforms', 'countries', 'subscription_types', 'monthly')
+    BREAKDOWNS = {
+        'platforms': 'platform', 'countries': 'country',
+        'subscription_types': 'subscription', 'monthly': 'month'
+    }
+    __slots__ = FIELDS
+
+
+def to_plain(value: Any) -> Any:
+    """Запись / разбивка → словарь (default= для json.dumps)"""
+    if isinstance(value, (Record, Breakdown)):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def build_records(cls, items: Iterable[Dict[str, Any]],
+                  vocabularies: Optional[Dict[str, Vocabulary]] = None) -> List[Record]:
+    """Список словарей → список записей cls"""
+    if vocabularies is None:
+        vocabularies = {name: Vocabulary() for name in cls.BREAKDOWNS.values()}
+    return [cls.from_dict(item, vocabularies) for item in items]
+
+
+def deep_sizeof(value: Any, seen: Optional[set] = None) -> int:
+    """Размер объекта в памяти вместе со вложенными (общие объекты - один раз)"""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in value)
+    elif isinstance(value, Breakdown):
+        size += sum(deep_sizeof(getattr(value, s), seen) for s in ('codes', 'streams', 'revenue'))
+    elif isinstance(value, Record):
+        size += sum(deep_sizeof(getattr(value, f), seen) for f in value.FIELDS)
+    return size
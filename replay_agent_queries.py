@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение запросов SQL агента и замер латентности до/после индексов
+
+Примеры:
+    # Замер на стандартном наборе запросов, применение индексов, повторный замер
+    python replay_agent_queries.py --apply migration_agent_indexes.sql
+
+    # Замер на залогированных запросах агента (лог query_log.db или JSONL)
+    python replay_agent_queries.py --queries query_log.db --output before.json
+    python replay_agent_queries.py --queries query_log.db --baseline before.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import psycopg2
+from dotenv import load_dotenv
+
+from query_log import QueryLog, percentile
+
+load_dotenv('.env.db')
+
+# Параметры подключения
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'database': os.getenv('DB_NAME', 'music_analytics'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', '')
+}
+
+# Типичные запросы агента (примеры из промпта sql_agent_fastapi.py)
+DEFAULT_WORKLOAD = [
+    "SELECT ROUND(SUM(aa.total_revenue)::numeric, 2) AS total_revenue FROM artists a JOIN artist_aggregates aa ON a.artist_id = aa.artist_id WHERE a.artist_name ILIKE 'Yenlik'",
+    "SELECT * FROM v_top_tracks_by_revenue LIMIT 10",
+    "SELECT t.track_name, a.artist_name, ta.total_revenue, ta.total_streams FROM tracks t JOIN artists a ON t.artist_id = a.artist_id JOIN track_aggregates ta ON t.track_id = ta.track_id WHERE a.artist_name ILIKE 'Yenlik' ORDER BY ta.total_revenue DESC LIMIT 5",
+    "SELECT a.artist_name, p.platform_name, SUM(tps.revenue) as total_revenue, SUM(tps.streams) as total_streams FROM artists a JOIN tracks t ON a.artist_id = t.artist_id JOIN track_platform_stats tps ON t.track_id = tps.track_id JOIN platforms p ON tps.platform_id = p.platform_id WHERE a.artist_name ILIKE 'Yenlik' AND p.platform_name ILIKE 'Spotify' GROUP BY a.artist_name, p.platform_name",
+    "SELECT t.track_name, SUM(tcs.streams) AS streams FROM tracks t JOIN track_country_stats tcs ON t.track_id = tcs.track_id WHERE t.track_name ILIKE '%Meili%' GROUP BY t.track_name",
+    "SELECT ams.month_date, ams.streams, ams.revenue FROM artist_monthly_stats ams JOIN artists a ON ams.artist_id = a.artist_id WHERE a.artist_name ILIKE '%Yenlik%' ORDER BY ams.month_date",
+]
+
+# Узлы плана, по которым видно, используется ли индекс
+SCAN_NODES = {'Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan'}
+
+
+def load_workload(path: Optional[str]) -> List[str]:
+    """
+    Загрузить запросы для воспроизведения
+
+    Поддерживаются лог агента (query_log.db), JSONL (поле "sql" в каждой
+    строке) и .sql файлы (запросы разделены ';').
+    Без файла используется DEFAULT_WORKLOAD.
+    """
+    if not path:
+        return list(DEFAULT_WORKLOAD)
+
+    if path.endswith('.db'):
+        return QueryLog(path).logged_sql()
+
+    text = Path(path).read_text(encoding='utf-8')
+    if path.endswith('.sql'):
+        queries = [q.strip() for q in text.split(';')]
+    else:
+        queries = []
+        for line in text.splitlines():
+            if line.strip():
+                queries.append(json.loads(line).get('sql') or '')
+
+    # Убираем пустые и повторяющиеся запросы, сохраняя порядок
+    seen = set()
+    result = []
+    for query in queries:
+        query = query.strip().rstrip(';').strip()
+        if query and query not in seen:
+            seen.add(query)
+            result.append(query)
+    return result
+
+
+def collect_scan_nodes(plan: Dict[str, Any], found: set):
+    """Рекурсивно собирает типы scan-узлов плана"""
+    if plan.get('Node Type') in SCAN_NODES:
+        name = plan.get('Index Name') or plan.get('Relation Name') or ''
+        found.add(f"{plan['Node Type']}({name})")
+    for child in plan.get('Plans', []):
+        collect_scan_nodes(child, found)
+
+
+def measure_query(cursor, sql: str, runs: int) -> Dict[str, Any]:
+    """Замер одного запроса: прогрев + runs выполнений"""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+    plan = cursor.fetchone()[0][0]['Plan']
+    scans = set()
+    collect_scan_nodes(plan, scans)
+
+    cursor.execute(sql)
+    cursor.fetchall()
+
+    timings = []
+    rows = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        rows = len(cursor.fetchall())
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'sql': sql,
+        'rows': rows,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'plan_cost': plan['Total Cost'],
+        'scans': sorted(scans)
+    }
+
+
+def run_workload(conn, queries: List[str], runs: int) -> List[Dict[str, Any]]:
+    """Замер всех запросов"""
+    cursor = conn.cursor()
+    results = []
+    for i, sql in enumerate(queries, 1):
+        try:
+            result = measure_query(cursor, sql, runs)
+        except Exception as e:
+            conn.rollback()
+            result = {'sql': sql, 'error': str(e)}
+        results.append(result)
+        status = f"{result['median_ms']:.2f} ms" if 'error' not in result else f"❌ {result['error'].strip()}"
+        print(f"   [{i}/{len(queries)}] {status}")
+    cursor.close()
+    # Закрываем неявную транзакцию psycopg2 (запросы только читают), иначе
+    # apply_sql_file не сможет переключить соединение в autocommit
+    conn.rollback()
+    return results
+
+
+def apply_sql_file(conn, path: str):
+    """Применить файл миграции (операторы по одному, вне транзакции)"""
+    print(f"\n🛠️  Применение {path}...")
+    text = Path(path).read_text(encoding='utf-8')
+    lines = [line for line in text.splitlines() if not line.strip().startswith('--')]
+    statements = [s.strip() for s in '\n'.join(lines).split(';') if s.strip()]
+
+    conn.rollback()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+    conn.autocommit = False
+    print(f"✅ Выполнено операторов: {len(statements)}")
+
+
+def print_report(before: List[Dict[str, Any]], after: List[Dict[str, Any]]):
+    """Сравнительная таблица до/после"""
+    print("\n" + "=" * 80)
+    print("📊 ЛАТЕНТНОСТЬ ЗАПРОСОВ (медиана)")
+    print("=" * 80)
+    print(f"{'#':>3} {'до, ms':>10} {'после, ms':>10} {'ускорение':>10}  план после")
+
+    after_by_sql = {r['sql']: r for r in after}
+    for i, old in enumerate(before, 1):
+        new = after_by_sql.get(old['sql'])
+        if not new or 'error' in old or 'error' in new:
+            print(f"{i:>3} {'—':>10} {'—':>10} {'—':>10}  ошибка")
+            continue
+        speedup = old['median_ms'] / new['median_ms'] if new['median_ms'] > 0 else 0
+        print(f"{i:>3} {old['median_ms']:>10.2f} {new['median_ms']:>10.2f} {speedup:>9.1f}x  {', '.join(new['scans'])}")
+
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение запросов SQL агента")
+    parser.add_argument('--queries', help="query_log.db, JSONL или .sql файл с запросами (по умолчанию - примеры агента)")
+    parser.add_argument('--runs', type=int, default=5, help="Количество замеров на запрос")
+    parser.add_argument('--apply', help="Файл миграции, который применяется между замерами")
+    parser.add_argument('--baseline', help="JSON отчёт предыдущего замера для сравнения")
+    parser.add_argument('--output', help="Куда сохранить JSON отчёт")
+    args = parser.parse_args()
+
+    queries = load_workload(args.queries)
+
+    print("=" * 80)
+    print("  🔁 ВОСПРОИЗВЕДЕНИЕ ЗАПРОСОВ SQL АГЕНТА")
+    print("=" * 80)
+    print(f"Запросов: {len(queries)}, замеров на запрос: {args.runs}")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        before = None
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                before = json.load(f)['results']
+        elif args.apply:
+            print("\n⏱️  Замер ДО")
+            before = run_workload(conn, queries, args.runs)
+
+        if args.apply:
+            apply_sql_file(conn, args.apply)
+
+        print("\n⏱️  Замер" + (" ПОСЛЕ" if before is not None else ""))
+        after = run_workload(conn, queries, args.runs)
+
+        if before is not None:
+            print_report(before, after)
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'results': after}, f, ensure_ascii=False, indent=2)
+            print(f"\n💾 Отчёт сохранён → {args.output}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
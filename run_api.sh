@@ -8,5 +8,5 @@ echo ""
 # Активируем виртуальное окружение
 source venv/bin/activate
 
-# Запускаем сервер
+# Запускаем сервер (API_WORKERS=4 - несколько воркеров с общими данными в shared memory)
 python main.py
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Данные AnalyticsTools в общей памяти (multiprocessing.shared_memory)
+
+При запуске API в несколько процессов (uvicorn --workers N) каждый
+процесс держал бы свою копию данных в виде Python словарей. Вместо
+этого один процесс публикует снапшот в сегмент общей памяти, а рабочие
+процессы подключаются к нему только на чтение:
+
+- числовые колонки - numpy массивы прямо поверх сегмента;
+- строковые колонки - смещения (int64) + общий блок UTF-8 байт;
+- вложенные значения (разбивки track_details, метаданные) - JSON строки.
+
+SharedRecords ведёт себя как список словарей (len, индекс, итерация),
+поэтому методы AnalyticsTools работают без изменений. Запись - SharedRecord,
+представление строки: колонка читается (а JSON разбирается) только при
+обращении к ключу, поэтому линейный поиск по track / artist не декодирует
+разбивки каждой записи. Для строковых колонок хранится и копия в нижнем
+регистре: поиск подстроки (contains) идёт по общему блоку байт, а top
+сортирует числовую колонку numpy, не собирая записи.
+
+Публикация:
+    python shared_dataset.py publish            # держит сегмент до Ctrl+C
+    ANALYTICS_SHM_NAME=music_analytics uvicorn main:app --workers 4
+
+main.py при API_WORKERS > 1 публикует данные сам перед запуском воркеров.
+"""
+
+import json
+import signal
+from bisect import bisect_right
+import sys
+from multiprocessing import shared_memory
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from records import to_plain
+
+DEFAULT_SHM_NAME = "music_analytics"
+
+# Списки записей AnalyticsTools, которые публикуются колонками
+RECORD_TABLES = ['tracks', 'artists', 'platforms', 'countries', 'monthly', 'track_details']
+
+_ALIGN = 8
+_HEADER = 8  # длина манифеста (uint64) в начале сегмента
+
+
+class SharedStrings(Sequence):
+    """Список строк поверх смещений и блока UTF-8 байт"""
+
+    __slots__ = ('offsets', 'blob')
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+    def find(self, needle: str) -> List[int]:
+        """Индексы строк, содержащих needle (по возрастанию, без повторов)"""
+        if not needle:
+            return list(range(len(self)))
+        pattern = needle.encode('utf-8')
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        indices = []
+        position = blob.find(pattern)
+        while position != -1:
+            index = bisect_right(offsets, position) - 1
+            end = offsets[index + 1]
+            if position + len(pattern) <= end:
+                indices.append(index)
+                # Остальные вхождения в этой строке не нужны
+                position = blob.find(pattern, end)
+            else:
+                # Совпадение на стыке двух строк - ищем дальше
+                position = blob.find(pattern, position + 1)
+        return indices
+
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+# Значение отсутствующего в записи ключа (в JSON колонке)
+_MISSING = object()
+
+
+class _JSONColumn(Sequence):
+    """Колонка вложенных значений (JSON строки; пустая строка - ключа нет)"""
+
+    __slots__ = ('strings',)
+
+    def __init__(self, strings: SharedStrings):
+        self.strings = strings
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __getitem__(self, index):
+        strings = self.strings
+        start, end = strings.offsets[index], strings.offsets[index + 1]
+        if start == end:
+            return _MISSING
+        return _loads(strings.blob[start:end].tobytes())
+
+    def has(self, index: int) -> bool:
+        """Есть ли ключ в записи (без разбора JSON)"""
+        offsets = self.strings.offsets
+        return offsets[index + 1] > offsets[index]
+
+
+class SharedRecord(Mapping):
+    """Запись SharedRecords: значения читаются из колонок при обращении"""
+
+    __slots__ = ('_records', '_index', '_decoded')
+
+    def __init__(self, records: "SharedRecords", index: int):
+        self._records = records
+        self._index = index
+        self._decoded = None
+
+    def __getitem__(self, key: str):
+        column = self._records.columns.get(key)
+        if column is None:
+            raise KeyError(key)
+        if isinstance(column, _JSONColumn):
+            # Разобранный JSON запоминается на время жизни записи
+            if self._decoded is None:
+                self._decoded = {}
+            if key not in self._decoded:
+                self._decoded[key] = column[self._index]
+            value = self._decoded[key]
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return _python_value(column[self._index])
+
+    def __contains__(self, key) -> bool:
+        column = self._records.columns.get(key)
+        if column is None:
+            return False
+        return column.has(self._index) if isinstance(column, _JSONColumn) else True
+
+    def __iter__(self):
+        return (name for name in self._records.columns if name in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    def __repr__(self) -> str:
+        return f"SharedRecord({self.to_dict()!r})"
+
+
+class SharedRecords(Sequence):
+    """Список записей-словарей поверх колонок в общей памяти"""
+
+    __slots__ = ('columns', '_lower', '_length')
+
+    def __init__(self, columns: Dict[str, Sequence], length: int,
+                 lower: Optional[Dict[str, SharedStrings]] = None):
+        self.columns = columns
+        self._lower = lower or {}
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return SharedRecord(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield SharedRecord(self, index)
+
+    def contains(self, field: str, query: str) -> List[SharedRecord]:
+        """
+        Записи, у которых query входит в field без учёта регистра
+
+        То же, что [r for r in records if query.lower() in r[field].lower()],
+        но поиск идёт по байтам колонки в нижнем регистре.
+        """
+        lower = self._lower.get(field)
+        if lower is None:
+            query_lower = query.lower()
+            return [record for record in self if query_lower in record[field].lower()]
+        return [SharedRecord(self, index) for index in lower.find(query.lower())]
+
+    def top(self, field: str, limit: int) -> List[SharedRecord]:
+        """
+        limit записей с наибольшим field
+
+        То же, что sorted(records, key=lambda r: r.get(field, 0), reverse=True)[:limit]
+        (равные значения - в исходном порядке).
+        """
+        column = self.columns.get(field)
+        if column is None:
+            # Поля нет ни в одной записи - все ключи сортировки равны 0
+            return self[:limit]
+        if not isinstance(column, np.ndarray):
+            return sorted(self, key=lambda record: record.get(field, 0), reverse=True)[:limit]
+        order = np.argsort(-column, kind='stable')[:max(limit, 0)]
+        return [SharedRecord(self, int(index)) for index in order]
+
+
+def _python_value(value):
+    """numpy скаляр → int / float Python"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _column_kind(values: List[Any]) -> str:
+    """Как хранить колонку: int, float, str или json"""
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return 'int'
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return 'float'
+    if all(isinstance(v, str) for v in values):
+        return 'str'
+    return 'json'
+
+
+def _encode_strings(values: List[str]):
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, blob
+
+
+class _SegmentWriter:
+    """Раскладка массивов в сегменте и манифест для подключения"""
+
+    def __init__(self):
+        self.arrays: List[np.ndarray] = []
+        self.size = 0
+
+    def add(self, array: np.ndarray) -> Dict[str, Any]:
+        array = np.ascontiguousarray(array)
+        offset = self.size
+        self.arrays.append((offset, array))
+        self.size += (array.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+        return {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def add_strings(self, values: List[str]) -> Dict[str, Any]:
+        offsets, blob = _encode_strings(values)
+        return {'offsets': self.add(offsets), 'blob': self.add(blob)}
+
+    def add_records(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        names = []
+        for record in records:
+            for name in record:
+                if name not in names:
+                    names.append(name)
+
+        columns = {}
+        for name in names:
+            values = [record.get(name, _MISSING) for record in records]
+            kind = _column_kind(values)
+            if kind == 'int':
+                columns[name] = {'kind': kind, 'data': self.add(np.array(values, dtype=np.int64))}
+            elif kind == 'float':
+                columns[name] = {'kind': kind, 'data': self.add(np.array(values, dtype=np.float64))}
+            elif kind == 'str':
+                columns[name] = {
+                    'kind': kind, **self.add_strings(values),
+                    'lower': self.add_strings([v.lower() for v in values])
+                }
+            else:
+                columns[name] = {'kind': kind, **self.add_strings(
+                    ['' if v is _MISSING else json.dumps(v, ensure_ascii=False, default=to_plain)
+                     for v in values]
+                )}
+        return {'length': len(records), 'columns': columns}
+
+
+def publish_dataset(tools, name: str = DEFAULT_SHM_NAME) -> shared_memory.SharedMemory:
+    """
+    Опубликовать данные AnalyticsTools в общую память
+
+    Args:
+        tools: загруженный AnalyticsTools
+        name: имя сегмента
+
+    Returns:
+        SharedMemory - держите ссылку, пока работают воркеры, затем
+        вызовите close() и unlink()
+    """
+    writer = _SegmentWriter()
+    manifest = {
+        'metadata': tools.metadata,
+        'tables': {table: writer.add_records(getattr(tools, table)) for table in RECORD_TABLES},
+        'cube': None
+    }
+
+    cube = getattr(tools, '_cube', None)
+    if cube is not None:
+        manifest['cube'] = {
+            'columns': {column: writer.add(values) for column, values in cube.columns.items()},
+            'dims': {dim: writer.add_strings(values) for dim, values in cube.dims.items()}
+        }
+
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    data_start = (_HEADER + len(manifest_bytes) + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    # Сегмент с таким именем мог остаться от упавшего процесса
+    try:
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+    except FileNotFoundError:
+        pass
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(data_start + writer.size, 1))
+    shm.buf[:_HEADER] = len(manifest_bytes).to_bytes(_HEADER, 'little')
+    shm.buf[_HEADER:_HEADER + len(manifest_bytes)] = manifest_bytes
+    for offset, array in writer.arrays:
+        start = data_start + offset
+        shm.buf[start:start + array.nbytes] = array.view(np.uint8).reshape(-1).tobytes()
+    return shm
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    """Подключиться к сегменту, не передавая его resource_tracker воркера"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # До Python 3.13 resource_tracker удалил бы сегмент при выходе воркера
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class SharedDataset:
+    """
+    Данные, подключённые из общей памяти (только чтение)
+
+    Attributes:
+        metadata: метаданные прекалькуляции
+        tables: {имя списка: SharedRecords}
+        cube_arrays, cube_dims: колонки и словари OLAP куба (или None)
+    """
+
+    def __init__(self, name: str = DEFAULT_SHM_NAME):
+        self.shm = _open_segment(name)
+        buf = self.shm.buf
+        manifest_size = int.from_bytes(bytes(buf[:_HEADER]), 'little')
+        manifest = json.loads(bytes(buf[_HEADER:_HEADER + manifest_size]).decode('utf-8'))
+        self._data_start = (_HEADER + manifest_size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+        self.metadata = manifest['metadata']
+        self.tables = {
+            table: self._records(spec) for table, spec in manifest['tables'].items()
+        }
+
+        self.cube_arrays: Optional[Dict[str, np.ndarray]] = None
+        self.cube_dims: Optional[Dict[str, SharedStrings]] = None
+        if manifest['cube']:
+            self.cube_arrays = {
+                column: self._array(spec) for column, spec in manifest['cube']['columns'].items()
+            }
+            self.cube_dims = {
+                dim: self._strings(spec) for dim, spec in manifest['cube']['dims'].items()
+            }
+
+    def _array(self, spec: Dict[str, Any]) -> np.ndarray:
+        array = np.ndarray(
+            tuple(spec['shape']), dtype=np.dtype(spec['dtype']),
+            buffer=self.shm.buf, offset=self._data_start + spec['offset']
+        )
+        array.flags.writeable = False
+        return array
+
+    def _strings(self, spec: Dict[str, Any]) -> SharedStrings:
+        return SharedStrings(self._array(spec['offsets']), self._array(spec['blob']))
+
+    def _records(self, spec: Dict[str, Any]) -> SharedRecords:
+        columns = {}
+        lower = {}
+        for name, column in spec['columns'].items():
+            if column['kind'] in ('int', 'float'):
+                columns[name] = self._array(column['data'])
+            elif column['kind'] == 'str':
+                columns[name] = self._strings(column)
+                lower[name] = self._strings(column['lower'])
+            else:
+                columns[name] = _JSONColumn(self._strings(column))
+        return SharedRecords(columns, spec['length'], lower)
+
+    @property
+    def size(self) -> int:
+        return self.shm.size
+
+
+def main():
+    import argparse
+    import os
+    import time
+
+    from analytics_tools import AnalyticsTools
+
+    parser = argparse.ArgumentParser(description="Данные AnalyticsTools в общей памяти")
+    parser.add_argument('command', choices=['publish'])
+    parser.add_argument('--name', default=os.getenv("ANALYTICS_SHM_NAME", DEFAULT_SHM_NAME))
+    parser.add_argument('--data-dir', default="precalc_data")
+    args = parser.parse_args()
+
+    print(f"📂 Загрузка данных из {args.data_dir}...")
+    shm = publish_dataset(AnalyticsTools(args.data_dir), args.name)
+    print(f"✅ Данные опубликованы в общую память '{args.name}' ({shm.size / 1024 / 1024:.1f} MB)")
+    print(f"   Воркеры: ANALYTICS_SHM_NAME={args.name} uvicorn main:app --workers N")
+
+    def stop(*_):
+        shm.close()
+        shm.unlink()
+        print("\n🧹 Сегмент общей памяти удалён")
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    main()
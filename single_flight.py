@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Объединение одинаковых параллельных запросов (single-flight)
+
+Когда несколько клиентов одновременно задают один и тот же вопрос
+(рассылка Telegram бота, несколько пользователей дашборда), вызов LLM и
+SQL выполняется один раз: первый запрос по ключу становится ведущим,
+остальные ждут его результат (или исключение) и получают его же.
+
+Работа выполняется в отдельной задаче asyncio, поэтому отмена одного из
+ожидающих (клиент отключился) не отменяет её для остальных.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Не больше одного выполнения на ключ в каждый момент времени"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Выполнить fn() или дождаться уже идущего выполнения с тем же ключом
+
+        Args:
+            key: ключ запроса (например, нормализованный вопрос)
+            fn: фабрика корутины, которая выполняет работу
+
+        Returns:
+            (результат, shared); shared=True - результат получен от
+            выполнения, запущенного другим запросом
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key, task=task: self._forget(key, task))
+
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Исключение уже получили ожидающие (или их не осталось) - не логировать повторно
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Сколько выполнений запущено, сколько запросов к ним присоединились"""
+        return {
+            'in_flight': len(self._inflight),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced
+        }
@@ -9,9 +9,14 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import os
+import time
 import requests
 import json
 
+from sql_guard import guard_query, apply_statement_timeout
+from query_log import QueryLog
+from llm_client import CircuitOpenError, LLMClient, RetryableError, register_client
+
 load_dotenv('.env.db')
 
 app = Flask(__name__)
@@ -31,6 +36,20 @@ ALEM_API_KEY = os.getenv('ALEM_API_KEY')
 ALEM_API_URL = os.getenv('ALEM_API_URL', 'https://llm.alem.ai/v1/chat/completions')
 ALEM_MODEL = os.getenv('ALEM_MODEL', 'qwen3')
 
+# Клиент Alem AI: таймауты, повторы, хеджирование, circuit breaker (llm_client.py)
+alem_client = register_client(LLMClient('alem', ALEM_API_URL, ALEM_API_KEY))
+
+# Контроль стоимости запросов (EXPLAIN перед выполнением)
+GUARD_CONFIG = {
+    'max_cost': float(os.getenv('SQL_MAX_PLAN_COST', '1000000')),
+    'max_rows': int(os.getenv('SQL_MAX_PLAN_ROWS', '100000')),
+    'statement_timeout_ms': int(os.getenv('SQL_STATEMENT_TIMEOUT_MS', '15000')),
+    'default_limit': int(os.getenv('SQL_DEFAULT_LIMIT', '100'))
+}
+
+# Лог запросов (SQLite, запись в фоновом потоке)
+query_log = QueryLog(os.getenv('QUERY_LOG_PATH', 'query_log.db'))
+
 # Схема БД для контекста
 DB_SCHEMA = """
 СХЕМА БАЗЫ ДАННЫХ:
@@ -96,11 +115,6 @@ def generate_sql_query(user_query: str) -> dict:
 }}"""
 
     try:
-        headers = {
-            'Authorization': f'Bearer {ALEM_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
         data = {
             'model': ALEM_MODEL,
             'messages': [
@@ -113,10 +127,7 @@ def generate_sql_query(user_query: str) -> dict:
             'max_tokens': 2000
         }
         
-        response = requests.post(ALEM_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result_data = response.json()
+        result_data = alem_client.chat(data)
         result_text = result_data['choices'][0]['message']['content']
         
         # Извлекаем JSON из ответа
@@ -130,6 +141,13 @@ def generate_sql_query(user_query: str) -> dict:
         result = json.loads(json_str)
         return result
         
+    except (CircuitOpenError, RetryableError, requests.Timeout, requests.ConnectionError) as e:
+        # Провайдер недоступен (таймаут, цепь разомкнута) - это 503, а не ошибка запроса
+        return {
+            "sql": None,
+            "explanation": f"LLM провайдер недоступен: {str(e)}",
+            "unavailable": True
+        }
     except Exception as e:
         return {
             "sql": None,
@@ -137,13 +155,30 @@ def generate_sql_query(user_query: str) -> dict:
         }
 
 
-def execute_sql_query(sql: str) -> dict:
+def execute_sql_query(sql: str, guard: bool = True) -> dict:
     """
     Выполняет SQL запрос и возвращает результаты
+    
+    Перед выполнением запрос проходит EXPLAIN-контроль (sql_guard),
+    для каждого запроса устанавливается statement_timeout.
     """
+    conn = None
+    guard_info = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        apply_statement_timeout(cursor, GUARD_CONFIG['statement_timeout_ms'])
+        
+        if guard:
+            sql, guard_info = guard_query(cursor, sql, GUARD_CONFIG)
+            if guard_info['decision'] == 'rejected':
+                return {
+                    "success": False,
+                    "error": guard_info['reason'],
+                    "data": [],
+                    "sql": sql,
+                    "guard": guard_info
+                }
         
         cursor.execute(sql)
         
@@ -154,20 +189,26 @@ def execute_sql_query(sql: str) -> dict:
         data = [dict(row) for row in results]
         
         cursor.close()
-        conn.close()
         
         return {
             "success": True,
             "data": data,
-            "count": len(data)
+            "count": len(data),
+            "sql": sql,
+            "guard": guard_info
         }
         
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
-            "data": []
+            "data": [],
+            "sql": sql,
+            "guard": guard_info
         }
+    finally:
+        if conn:
+            conn.close()
 
 
 @app.route('/health', methods=['GET'])
@@ -197,28 +238,53 @@ def query():
         user_query = data['query']
         
         # 1. Генерируем SQL
+        start = time.perf_counter()
         sql_result = generate_sql_query(user_query)
+        llm_ms = (time.perf_counter() - start) * 1000
         
         if not sql_result.get('sql'):
+            query_log.record(
+                question=user_query,
+                sql=None,
+                llm_ms=round(llm_ms, 2),
+                success=False,
+                error=sql_result.get('explanation'),
+                service="flask_query"
+            )
             return jsonify({
                 "error": "Не удалось сгенерировать SQL",
                 "details": sql_result.get('explanation')
-            }), 400
+            }), 503 if sql_result.get('unavailable') else 400
         
         sql_query = sql_result['sql']
         explanation = sql_result.get('explanation', '')
         
         # 2. Выполняем SQL
+        start = time.perf_counter()
         query_result = execute_sql_query(sql_query)
+        db_ms = (time.perf_counter() - start) * 1000
+        
+        query_log.record(
+            question=user_query,
+            sql=query_result.get('sql', sql_query),
+            llm_ms=round(llm_ms, 2),
+            db_ms=round(db_ms, 2),
+            row_count=query_result.get('count'),
+            success=query_result['success'],
+            error=query_result.get('error'),
+            guard_decision=(query_result.get('guard') or {}).get('decision'),
+            service="flask_query"
+        )
         
         # 3. Формируем ответ
         response = {
             "query": user_query,
-            "sql": sql_query,
+            "sql": query_result.get('sql', sql_query),
             "explanation": explanation,
             "success": query_result['success'],
             "data": query_result.get('data', []),
-            "count": query_result.get('count', 0)
+            "count": query_result.get('count', 0),
+            "guard": query_result.get('guard')
         }
         
         if not query_result['success']:
@@ -256,11 +322,12 @@ def direct_sql():
         result = execute_sql_query(sql_query)
         
         return jsonify({
-            "sql": sql_query,
+            "sql": result.get('sql', sql_query),
             "success": result['success'],
             "data": result.get('data', []),
             "count": result.get('count', 0),
-            "error": result.get('error')
+            "error": result.get('error'),
+            "guard": result.get('guard')
         })
         
     except Exception as e:
@@ -269,6 +336,21 @@ def direct_sql():
         }), 500
 
 
+@app.route('/api/query-log/stats', methods=['GET'])
+def query_log_stats():
+    """
+    Статистика латентности SQL агента (p50/p95/p99, медленные отпечатки SQL)
+    
+    GET /api/query-log/stats?limit=10000&since_hours=24&top=10
+    """
+    query_log.flush()
+    return jsonify(query_log.summary(
+        limit=request.args.get('limit', 10000, type=int),
+        since_hours=request.args.get('since_hours', None, type=float),
+        top=request.args.get('top', 10, type=int)
+    ))
+
+
 @app.route('/api/schema', methods=['GET'])
 def schema():
     """
@@ -10,10 +10,20 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import os
-import requests
+import time
+import asyncio
 from typing import List, Dict, Any, Optional
 import uvicorn
 
+from sql_guard import guard_query, guard_query_static, apply_statement_timeout
+from query_log import QueryLog
+from intent_router import route_sql
+from sql_prompt import build_sql_messages, get_schema
+from fast_json import FastJSONResponse
+from answer_cache import normalize_question
+from single_flight import SingleFlight
+from llm_client import LLMClient, llm_stats, register_client
+
 load_dotenv('.env.db')
 
 # Настройки БД
@@ -25,11 +35,31 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', '')
 }
 
+# Бэкенд выполнения SQL: 'postgres' или 'duckdb' (Parquet снапшоты, см. duckdb_backend.py)
+SQL_BACKEND = os.getenv('SQL_BACKEND', 'postgres').lower()
+
 # Alem AI API
 ALEM_API_KEY = os.getenv('ALEM_API_KEY')
 ALEM_API_URL = os.getenv('ALEM_API_URL', 'https://llm.alem.ai/v1/chat/completions')
 ALEM_MODEL = os.getenv('ALEM_MODEL', 'qwen3')
 
+# Клиент Alem AI: таймауты, повторы, хеджирование, circuit breaker (llm_client.py)
+alem_client = register_client(LLMClient('alem', ALEM_API_URL, ALEM_API_KEY))
+
+# Контроль стоимости запросов (EXPLAIN перед выполнением)
+GUARD_CONFIG = {
+    'max_cost': float(os.getenv('SQL_MAX_PLAN_COST', '1000000')),
+    'max_rows': int(os.getenv('SQL_MAX_PLAN_ROWS', '100000')),
+    'statement_timeout_ms': int(os.getenv('SQL_STATEMENT_TIMEOUT_MS', '15000')),
+    'default_limit': int(os.getenv('SQL_DEFAULT_LIMIT', '100'))
+}
+
+# Как долго использовать схему из information_schema для промпта (секунды)
+SCHEMA_CACHE_TTL = float(os.getenv('SQL_SCHEMA_CACHE_TTL', '600'))
+
+# Лог запросов (SQLite, запись в фоновом потоке)
+query_log = QueryLog(os.getenv('QUERY_LOG_PATH', 'query_log.db'))
+
 # Схема БД для контекста
 DB_SCHEMA = """
 СХЕМА БАЗЫ ДАННЫХ:
@@ -65,6 +95,7 @@ DB_SCHEMA = """
 
 # FastAPI app
 app = FastAPI(
+    default_response_class=FastJSONResponse,
     title="SQL Agent API",
     description="Преобразует естественные запросы в SQL и выполняет их на БД музыкальной аналитики",
     version="1.0.0",
@@ -102,6 +133,13 @@ class DirectSQLRequest(BaseModel):
             }
         }
 
+class QueryGuardInfo(BaseModel):
+    decision: str
+    plan_cost: Optional[float] = None
+    plan_rows: Optional[int] = None
+    limit_injected: bool = False
+    reason: Optional[str] = None
+
 class QueryResponse(BaseModel):
     query: str
     sql: str
@@ -110,6 +148,8 @@ class QueryResponse(BaseModel):
     data: List[Dict[str, Any]]
     count: int
     error: Optional[str] = None
+    guard: Optional[QueryGuardInfo] = None
+    route: Optional[str] = None
 
 class DirectSQLResponse(BaseModel):
     sql: str
@@ -117,6 +157,7 @@ class DirectSQLResponse(BaseModel):
     data: List[Dict[str, Any]]
     count: int
     error: Optional[str] = None
+    guard: Optional[QueryGuardInfo] = None
 
 class SchemaResponse(BaseModel):
     tables: List[str]
@@ -141,6 +182,30 @@ class TelegramRequest(BaseModel):
             }
         }
 
+class LatencyPercentiles(BaseModel):
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    count: int
+
+class SlowFingerprint(BaseModel):
+    fingerprint: str
+    sample_sql: Optional[str] = None
+    count: int
+    avg_total_ms: Optional[float] = None
+    p95_total_ms: Optional[float] = None
+    avg_db_ms: Optional[float] = None
+    avg_rows: Optional[float] = None
+
+class QueryLogStatsResponse(BaseModel):
+    count: int
+    since: Optional[str] = None
+    errors: int
+    dropped: int
+    cache_status: Dict[str, int]
+    latency_ms: Dict[str, LatencyPercentiles]
+    slowest_fingerprints: List[SlowFingerprint]
+
 class TelegramResponse(BaseModel):
     query: str
     telegram_message: str
@@ -261,66 +326,28 @@ def get_db_connection():
     return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
 
 
-def generate_sql_query(user_query: str) -> dict:
-    """Генерирует SQL запрос из естественного языка используя Alem AI"""
-    prompt = f"""Ты SQL эксперт. Преобразуй запрос пользователя в SQL запрос для PostgreSQL.
-
-{DB_SCHEMA}
-
-ПРАВИЛА:
-1. Используй только таблицы из схемы выше
-2. Всегда используй JOIN для связи таблиц
-3. Для поиска по имени используй ILIKE для регистронезависимого поиска
-4. Возвращай только SQL запрос без объяснений
-5. Используй агрегатные функции (SUM, COUNT, AVG) где нужно
-6. Добавляй LIMIT если не указано иное (по умолчанию 100)
-7. Форматируй числа с помощью ROUND для денег (2 знака)
-8. ВАЖНО: Для треков конкретного артиста используй таблицы tracks и artists с JOIN
-
-ПРИМЕРЫ:
+def get_prompt_schema() -> Dict[str, List[str]]:
+    """Схема для промпта из активного бэкенда"""
+    if SQL_BACKEND == 'duckdb':
+        from duckdb_backend import get_duckdb_backend
+        return get_schema(None, SCHEMA_CACHE_TTL, loader=lambda: get_duckdb_backend().schema())
+    return get_schema(get_db_connection, SCHEMA_CACHE_TTL)
 
-Запрос: "Сколько заработал Yenlik?"
-SQL: SELECT ROUND(SUM(aa.total_revenue)::numeric, 2) AS total_revenue FROM artists a JOIN artist_aggregates aa ON a.artist_id = aa.artist_id WHERE a.artist_name ILIKE 'Yenlik';
 
-Запрос: "Топ 10 треков"
-SQL: SELECT * FROM v_top_tracks_by_revenue LIMIT 10;
-
-Запрос: "Топ 5 треков Yenlik"
-SQL: SELECT t.track_name, a.artist_name, ta.total_revenue, ta.total_streams FROM tracks t JOIN artists a ON t.artist_id = a.artist_id JOIN track_aggregates ta ON t.track_id = ta.track_id WHERE a.artist_name ILIKE 'Yenlik' ORDER BY ta.total_revenue DESC LIMIT 5;
-
-Запрос: "Yenlik на Spotify"
-SQL: SELECT a.artist_name, p.platform_name, SUM(tps.revenue) as total_revenue, SUM(tps.streams) as total_streams FROM artists a JOIN tracks t ON a.artist_id = t.artist_id JOIN track_platform_stats tps ON t.track_id = tps.track_id JOIN platforms p ON tps.platform_id = p.platform_id WHERE a.artist_name ILIKE 'Yenlik' AND p.platform_name ILIKE 'Spotify' GROUP BY a.artist_name, p.platform_name;
-
-ЗАПРОС ПОЛЬЗОВАТЕЛЯ: {user_query}
-
-Верни JSON в формате:
-{{
-    "sql": "SELECT ...",
-    "explanation": "Краткое объяснение что делает запрос"
-}}"""
+def generate_sql_query(user_query: str) -> dict:
+    """Генерирует SQL запрос из естественного языка используя Alem AI"""
+    # Статический префикс (кэшируется провайдером) + схема только нужных таблиц
+    messages = build_sql_messages(user_query, get_prompt_schema())
 
     try:
-        headers = {
-            'Authorization': f'Bearer {ALEM_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
         data = {
             'model': ALEM_MODEL,
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
+            'messages': messages,
             'temperature': 0.1,
             'max_tokens': 2000
         }
         
-        response = requests.post(ALEM_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result_data = response.json()
+        result_data = alem_client.chat(data)
         result_text = result_data['choices'][0]['message']['content']
         
         # Извлекаем JSON из ответа
@@ -342,33 +369,189 @@ SQL: SELECT a.artist_name, p.platform_name, SUM(tps.revenue) as total_revenue, S
         }
 
 
-def execute_sql_query(sql: str) -> dict:
-    """Выполняет SQL запрос и возвращает результаты"""
+def execute_sql_query(sql: str, guard: bool = True) -> dict:
+    """
+    Выполняет SQL запрос и возвращает результаты
+
+    Перед выполнением запрос проходит EXPLAIN-контроль (sql_guard):
+    дорогие запросы отклоняются, к запросам без LIMIT добавляется LIMIT.
+    Для каждого запроса устанавливается statement_timeout.
+    При SQL_BACKEND=duckdb запрос выполняется по Parquet снапшотам.
+    """
+    if SQL_BACKEND == 'duckdb':
+        return execute_duckdb_query(sql, guard)
+
+    conn = None
+    guard_info = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        apply_statement_timeout(cursor, GUARD_CONFIG['statement_timeout_ms'])
+        
+        if guard:
+            sql, guard_info = guard_query(cursor, sql, GUARD_CONFIG)
+            if guard_info['decision'] == 'rejected':
+                return {
+                    "success": False,
+                    "error": guard_info['reason'],
+                    "data": [],
+                    "sql": sql,
+                    "guard": guard_info
+                }
         
         cursor.execute(sql)
         results = cursor.fetchall()
         data = [dict(row) for row in results]
         
         cursor.close()
-        conn.close()
         
         return {
             "success": True,
             "data": data,
-            "count": len(data)
+            "count": len(data),
+            "sql": sql,
+            "guard": guard_info
         }
         
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
-            "data": []
+            "data": [],
+            "sql": sql,
+            "guard": guard_info
+        }
+    finally:
+        if conn:
+            conn.close()
+
+
+def execute_duckdb_query(sql: str, guard: bool = True) -> dict:
+    """
+    Выполняет SQL запрос во встроенном DuckDB бэкенде
+
+    EXPLAIN-контроля нет: разрешены только SELECT / WITH, к запросам
+    без LIMIT добавляется LIMIT по умолчанию.
+    """
+    from duckdb_backend import get_duckdb_backend
+
+    guard_info = None
+    try:
+        if guard:
+            sql, guard_info = guard_query_static(sql, GUARD_CONFIG)
+            if guard_info['decision'] == 'rejected':
+                return {
+                    "success": False,
+                    "error": guard_info['reason'],
+                    "data": [],
+                    "sql": sql,
+                    "guard": guard_info
+                }
+
+        data = get_duckdb_backend().execute(sql)
+        return {
+            "success": True,
+            "data": data,
+            "count": len(data),
+            "sql": sql,
+            "guard": guard_info
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "data": [],
+            "sql": sql,
+            "guard": guard_info
         }
 
 
+def log_query(user_query: str, sql_result: dict, query_result: Optional[dict],
+              llm_ms: Optional[float], db_ms: Optional[float], service: str,
+              cache_status: str = "miss"):
+    """Записать запрос в лог (вопрос, SQL, время LLM/БД, число строк)"""
+    query_result = query_result or {}
+    guard = query_result.get('guard') or {}
+    error = query_result.get('error') if query_result else sql_result.get('explanation')
+    query_log.record(
+        question=user_query,
+        sql=query_result.get('sql', sql_result.get('sql')),
+        llm_ms=round(llm_ms, 2) if llm_ms is not None else None,
+        db_ms=round(db_ms, 2) if db_ms is not None else None,
+        row_count=query_result.get('count'),
+        cache_status=cache_status,
+        success=bool(query_result.get('success')),
+        error=error,
+        guard_decision=guard.get('decision'),
+        service=service
+    )
+
+
+def run_nl_query(user_query: str, service: str):
+    """
+    Сгенерировать и выполнить SQL для вопроса
+    
+    Частые вопросы (топы, платформы, динамика артиста) сначала пробуются
+    по SQL шаблону из intent_router без вызова LLM. Если шаблон не подошёл
+    или вернул пустой результат - SQL генерирует LLM.
+    
+    Returns:
+        (sql_result, query_result, route); query_result = None,
+        если SQL сгенерировать не удалось
+    """
+    routed = route_sql(user_query)
+    if routed:
+        start = time.perf_counter()
+        routed_result = execute_sql_query(routed['sql'])
+        db_ms = (time.perf_counter() - start) * 1000
+        # Пустой результат шаблона уходит в LLM, если провайдер доступен
+        if routed_result['success'] and (routed_result.get('count') or alem_client.breaker.is_open):
+            log_query(user_query, routed, routed_result, 0.0, db_ms, service)
+            return routed, routed_result, "fast_path"
+    
+    # 1. Генерируем SQL
+    start = time.perf_counter()
+    sql_result = generate_sql_query(user_query)
+    llm_ms = (time.perf_counter() - start) * 1000
+    
+    if not sql_result.get('sql'):
+        if routed and routed_result['success']:
+            # LLM не ответил (таймаут, цепь разомкнута) - отдаём результат шаблона
+            log_query(user_query, routed, routed_result, llm_ms, db_ms, service)
+            return routed, routed_result, "fast_path"
+        log_query(user_query, sql_result, None, llm_ms, None, service)
+        return sql_result, None, "llm"
+    
+    # 2. Выполняем SQL
+    start = time.perf_counter()
+    query_result = execute_sql_query(sql_result['sql'])
+    db_ms = (time.perf_counter() - start) * 1000
+    log_query(user_query, sql_result, query_result, llm_ms, db_ms, service)
+    return sql_result, query_result, "llm"
+
+
+# Одинаковые параллельные вопросы (в т.ч. из /api/query и /api/telegram)
+# выполняются один раз
+nl_query_flight = SingleFlight()
+
+
+async def run_nl_query_shared(user_query: str, service: str):
+    """
+    run_nl_query с объединением одинаковых параллельных вопросов
+    
+    Выполняется в потоке (не блокирует event loop). Запросы, дождавшиеся
+    чужого выполнения, пишутся в лог со статусом 'coalesced'.
+    """
+    (sql_result, query_result, route), shared = await nl_query_flight.do(
+        normalize_question(user_query),
+        lambda: asyncio.to_thread(run_nl_query, user_query, service)
+    )
+    if shared:
+        log_query(user_query, sql_result, query_result, None, None, service, cache_status="coalesced")
+    return sql_result, query_result, route
+
+
 # Endpoints
 @app.get("/", tags=["Root"])
 async def root():
@@ -402,10 +585,10 @@ async def query(request: QueryRequest):
     """
     user_query = request.query
     
-    # 1. Генерируем SQL
-    sql_result = generate_sql_query(user_query)
+    # 1-2. Генерируем (шаблон или LLM) и выполняем SQL
+    sql_result, query_result, route = await run_nl_query_shared(user_query, "query")
     
-    if not sql_result.get('sql'):
+    if query_result is None:
         raise HTTPException(
             status_code=400,
             detail={
@@ -417,23 +600,25 @@ async def query(request: QueryRequest):
     sql_query = sql_result['sql']
     explanation = sql_result.get('explanation', '')
     
-    # 2. Выполняем SQL
-    query_result = execute_sql_query(sql_query)
-    
     # 3. Формируем ответ
     response = {
         "query": user_query,
-        "sql": sql_query,
+        "sql": query_result.get('sql', sql_query),
         "explanation": explanation,
         "success": query_result['success'],
         "data": query_result.get('data', []),
-        "count": query_result.get('count', 0)
+        "count": query_result.get('count', 0),
+        "error": None,
+        "guard": query_result.get('guard'),
+        "route": route
     }
     
     if not query_result['success']:
         response['error'] = query_result.get('error')
     
-    return response
+    # Строки результата сериализуются напрямую (Decimal / date - fast_json),
+    # без повторной валидации через QueryResponse
+    return FastJSONResponse(response)
 
 
 @app.post("/api/direct-sql", response_model=DirectSQLResponse, tags=["Query"])
@@ -453,13 +638,14 @@ async def direct_sql(request: DirectSQLRequest):
     # Выполняем SQL
     result = execute_sql_query(sql_query)
     
-    return {
-        "sql": sql_query,
+    return FastJSONResponse({
+        "sql": result.get('sql', sql_query),
         "success": result['success'],
         "data": result.get('data', []),
         "count": result.get('count', 0),
-        "error": result.get('error')
-    }
+        "error": result.get('error'),
+        "guard": result.get('guard')
+    })
 
 
 @app.get("/api/schema", response_model=SchemaResponse, tags=["Schema"])
@@ -469,6 +655,19 @@ async def schema():
     
     Возвращает список таблиц, представлений и статистику по записям.
     """
+    if SQL_BACKEND == 'duckdb':
+        try:
+            from duckdb_backend import get_duckdb_backend
+            backend = get_duckdb_backend()
+            return {
+                "tables": backend.tables,
+                "views": backend.views,
+                "statistics": backend.row_counts(),
+                "schema_description": DB_SCHEMA
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка получения схемы: {str(e)}")
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -534,6 +733,35 @@ async def examples():
     }
 
 
+@app.get("/api/query-log/stats", response_model=QueryLogStatsResponse, tags=["Monitoring"])
+async def query_log_stats(limit: int = 10000, since_hours: Optional[float] = None, top: int = 10):
+    """
+    Статистика латентности SQL агента
+    
+    Перцентили p50/p95/p99 времени LLM, БД и общего времени по последним
+    запросам, а также самые медленные отпечатки SQL.
+    
+    - **limit**: сколько последних запросов учитывать
+    - **since_hours**: окно по времени в часах
+    - **top**: сколько медленных отпечатков вернуть
+    """
+    # flush() ждёт фоновый поток записи, summary() читает SQLite - оба
+    # блокирующие, поэтому не в event loop
+    await asyncio.to_thread(query_log.flush)
+    return await asyncio.to_thread(query_log.summary, limit=limit, since_hours=since_hours, top=top)
+
+
+@app.get("/api/llm-stats", tags=["Monitoring"])
+async def get_llm_stats():
+    """
+    Состояние LLM провайдеров
+    
+    Гистограмма и перцентили латентности, состояние circuit breaker,
+    счётчики повторов, хеджированных запросов и отказов без вызова.
+    """
+    return llm_stats()
+
+
 @app.post("/api/telegram", response_model=TelegramResponse, tags=["Telegram"])
 async def telegram_query(request: TelegramRequest):
     """
@@ -553,10 +781,10 @@ async def telegram_query(request: TelegramRequest):
     user_query = request.query
     
     try:
-        # 1. Генерируем SQL
-        sql_result = generate_sql_query(user_query)
+        # 1-2. Генерируем (шаблон или LLM) и выполняем SQL
+        sql_result, query_result, route = await run_nl_query_shared(user_query, "telegram")
         
-        if not sql_result.get('sql'):
+        if query_result is None:
             return {
                 "query": user_query,
                 "telegram_message": f"❌ *Ошибка*\n\nНе удалось обработать запрос: _{user_query}_",
@@ -567,9 +795,6 @@ async def telegram_query(request: TelegramRequest):
         sql_query = sql_result['sql']
         explanation = sql_result.get('explanation', '')
         
-        # 2. Выполняем SQL
-        query_result = execute_sql_query(sql_query)
-        
         if not query_result['success']:
             return {
                 "query": user_query,
@@ -603,7 +828,10 @@ async def telegram_query(request: TelegramRequest):
 
 if __name__ == '__main__':
     print("🚀 Запуск SQL Agent API (FastAPI)...")
-    print("📊 База данных:", DB_CONFIG['database'])
+    if SQL_BACKEND == 'duckdb':
+        print("📊 Бэкенд: DuckDB (Parquet снапшоты)")
+    else:
+        print("📊 База данных:", DB_CONFIG['database'])
     print("🤖 LLM: Alem AI (qwen3)")
     print("🌐 API доступен на: http://localhost:8006")
     print("📚 Документация: http://localhost:8006/docs")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Контроль стоимости SQL запросов перед выполнением (EXPLAIN-based admission control)
+
+SQL, сгенерированный LLM, сначала проходит через EXPLAIN: запросы с огромной
+оценкой стоимости отклоняются, а запросы без LIMIT или с большой оценкой
+числа строк переписываются с LIMIT.
+"""
+
+import re
+from typing import Dict, Any, Tuple
+
+# Значения по умолчанию (переопределяются через переменные окружения в API)
+DEFAULT_GUARD_CONFIG = {
+    'max_cost': 1_000_000.0,        # максимальная оценка стоимости плана
+    'max_rows': 100_000,            # максимальная оценка числа строк результата
+    'statement_timeout_ms': 15_000, # statement_timeout на один запрос
+    'default_limit': 100            # LIMIT, если LLM его не указал
+}
+
+_READ_QUERY_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_OUTER_LIMIT_RE = re.compile(
+    r"\blimit\s+(\d+|all)(\s+offset\s+\d+)?\s*$",
+    re.IGNORECASE
+)
+# FETCH FIRST n ROWS ONLY (стандартный SQL) - такой же внешний лимит, как LIMIT
+_OUTER_FETCH_RE = re.compile(
+    r"\bfetch\s+(?:first|next)\s+(\d+\s+)?rows?\s+only\s*$",
+    re.IGNORECASE
+)
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def _mask_literals(sql: str) -> str:
+    """Заменяет содержимое строковых литералов пробелами (позиции сохраняются)"""
+    return _STRING_LITERAL_RE.sub(lambda m: "'" + ' ' * (len(m.group()) - 2) + "'", sql)
+
+
+def strip_comments(sql: str) -> str:
+    """Удаляет комментарии -- и /* */ (внутри строковых литералов не трогает)"""
+    parts = []
+    last = 0
+    for match in _COMMENT_RE.finditer(_mask_literals(sql)):
+        parts.append(sql[last:match.start()])
+        parts.append(' ')
+        last = match.end()
+    parts.append(sql[last:])
+    return ''.join(parts)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Убирает комментарии, пробелы и завершающие ';'
+
+    После завершающего комментария '-- ...' добавленный LIMIT оказался
+    бы закомментирован.
+    """
+    return strip_comments(sql).strip().rstrip(';').strip()
+
+
+def is_single_statement(sql: str) -> bool:
+    """Проверяет, что в запросе ровно один оператор (';' внутри строк не считается)"""
+    return ';' not in _STRING_LITERAL_RE.sub("''", sql)
+
+
+def is_read_query(sql: str) -> bool:
+    """SELECT / WITH запрос"""
+    return bool(_READ_QUERY_RE.match(sql))
+
+
+def get_outer_limit(sql: str):
+    """
+    Возвращает LIMIT внешнего запроса
+
+    LIMIT n и FETCH FIRST n ROWS ONLY считаются одинаково (запрос уже
+    без комментариев, см. normalize_sql).
+
+    Returns:
+        число, 'all' или None если LIMIT не указан
+    """
+    match = _OUTER_LIMIT_RE.search(sql)
+    if match:
+        value = match.group(1).lower()
+        return value if value == 'all' else int(value)
+    match = _OUTER_FETCH_RE.search(sql)
+    if match:
+        # FETCH FIRST ROWS ONLY без числа - одна строка
+        return int(match.group(1) or 1)
+    return None
+
+
+def set_limit(sql: str, limit: int) -> str:
+    """Добавляет LIMIT во внешний запрос или заменяет существующий LIMIT / FETCH FIRST"""
+    match = _OUTER_LIMIT_RE.search(sql)
+    if match:
+        offset = match.group(2) or ''
+        return f"{sql[:match.start()]}LIMIT {limit}{offset}"
+    match = _OUTER_FETCH_RE.search(sql)
+    if match:
+        return f"{sql[:match.start()]}FETCH FIRST {limit} ROWS ONLY"
+    return f"{sql} LIMIT {limit}"
+
+
+def apply_statement_timeout(cursor, timeout_ms: int):
+    """Устанавливает statement_timeout для текущей транзакции"""
+    cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+
+
+def explain_query(cursor, sql: str) -> Dict[str, Any]:
+    """
+    Получить оценку плана запроса без выполнения
+
+    Returns:
+        Корневой узел плана (Total Cost, Plan Rows, ...)
+    """
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+    row = cursor.fetchone()
+    plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+    return plan[0]['Plan']
+
+
+def guard_query(cursor, sql: str, config: Dict[str, Any] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Проверить запрос перед выполнением
+
+    Args:
+        cursor: курсор psycopg2 (внутри транзакции с statement_timeout)
+        sql: SQL запрос
+        config: лимиты (см. DEFAULT_GUARD_CONFIG)
+
+    Returns:
+        (SQL для выполнения, информация о решении)
+        decision: 'allowed' | 'rewritten' | 'rejected'
+    """
+    config = {**DEFAULT_GUARD_CONFIG, **(config or {})}
+    sql = normalize_sql(sql)
+
+    info = {
+        'decision': 'allowed',
+        'plan_cost': None,
+        'plan_rows': None,
+        'limit_injected': False,
+        'reason': None
+    }
+
+    if not is_single_statement(sql):
+        info['decision'] = 'rejected'
+        info['reason'] = 'Разрешён только один SQL оператор'
+        return sql, info
+
+    read_query = is_read_query(sql)
+
+    # 1. LIMIT по умолчанию, если LLM его не добавил
+    if read_query and get_outer_limit(sql) is None:
+        sql = set_limit(sql, config['default_limit'])
+        info['limit_injected'] = True
+        info['decision'] = 'rewritten'
+
+    # 2. Оценка плана
+    plan = explain_query(cursor, sql)
+
+    # 3. Слишком много строк - ограничиваем результат
+    if read_query and plan['Plan Rows'] > config['max_rows']:
+        sql = set_limit(sql, config['max_rows'])
+        info['limit_injected'] = True
+        info['decision'] = 'rewritten'
+        plan = explain_query(cursor, sql)
+
+    info['plan_cost'] = float(plan['Total Cost'])
+    info['plan_rows'] = int(plan['Plan Rows'])
+
+    # 4. Слишком дорогой запрос - отклоняем
+    if info['plan_cost'] > config['max_cost']:
+        info['decision'] = 'rejected'
+        info['reason'] = (
+            f"Запрос отклонён: оценка стоимости {info['plan_cost']:,.0f} "
+            f"превышает лимит {config['max_cost']:,.0f}"
+        )
+
+    return sql, info
+
+
+def guard_query_static(sql: str, config: Dict[str, Any] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Проверка запроса без EXPLAIN (для встроенного DuckDB бэкенда)
+
+    Разрешены только одиночные SELECT / WITH запросы; к запросам без
+    LIMIT добавляется LIMIT по умолчанию. Оценки плана нет, поэтому
+    plan_cost / plan_rows остаются None.
+
+    Returns:
+        (SQL для выполнения, информация о решении)
+    """
+    config = {**DEFAULT_GUARD_CONFIG, **(config or {})}
+    sql = normalize_sql(sql)
+
+    info = {
+        'decision': 'allowed',
+        'plan_cost': None,
+        'plan_rows': None,
+        'limit_injected': False,
+        'reason': None
+    }
+
+    if not is_single_statement(sql):
+        info['decision'] = 'rejected'
+        info['reason'] = 'Разрешён только один SQL оператор'
+        return sql, info
+
+    if not is_read_query(sql):
+        info['decision'] = 'rejected'
+        info['reason'] = 'Снапшоты доступны только для чтения (разрешены SELECT / WITH)'
+        return sql, info
+
+    if get_outer_limit(sql) is None:
+        sql = set_limit(sql, config['default_limit'])
+        info['limit_injected'] = True
+        info['decision'] = 'rewritten'
+
+    return sql, info
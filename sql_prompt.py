@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Промпт для генерации SQL (NL → SQL)
+
+Промпт разделён на две части:
+- статический префикс (правила, примеры, формат ответа) - одинаковый
+  для всех запросов, поэтому кэшируется на стороне LLM провайдера;
+- схема и вопрос - схема строится из information_schema / pg_catalog
+  и сокращается до таблиц, относящихся к вопросу (по ключевым словам).
+"""
+
+import re
+import threading
+import time
+from typing import Dict, List, Callable
+
+SQL_SYSTEM_PROMPT = """Ты SQL эксперт. Преобразуй запрос пользователя в SQL запрос для PostgreSQL.
+
+ПРАВИЛА:
+1. Используй только таблицы из схемы в запросе пользователя
+2. Всегда используй JOIN для связи таблиц
+3. Для поиска по имени используй ILIKE для регистронезависимого поиска
+4. Возвращай только SQL запрос без объяснений
+5. Используй агрегатные функции (SUM, COUNT, AVG) где нужно
+6. Добавляй LIMIT если не указано иное (по умолчанию 100)
+7. Форматируй числа с помощью ROUND для денег (2 знака)
+8. ВАЖНО: Для треков конкретного артиста используй таблицы tracks и artists с JOIN
+
+ПРИМЕРЫ:
+
+Запрос: "Сколько заработал Yenlik?"
+SQL: SELECT ROUND(SUM(aa.total_revenue)::numeric, 2) AS total_revenue FROM artists a JOIN artist_aggregates aa ON a.artist_id = aa.artist_id WHERE a.artist_name ILIKE 'Yenlik';
+
+Запрос: "Топ 10 треков"
+SQL: SELECT * FROM v_top_tracks_by_revenue LIMIT 10;
+
+Запрос: "Топ 5 треков Yenlik"
+SQL: SELECT t.track_name, a.artist_name, ta.total_revenue, ta.total_streams FROM tracks t JOIN artists a ON t.artist_id = a.artist_id JOIN track_aggregates ta ON t.track_id = ta.track_id WHERE a.artist_name ILIKE 'Yenlik' ORDER BY ta.total_revenue DESC LIMIT 5;
+
+Запрос: "Yenlik на Spotify"
+SQL: SELECT a.artist_name, p.platform_name, SUM(tps.revenue) as total_revenue, SUM(tps.streams) as total_streams FROM artists a JOIN tracks t ON a.artist_id = t.artist_id JOIN track_platform_stats tps ON t.track_id = tps.track_id JOIN platforms p ON tps.platform_id = p.platform_id WHERE a.artist_name ILIKE 'Yenlik' AND p.platform_name ILIKE 'Spotify' GROUP BY a.artist_name, p.platform_name;
+
+Верни JSON в формате:
+{
+    "sql": "SELECT ...",
+    "explanation": "Краткое объяснение что делает запрос"
+}"""
+
+# Схема на случай, если БД недоступна (совпадает с database_schema.sql)
+FALLBACK_SCHEMA = {
+    'labels': ['label_id', 'label_name'],
+    'artists': ['artist_id', 'artist_name', 'label_id'],
+    'tracks': ['track_id', 'track_name', 'artist_id', 'label_id', 'isrc'],
+    'platforms': ['platform_id', 'platform_name'],
+    'countries': ['country_id', 'country_name'],
+    'subscription_types': ['subscription_type_id', 'subscription_type_name'],
+    'track_aggregates': ['track_id', 'total_revenue', 'total_streams', 'avg_rate'],
+    'artist_aggregates': ['artist_id', 'total_revenue', 'total_streams', 'tracks_count', 'avg_revenue_per_track'],
+    'platform_aggregates': ['platform_id', 'total_revenue', 'total_streams', 'tracks_count', 'artists_count'],
+    'track_platform_stats': ['track_id', 'platform_id', 'streams', 'revenue'],
+    'track_country_stats': ['track_id', 'country_id', 'streams', 'revenue'],
+    'track_subscription_stats': ['track_id', 'subscription_type_id', 'streams'],
+    'track_monthly_stats': ['track_id', 'month_date', 'streams', 'revenue'],
+    'artist_monthly_stats': ['artist_id', 'month_date', 'streams', 'revenue'],
+    'v_top_tracks_by_revenue': ['track_name', 'artist_name', 'label_name', 'total_revenue', 'total_streams', 'avg_rate'],
+    'v_top_artists_by_revenue': ['artist_name', 'label_name', 'total_revenue', 'total_streams', 'tracks_count', 'avg_revenue_per_track'],
+    'v_top_platforms_by_revenue': ['platform_name', 'total_revenue', 'total_streams', 'tracks_count', 'artists_count', 'avg_rate'],
+    'v_artist_monthly_trends': ['artist_name', 'label_name', 'month_date', 'streams', 'revenue'],
+    'v_track_monthly_trends': ['track_name', 'artist_name', 'month_date', 'streams', 'revenue'],
+}
+
+# Пояснения к таблицам, которые не следуют из названий колонок
+TABLE_NOTES = {
+    'platforms': 'Spotify, Apple Music, YouTube, etc.',
+    'v_top_tracks_by_revenue': 'топ треков по выручке',
+    'v_top_artists_by_revenue': 'топ артистов по выручке',
+    'v_top_platforms_by_revenue': 'топ платформ по выручке',
+    'track_monthly_stats': 'month_date - первое число месяца',
+    'artist_monthly_stats': 'month_date - первое число месяца',
+}
+
+# Таблицы, нужные почти любому запросу (поиск по имени артиста/трека)
+CORE_TABLES = ['artists', 'tracks']
+
+# Группы таблиц и ключевые слова (основы слов), по которым они выбираются
+TABLE_GROUPS = [
+    (['platforms', 'track_platform_stats', 'platform_aggregates', 'v_top_platforms_by_revenue'],
+     ['платформ', 'сервис', 'platform', 'spotify', 'apple', 'youtube', 'deezer', 'tiktok', 'amazon', 'tidal']),
+    (['countries', 'track_country_stats'],
+     ['стран', 'регион', 'казахстан', 'узбекистан', 'country', 'countries', 'region', 'kazakhstan']),
+    (['track_monthly_stats', 'artist_monthly_stats', 'v_artist_monthly_trends', 'v_track_monthly_trends'],
+     ['месяц', 'динамик', 'тренд', 'рост', 'июл', 'август', 'сентябр', 'октябр', 'ноябр', 'декабр',
+      'month', 'trend', 'timeline', 'july', 'august', 'september', 'october', 'november', 'december']),
+    (['v_top_tracks_by_revenue', 'v_top_artists_by_revenue'],
+     ['топ', 'лучш', 'самы', 'рейтинг', 'top', 'best']),
+    (['track_aggregates', 'artist_aggregates'],
+     ['заработ', 'доход', 'выручк', 'стрим', 'прослушив', 'ставк', 'сколько',
+      'revenue', 'earn', 'stream', 'income', 'rate']),
+    (['labels'],
+     ['лейбл', 'label']),
+    (['subscription_types', 'track_subscription_stats'],
+     ['подписк', 'абонемент', 'премиум', 'бесплат', 'subscription', 'premium', 'free']),
+]
+
+# Если по ключевым словам ничего не выбрано
+DEFAULT_TABLES = ['track_aggregates', 'artist_aggregates', 'v_top_tracks_by_revenue', 'v_top_artists_by_revenue']
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA_QUERY = """
+    SELECT c.relname AS table_name, a.attname AS column_name
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = 'public'
+      AND c.relkind IN ('r', 'p', 'v', 'm')
+      AND NOT c.relispartition
+      AND c.relname NOT LIKE 'mv\\_%'
+      AND a.attnum > 0 AND NOT a.attisdropped
+      AND a.attname NOT IN ('created_at', 'updated_at')
+    ORDER BY c.relname, a.attnum
+"""
+
+_schema_cache: Dict[str, List[str]] = {}
+_schema_loaded_at = 0.0
+_schema_lock = threading.Lock()
+
+
+def load_schema(cursor) -> Dict[str, List[str]]:
+    """Таблицы, представления и их колонки из каталога PostgreSQL"""
+    cursor.execute(_SCHEMA_QUERY)
+    schema: Dict[str, List[str]] = {}
+    for row in cursor.fetchall():
+        table = row['table_name'] if isinstance(row, dict) else row[0]
+        column = row['column_name'] if isinstance(row, dict) else row[1]
+        schema.setdefault(table, []).append(column)
+    return schema
+
+
+def get_schema(connect: Callable, ttl_seconds: float = 600, loader: Callable = None) -> Dict[str, List[str]]:
+    """
+    Схема БД с кэшированием
+
+    Args:
+        connect: функция, возвращающая подключение psycopg2
+        ttl_seconds: как долго использовать загруженную схему
+        loader: функция, возвращающая схему напрямую (например, из DuckDB
+            бэкенда); если задана, connect не используется
+
+    Returns:
+        {таблица: [колонки]}; если БД недоступна - FALLBACK_SCHEMA
+    """
+    global _schema_cache, _schema_loaded_at
+
+    if _schema_cache and time.monotonic() - _schema_loaded_at < ttl_seconds:
+        return _schema_cache
+
+    with _schema_lock:
+        if _schema_cache and time.monotonic() - _schema_loaded_at < ttl_seconds:
+            return _schema_cache
+        conn = None
+        try:
+            if loader:
+                schema = loader()
+            else:
+                conn = connect()
+                cursor = conn.cursor()
+                schema = load_schema(cursor)
+                cursor.close()
+        except Exception:
+            schema = None
+        finally:
+            if conn:
+                conn.close()
+
+        # БД недоступна - используем прежнюю или встроенную схему до следующей попытки через ttl
+        _schema_cache = schema or _schema_cache or FALLBACK_SCHEMA
+        _schema_loaded_at = time.monotonic()
+        return _schema_cache
+
+
+def select_tables(question: str, schema: Dict[str, List[str]]) -> List[str]:
+    """Таблицы схемы, относящиеся к вопросу (по ключевым словам)"""
+    words = _WORD_RE.findall(question.lower())
+
+    selected = list(CORE_TABLES)
+    matched = False
+    for tables, keywords in TABLE_GROUPS:
+        if any(word.startswith(keyword) for word in words for keyword in keywords):
+            selected.extend(tables)
+            matched = True
+
+    # Таблицы, названные в вопросе явно
+    selected.extend(table for table in schema if table in words)
+
+    if not matched:
+        selected.extend(DEFAULT_TABLES)
+
+    # Справочники для JOIN, если выбраны таблицы, которые на них ссылаются
+    if 'track_platform_stats' in selected and 'platforms' not in selected:
+        selected.append('platforms')
+    if 'track_country_stats' in selected and 'countries' not in selected:
+        selected.append('countries')
+
+    result = []
+    for table in selected:
+        if table in schema and table not in result:
+            result.append(table)
+    return result
+
+
+def format_schema(schema: Dict[str, List[str]], tables: List[str]) -> str:
+    """Компактное описание выбранных таблиц"""
+    lines = ["СХЕМА (только относящиеся к вопросу таблицы):"]
+    for table in tables:
+        line = f"- {table} ({', '.join(schema[table])})"
+        if table in TABLE_NOTES:
+            line += f" - {TABLE_NOTES[table]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def build_sql_messages(question: str, schema: Dict[str, List[str]]) -> List[Dict[str, str]]:
+    """
+    Сообщения для LLM: статический системный префикс + схема и вопрос
+
+    Returns:
+        [{'role': 'system', ...}, {'role': 'user', ...}]
+    """
+    tables = select_tables(question, schema)
+    user_content = f"{format_schema(schema, tables)}\n\nЗАПРОС ПОЛЬЗОВАТЕЛЯ: {question}"
+    return [
+        {'role': 'system', 'content': SQL_SYSTEM_PROMPT},
+        {'role': 'user', 'content': user_content}
+    ]
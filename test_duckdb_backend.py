@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Тесты встроенного DuckDB бэкенда: представления над Parquet работают,
+а чтение произвольных файлов запросом запрещено
+
+    python -m pytest -q test_duckdb_backend.py
+"""
+
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from duckdb_backend import DuckDBBackend
+
+
+def make_backend(directory: Path) -> DuckDBBackend:
+    """Снапшот из одной таблицы labels"""
+    conn = duckdb.connect()
+    conn.execute(
+        f"COPY (SELECT 1 AS label_id, 'õzen' AS label_name) TO '{directory / 'labels.parquet'}' (FORMAT PARQUET)"
+    )
+    conn.close()
+    return DuckDBBackend(str(directory))
+
+
+def test_snapshot_tables_readable():
+    with tempfile.TemporaryDirectory() as directory:
+        backend = make_backend(Path(directory))
+        assert backend.execute("SELECT label_name FROM labels") == [{'label_name': 'õzen'}]
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT content FROM read_text('/etc/hostname')",
+    "SELECT * FROM read_csv('/etc/passwd', delim=':', header=false)",
+    "SELECT * FROM glob('/etc/*')",
+])
+def test_external_files_refused(sql):
+    with tempfile.TemporaryDirectory() as directory:
+        backend = make_backend(Path(directory))
+        with pytest.raises(duckdb.Error):
+            backend.execute(sql)
+
+
+def test_configuration_locked():
+    with tempfile.TemporaryDirectory() as directory:
+        backend = make_backend(Path(directory))
+        with pytest.raises(duckdb.Error):
+            backend.execute("SET enable_external_access = true")
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Тесты SQL шаблонов intent_router на встроенном DuckDB бэкенде: каждый
+шаблон должен выполняться без LLM (SQL_BACKEND=duckdb)
+
+    python -m pytest -q test_intent_router.py
+"""
+
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from duckdb_backend import DuckDBBackend
+from intent_router import route_sql
+from sql_guard import guard_query_static
+
+SNAPSHOT = {
+    'labels': "SELECT * FROM (VALUES (1, 'õzen')) t(label_id, label_name)",
+    'artists': "SELECT * FROM (VALUES (1, 'Yenlik', 1), (2, 'Ирина Кайратовна', 1), (3, 'Dubl', 1), (4, 'Dubl', 1)) "
+               "t(artist_id, artist_name, label_id)",
+    'tracks': "SELECT * FROM (VALUES (1, 'Meili', 1, 1), (2, 'Айда', 2, 1), (3, 'Echo', 3, 1)) "
+              "t(track_id, track_name, artist_id, label_id)",
+    'track_aggregates': "SELECT * FROM (VALUES (1, 10.5, 3000, 0.0035, 2, 2), (2, 20.0, 1000, 0.02, 1, 1), "
+                        "(3, 1.0, 500, 0.002, 1, 1)) "
+                        "t(track_id, total_revenue, total_streams, avg_rate, platforms_count, countries_count)",
+    'artist_aggregates': "SELECT * FROM (VALUES (1, 10.5, 3000, 1, 0.0035, 10.5, 2, 2), (2, 20.0, 1000, 1, 0.02, 20.0, 1, 1), "
+                         "(3, 1.0, 500, 1, 0.002, 1.0, 1, 1), (4, 2.0, 700, 1, 0.003, 2.0, 1, 1)) "
+                         "t(artist_id, total_revenue, total_streams, tracks_count, avg_rate, "
+                         "avg_revenue_per_track, platforms_count, countries_count)",
+    'platforms': "SELECT * FROM (VALUES (1, 'Spotify'), (2, 'YouTube')) t(platform_id, platform_name)",
+    'platform_aggregates': "SELECT * FROM (VALUES (1, 25.0, 3500, 3, 3, 0.007), (2, 6.5, 1000, 2, 2, 0.0065)) "
+                           "t(platform_id, total_revenue, total_streams, tracks_count, artists_count, avg_rate)",
+    'countries': "SELECT * FROM (VALUES (1, 'KZ'), (2, 'RU')) t(country_id, country_name)",
+    'track_country_stats': "SELECT * FROM (VALUES (1, 1, 2000, 7.0), (1, 2, 1000, 3.5), (2, 1, 1000, 20.0)) "
+                           "t(track_id, country_id, streams, revenue)",
+    'artist_monthly_stats': "SELECT * FROM (VALUES (1, DATE '2025-01-01', 1000, 3.5), (1, DATE '2025-02-01', 2000, 7.0)) "
+                            "t(artist_id, month_date, streams, revenue)",
+    'track_monthly_stats': "SELECT * FROM (VALUES (1, DATE '2025-01-01', 1000, 3.5)) "
+                           "t(track_id, month_date, streams, revenue)",
+}
+
+
+@pytest.fixture(scope='module')
+def backend():
+    with tempfile.TemporaryDirectory() as directory:
+        conn = duckdb.connect()
+        for table, sql in SNAPSHOT.items():
+            conn.execute(f"COPY ({sql}) TO '{Path(directory) / table}.parquet' (FORMAT PARQUET)")
+        conn.close()
+        yield DuckDBBackend(directory)
+
+
+def run(backend, question: str):
+    routed = route_sql(question)
+    assert routed is not None, question
+    sql, info = guard_query_static(routed['sql'])
+    assert info['decision'] != 'rejected', info['reason']
+    return backend.execute(sql)
+
+
+@pytest.mark.parametrize('question', [
+    "топ 5 треков",
+    "топ 5 треков по стримам",
+    "самые популярные треки",
+    "топ артистов",
+    "топ 3 артистов по стримам",
+    "статистика по платформам",
+    "статистика по странам",
+    "динамика артиста Yenlik",
+    "сравни Yenlik и Ирина Кайратовна",
+])
+def test_template_runs_on_duckdb(backend, question):
+    assert run(backend, question)
+
+
+def test_top_by_streams_sorted(backend):
+    rows = run(backend, "топ треков по стримам")
+    assert [row['track_name'] for row in rows] == ['Meili', 'Айда', 'Echo']
+    rows = run(backend, "top artists by streams")
+    assert rows[0]['artist_name'] == 'Yenlik'
+
+
+def test_compare_requires_both_artists(backend):
+    rows = run(backend, "сравни Yenlik и Ирина Кайратовна")
+    assert sorted(row['artist_name'] for row in rows) == ['Yenlik', 'Ирина Кайратовна']
+    # Одно имя не найдено или неоднозначно - пустой результат (уходит в LLM)
+    assert run(backend, "сравни Yenlik и Nobody") == []
+    assert run(backend, "сравни Yenlik и Dubl") == []
+    assert route_sql("сравни Yenlik и yenlik") is None
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
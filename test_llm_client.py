@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Тесты circuit breaker и LLMClient (llm_client.py)
+
+    python -m pytest -q test_llm_client.py
+"""
+
+import asyncio
+import time
+
+import pytest
+import requests
+
+import llm_client
+from llm_client import CircuitBreaker, CircuitOpenError, LLMClient
+
+
+def open_breaker(breaker: CircuitBreaker, half_open: bool = True):
+    """Разомкнуть цепь; half_open=True - cooldown уже прошёл"""
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    if half_open:
+        breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.acquire() is None
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_single_probe():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    open_breaker(breaker)
+    assert breaker.state == 'half_open'
+    probe = breaker.acquire()
+    assert probe
+    assert breaker.acquire() is None
+
+
+def test_probe_success_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    open_breaker(breaker)
+    probe = breaker.acquire()
+    breaker.record_success()
+    breaker.release(probe)
+    assert breaker.state == 'closed'
+    assert breaker.acquire() == 0
+
+
+def test_probe_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    open_breaker(breaker)
+    probe = breaker.acquire()
+    breaker.record_failure()
+    breaker.release(probe)
+    assert breaker.state == 'open'
+
+
+def test_released_probe_without_outcome_allows_next_probe():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    open_breaker(breaker)
+    probe = breaker.acquire()
+    breaker.release(probe)
+    assert breaker.state == 'half_open'
+    assert breaker.acquire()
+
+
+def test_stale_release_keeps_newer_probe():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    open_breaker(breaker)
+    first = breaker.acquire()
+    breaker.release(first)
+    second = breaker.acquire()
+    breaker.release(first)
+    assert breaker.acquire() is None
+    breaker.release(second)
+    assert breaker.acquire()
+
+
+def make_client(status: int) -> LLMClient:
+    """Клиент, session.post которого отвечает status без сети"""
+    client = LLMClient('test', 'http://llm.invalid/v1/chat/completions', None,
+                       retries=0, failure_threshold=2, cooldown=60)
+
+    def post(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = status
+        response._content = b'{"choices": []}'
+        response.url = client.url
+        return response
+
+    client.session.post = post
+    return client
+
+
+def test_chat_4xx_probe_closes_circuit():
+    client = make_client(400)
+    open_breaker(client.breaker)
+    with pytest.raises(requests.HTTPError):
+        client.chat({'messages': []})
+    assert client.breaker.state == 'closed'
+    with pytest.raises(requests.HTTPError):
+        client.chat({'messages': []})
+
+
+def test_chat_5xx_probe_reopens_circuit():
+    client = make_client(503)
+    open_breaker(client.breaker)
+    with pytest.raises(llm_client.RetryableError):
+        client.chat({'messages': []})
+    assert client.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.chat({'messages': []})
+
+
+def test_agent_overload_does_not_take_probe(monkeypatch):
+    from api.services import AgentService, AgentOverloadedError
+
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    monkeypatch.setitem(llm_client._breakers, 'openai', breaker)
+    open_breaker(breaker)
+
+    service = AgentService()
+    service.fast_path_enabled = False
+    service.queue_timeout = 0.01
+
+    async def overloaded():
+        service._slots = asyncio.Semaphore(0)
+        await service._answer("вопрос", "gpt-4o", "key")
+
+    with pytest.raises(AgentOverloadedError):
+        asyncio.run(overloaded())
+    assert breaker.acquire()
+
+
+def test_agent_request_error_releases_probe(monkeypatch):
+    from api.services import AgentService
+
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    monkeypatch.setitem(llm_client._breakers, 'openai', breaker)
+    open_breaker(breaker)
+
+    class FailingAgent:
+        async def arun_agent(self, query, api_key, model):
+            raise RuntimeError("bad request")
+
+    service = AgentService()
+    service.fast_path_enabled = False
+    service._agent = FailingAgent()
+
+    with pytest.raises(Exception):
+        asyncio.run(service._answer("вопрос", "gpt-4o", "key"))
+    assert breaker.state == 'half_open'
+    assert breaker.acquire()
+
+
+def test_stream_disconnect_releases_probe(monkeypatch):
+    from api.services import AgentService
+
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    monkeypatch.setitem(llm_client._breakers, 'openai', breaker)
+    open_breaker(breaker)
+
+    class StreamingAgent:
+        async def astream_agent(self, query, api_key, model):
+            for i in range(10):
+                yield {"type": "token", "content": str(i)}
+
+    service = AgentService()
+    service._agent = StreamingAgent()
+
+    async def disconnect():
+        stream = service.astream("вопрос", "gpt-4o")
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(disconnect())
+    assert breaker.acquire()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
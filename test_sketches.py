@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Тесты скетчей различных значений (sketches.py) против pandas nunique()
+
+    python -m pytest -q test_sketches.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import DistinctSketch, group_sketches, merge_group_sketches
+
+
+def sketch_counts(groups: pd.Series, values: pd.Series, **kwargs) -> dict:
+    sketches = group_sketches(groups, values, **kwargs)
+    return {key: sketches[key].count() if key in sketches else 0 for key in groups.dropna().unique()}
+
+
+def test_missing_values_not_counted():
+    df = pd.DataFrame({
+        'group': ['a', 'a', 'a', 'b', 'b'],
+        'value': ['x', np.nan, 'y', None, np.nan]
+    })
+    assert sketch_counts(df['group'], df['value']) == {'a': 2, 'b': 0}
+    assert DistinctSketch.from_values(['x', None, float('nan'), 'x']).count() == 1
+
+
+def test_exact_below_threshold_matches_nunique():
+    rng = np.random.default_rng(0)
+    size = 20_000
+    values = pd.Series(rng.integers(0, 500, size).astype(str), dtype=object)
+    values[rng.random(size) < 0.1] = np.nan
+    df = pd.DataFrame({'group': rng.choice(['a', 'b', 'c', 'd'], size), 'value': values})
+
+    expected = df.groupby('group')['value'].nunique().to_dict()
+    assert sketch_counts(df['group'], df['value']) == expected
+
+
+def test_hll_above_threshold_within_tolerance():
+    rng = np.random.default_rng(1)
+    size = 200_000
+    df = pd.DataFrame({
+        'group': rng.choice(['a', 'b'], size),
+        'value': pd.Series(rng.integers(0, 50_000, size), dtype=object)
+    })
+    df.loc[rng.random(size) < 0.05, 'value'] = None
+
+    expected = df.groupby('group')['value'].nunique().to_dict()
+    counts = sketch_counts(df['group'], df['value'], threshold=1000)
+    for key, exact in expected.items():
+        assert counts[key] == pytest.approx(exact, rel=0.03)
+
+
+def test_merge_matches_single_pass():
+    rng = np.random.default_rng(2)
+    size = 30_000
+    df = pd.DataFrame({
+        'group': rng.choice(['a', 'b', 'c'], size),
+        'value': pd.Series(rng.integers(0, 3000, size), dtype=object)
+    })
+    df.loc[rng.random(size) < 0.1, 'value'] = np.nan
+
+    merged = {}
+    for start in range(0, size, size // 4):
+        part = df.iloc[start:start + size // 4]
+        merge_group_sketches(merged, group_sketches(part['group'], part['value']))
+    expected = df.groupby('group')['value'].nunique().to_dict()
+    assert {key: sketch.count() for key, sketch in merged.items()} == expected
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))
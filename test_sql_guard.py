@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Тесты переписывания LIMIT в sql_guard (запрос должен остаться валидным)
+
+    python -m pytest -q test_sql_guard.py
+"""
+
+import duckdb
+import pytest
+
+from sql_guard import get_outer_limit, guard_query_static, set_limit
+
+
+@pytest.fixture(scope='module')
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE t AS SELECT range AS x, 'a--b' AS s FROM range(1000)")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('sql, rows', [
+    ("SELECT * FROM t ORDER BY x FETCH FIRST 5 ROWS ONLY", 5),
+    ("SELECT * FROM t -- все строки", 100),
+    ("SELECT * FROM t /* комментарий */ ;  -- ещё\n", 100),
+    ("-- заголовок\nSELECT s, x FROM t WHERE s = 'a--b' ORDER BY x", 100),
+    ("SELECT * FROM t LIMIT 7 OFFSET 3 -- note", 7),
+])
+def test_guarded_query_is_valid(conn, sql, rows):
+    guarded, info = guard_query_static(sql)
+    assert info['decision'] != 'rejected'
+    assert len(conn.execute(guarded).fetchall()) == rows
+
+
+def test_fetch_first_is_outer_limit():
+    sql = "SELECT * FROM t FETCH FIRST 500000 ROWS ONLY"
+    assert get_outer_limit(sql) == 500000
+    assert set_limit(sql, 100) == "SELECT * FROM t FETCH FIRST 100 ROWS ONLY"
+
+
+def test_comment_marker_inside_literal_kept():
+    guarded, _ = guard_query_static("SELECT * FROM t WHERE s = 'a--b'")
+    assert guarded == "SELECT * FROM t WHERE s = 'a--b' LIMIT 100"
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main(['-q', __file__]))